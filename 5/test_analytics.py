@@ -0,0 +1,83 @@
+import pytest
+import shutil
+from dataclasses import replace
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from uuid import uuid4
+
+from archive import archive_orders
+from exporters import export
+from models import MenuItem, Order, OrderItem, OrderStatus, Sweetness, Topping
+from repositories import OrderRepository, flush_pending_writes
+
+pytest.importorskip("numpy")
+from analytics import SalesAnalytics  # noqa: E402  pylint: disable=wrong-import-position
+
+@pytest.fixture
+def order_repo():
+    """清理订单数据，返回新的订单仓储"""
+    flush_pending_writes()
+    data_dir = Path(__file__).parent.parent / 'data'
+    for dirname in ['orders', 'archive']:
+        shutil.rmtree(data_dir / dirname, ignore_errors=True)
+    return OrderRepository()
+
+def make_order(hour, lines, discount="0.00"):
+    """构造指定时刻下单的订单"""
+    return Order(user_id=uuid4(), created_at=datetime(2024, 6, 3, hour, 15),
+                 items=lines, discount=Decimal(discount))
+
+class TestSalesAnalytics:
+    """销售分析单元测试"""
+
+    def test_aggregations_and_incremental_refresh(self, order_repo):
+        milk_tea = MenuItem(name="珍珠奶茶", price=Decimal("15.00"))
+        lemon = MenuItem(name="柠檬茶", price=Decimal("10.00"))
+        pearl = Topping(name="珍珠", extra_price=Decimal("2.00"))
+        order_repo.save(make_order(9, [
+            OrderItem(menu_item=milk_tea, quantity=2, toppings=[pearl]),
+            OrderItem(menu_item=lemon, sweetness=Sweetness.NONE)], discount="3.00"))
+        order_repo.save(make_order(14, [OrderItem(menu_item=lemon, quantity=3)]))
+
+        analytics = SalesAnalytics(order_repo)
+        assert analytics.revenue() == Decimal("71.00")
+        by_hour = analytics.revenue_by_hour()
+        assert by_hour[9] == Decimal("41.00")
+        assert by_hour[14] == Decimal("30.00")
+        assert analytics.orders_by_hour()[9] == 1
+        assert analytics.top_items(1) == [("柠檬茶", 4, Decimal("40.00"))]
+        assert analytics.top_items(1, by_revenue=True)[0][0] == "柠檬茶"
+        assert analytics.topping_attach_rate() == {"珍珠": 2 / 6}
+        assert analytics.sweetness_distribution()[Sweetness.NONE] == 1
+
+        # 新订单追加，取消的订单不再计入
+        late = order_repo.save(make_order(20, [OrderItem(menu_item=milk_tea)]))
+        assert analytics.refresh() == 1
+        assert len(analytics) == 4
+        order = order_repo.find_by_id(late.order_id)
+        order_repo.save(replace(order, status=OrderStatus.CANCELLED))
+        assert analytics.refresh() == 0
+        assert analytics.order_count() == 2
+        assert analytics.revenue(start=datetime(2024, 6, 3, 12)) == Decimal("30.00")
+
+    def test_archived_orders_still_counted_and_exported(self, order_repo, tmp_path):
+        lemon = MenuItem(name="柠檬茶", price=Decimal("10.00"))
+        done = order_repo.save(replace(make_order(9, [OrderItem(menu_item=lemon, quantity=2)]),
+                                       status=OrderStatus.COMPLETED))
+        order_repo.save(make_order(10, [OrderItem(menu_item=lemon)]))
+        analytics = SalesAnalytics(order_repo)
+        assert analytics.revenue() == Decimal("30.00")
+
+        result = archive_orders(order_repo, older_than=timedelta(days=90), now=datetime(2024, 12, 1))
+        assert result.archived == 1 and order_repo.find_by_id(done.order_id) is None
+        # 已同步的引擎和新建的引擎都继续计入归档订单
+        analytics.refresh()
+        assert analytics.revenue() == Decimal("30.00")
+        assert analytics.top_items(1) == [("柠檬茶", 3, Decimal("30.00"))]
+        assert SalesAnalytics(order_repo).revenue() == Decimal("30.00")
+
+        output = tmp_path / 'orders.csv'
+        rows = export('orders', str(output), start=datetime(2024, 6, 3), end=datetime(2024, 6, 4))
+        assert rows == 2
+        assert str(done.order_id) in output.read_text(encoding='utf-8')
@@ -0,0 +1,124 @@
+import asyncio
+import pytest
+import shutil
+from pathlib import Path
+from uuid import uuid4
+
+from api_server import ApiServer
+from api_load_test import HttpClient
+from repositories import flush_pending_writes
+
+@pytest.fixture
+def clean_data_dir():
+    """清理测试数据目录"""
+    # 先等待后台写盘线程完成，避免旧数据在删除后被重新写入
+    flush_pending_writes()
+    data_dir = Path(__file__).parent.parent / 'data'
+    for filename in ['users.json', 'menu_items.json', 'carts.json', 'orders.json', 'toppings.json', 'promotions.json', 'sales_rollups.json']:
+        filepath = data_dir / filename
+        if filepath.exists():
+            filepath.unlink()
+    for dirname in ['orders', 'archive']:
+        shutil.rmtree(data_dir / dirname, ignore_errors=True)
+    yield
+
+def run_with_server(scenario):
+    """启动临时 API 服务并执行客户端场景"""
+    async def runner():
+        server = ApiServer(port=0)
+        await server.start()
+        client = HttpClient(server.host, server.port)
+        try:
+            return await scenario(client)
+        finally:
+            await client.close()
+            await server.close()
+    return asyncio.run(runner())
+
+class TestApiServer:
+    """HTTP API 集成测试"""
+
+    def test_order_flow_over_keep_alive(self, clean_data_dir):
+        async def scenario(client):
+            status, resp = await client.request('POST', '/api/menu/items',
+                                                {'name': "珍珠奶茶", 'price': "15.00"})
+            assert status == 201
+            item_id = resp['data']['item_id']
+
+            status, resp = await client.request('POST', '/api/auth/register',
+                                                {'nickname': "张三", 'phone': "13800138000"})
+            assert status == 200
+            user_id = resp['data']['result']['user_id']
+
+            status, resp = await client.request('POST', f'/api/carts/{user_id}/items',
+                                                {'item_id': item_id, 'quantity': 2, 'sweetness': 'FULL'})
+            assert status == 200
+            assert resp['data']['result']['total'] == "30.00"
+
+            status, resp = await client.request('POST', '/api/orders', {'user_id': user_id})
+            assert status == 201
+            order_id = resp['data']['result']['order_id']
+
+            status, resp = await client.request('POST', f'/api/orders/{order_id}/status', {'status': 'READY'})
+            assert status == 200
+
+            status, resp = await client.request('GET', f'/api/orders/{order_id}')
+            assert resp['data']['status'] == "待取餐"
+            assert resp['data']['total_amount'] == "30.00"
+
+            # 同一条连接上完成全部请求
+            assert client.writer is not None
+
+        run_with_server(scenario)
+
+    def test_cart_reads_do_not_create_carts(self, clean_data_dir):
+        async def scenario(client):
+            status, resp = await client.request('POST', '/api/menu/items',
+                                                {'name': "柠檬茶", 'price': "10.00"})
+            item_id = resp['data']['item_id']
+            user_id = str(uuid4())
+
+            status, resp = await client.request('GET', f'/api/carts/{user_id}')
+            assert status == 200
+            assert resp['data']['cart_id'] is None and resp['data']['items'] == []
+
+            status, resp = await client.request('POST', f'/api/carts/{user_id}/items', {'item_id': item_id})
+            line_id = resp['data']['result']['items'][0]['order_item_id']
+            status, resp = await client.request('DELETE', f'/api/carts/{user_id}/items/{line_id}')
+            assert status == 200
+            assert resp['data']['cart_id'] is None and resp['data']['total'] == "0.00"
+
+            # 移除最后一件后购物车已删除，再次读取也不会创建
+            status, resp = await client.request('GET', f'/api/carts/{user_id}')
+            assert resp['data']['cart_id'] is None
+            status, resp = await client.request('DELETE', f'/api/carts/{user_id}/items/{line_id}')
+            assert status == 404
+
+        run_with_server(scenario)
+
+    def test_error_responses(self, clean_data_dir):
+        async def scenario(client):
+            status, resp = await client.request('GET', '/api/nothing')
+            assert status == 404
+            assert resp['ok'] is False
+
+            status, _ = await client.request('PUT', '/api/menu/items')
+            assert status == 405
+
+            status, _ = await client.request('GET', '/api/orders/not-a-uuid')
+            assert status == 400
+
+            status, _ = await client.request('POST', '/api/menu/items', {'name': "负价", 'price': "-1"})
+            assert status == 400
+
+            status, resp = await client.request('POST', '/api/menu/items', {'name': "乌龙", 'price': "10"})
+            assert status == 201
+            path = f"/api/menu/items/{resp['data']['item_id']}"
+            for body in ({'allow_toppings': "false"}, {'name': 5}, {'category': ["茶饮"]}):
+                status, _ = await client.request('PATCH', path, body)
+                assert status == 400
+            status, resp = await client.request('GET', path)
+            assert resp['data']['name'] == "乌龙"
+            assert resp['data']['allow_toppings'] is True
+
+        run_with_server(scenario)
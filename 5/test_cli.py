@@ -0,0 +1,105 @@
+import ast
+import shutil
+import subprocess
+import sys
+import pytest
+from pathlib import Path
+
+import cli
+import main
+from app_services import AppServices
+from models import OrderStatus
+from repositories import flush_pending_writes
+from services import AuthService, OrderService
+
+ROOT = Path(__file__).parent.parent
+
+@pytest.fixture
+def clean_data_dir():
+    """清理测试数据目录"""
+    flush_pending_writes()
+    data_dir = ROOT / 'data'
+    for filename in ['users.json', 'menu_items.json', 'carts.json', 'orders.json', 'toppings.json', 'promotions.json', 'sales_rollups.json', 'pickup_codes.json']:
+        filepath = data_dir / filename
+        if filepath.exists():
+            filepath.unlink()
+    for dirname in ['orders', 'archive']:
+        shutil.rmtree(data_dir / dirname, ignore_errors=True)
+    yield data_dir
+
+class TestCli:
+    """命令行工具测试"""
+
+    def test_batch_places_and_advances_order(self, clean_data_dir, tmp_path, capsys):
+        AuthService().register("小明", "13800000000")
+        batch = tmp_path / 'commands.txt'
+        batch.write_text("\n".join([
+            "# 准备菜单",
+            "menu add 四季春 12.00 --category 纯茶",
+            "menu add 珍珠奶茶 15 --category 奶茶",
+            "order place --phone 13800000000 '四季春*2' 珍珠奶茶 --sweetness 三分糖 --key k1",
+            "order place --phone 13800000000 '四季春*2' 珍珠奶茶 --key k1",
+            "order place --phone 13800000000 不存在的奶茶",
+            "order status 001 制作中",
+            "order status 001 ready",
+        ]), encoding='utf-8')
+
+        assert cli.main(['batch', str(batch)]) == 1
+        err = capsys.readouterr().err
+        assert "第 6 行: 商品不存在: 不存在的奶茶" in err
+        assert "执行 7 条命令，失败 1 条" in err
+
+        flush_pending_writes()
+        orders = OrderService().list_orders()
+        assert len(orders) == 1
+        assert orders[0].status == OrderStatus.READY
+        assert str(orders[0].total_amount()) == "39.00"
+        assert {line.sweetness.value for line in orders[0].items} == {"三分糖"}
+
+    def test_errors_and_health(self, clean_data_dir, capsys):
+        assert cli.main(['menu', 'price', '不存在', '10']) == 1
+        assert "错误: 商品不存在" in capsys.readouterr().err
+        assert cli.main(['order', 'status', '001', '做好了']) == 1
+
+        assert cli.main(['menu', 'add', '四季春', '12']) == 0
+        assert cli.main(['health', '--deep']) == 0
+        out = capsys.readouterr().out
+        assert "OK   menu_items.json: 1 条" in out
+        assert "FAIL" not in out
+
+        (clean_data_dir / 'menu_items.json').write_text("{", encoding='utf-8')
+        assert cli.main(['health']) == 1
+        assert "FAIL menu_items.json" in capsys.readouterr().out
+
+def loaded_modules(script: str) -> list:
+    """在新进程中执行脚本，返回其中已导入的服务层和界面模块"""
+    script += ("\nimport sys\nprint(sorted(m for m in ('tkinter', 'services', 'repositories',"
+               " 'gui_admin', 'gui_customer') if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    return ast.literal_eval(result.stdout.strip().splitlines()[-1])
+
+class TestStartup:
+    """启动阶段的延迟加载"""
+
+    def test_entry_points_import_no_services(self):
+        assert loaded_modules("import sys, runpy; sys.argv = ['cli.py', '--help']\n"
+                              "try:\n    runpy.run_path('cli.py', run_name='__main__')\n"
+                              "except SystemExit:\n    pass") == []
+        assert loaded_modules("import main") == ['tkinter']
+
+    def test_preloader_shares_services(self, clean_data_dir):
+        preloader = main.Preloader()
+        preloader.start()
+        preloader.start()
+        assert preloader.done.wait(timeout=60)
+        assert preloader.error is None
+        services = preloader.services
+        assert services.cart_service.item_repo is services.menu_service.item_repo
+        assert services.order_service.cart_service is services.cart_service
+        assert services.order_service.promotion_service is services.promotion_service
+
+        # 未预先加载时按需创建
+        lazy = AppServices()
+        assert 'menu_service' not in vars(lazy)
+        assert lazy.menu_service is lazy.menu_service
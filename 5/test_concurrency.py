@@ -0,0 +1,262 @@
+import json
+import shutil
+import subprocess
+import sys
+import threading
+import pytest
+from decimal import Decimal
+from pathlib import Path
+from uuid import uuid4
+
+from cart_store import SessionCartStore
+from models import OrderStatus, Sweetness
+from repositories import (
+    MenuItemRepository, ToppingRepository, OrderRepository,
+    VersionConflictError, flush_pending_writes
+)
+from services import MenuService, CartService, OrderService, ReviewService
+
+THREADS = 16
+ROUNDS = 20
+
+@pytest.fixture
+def clean_data_dir():
+    """清理测试数据目录"""
+    flush_pending_writes()
+    data_dir = Path(__file__).parent.parent / 'data'
+    for filename in ['menu_items.json', 'carts.json', 'orders.json', 'toppings.json', 'promotions.json', 'sales_rollups.json', 'reviews.json']:
+        filepath = data_dir / filename
+        if filepath.exists():
+            filepath.unlink()
+    for dirname in ['orders', 'archive']:
+        shutil.rmtree(data_dir / dirname, ignore_errors=True)
+    yield data_dir
+
+def run_threads(target, count):
+    """同时启动 count 个线程执行 target(index)，收集异常"""
+    errors = []
+    barrier = threading.Barrier(count)
+
+    def wrapper(index):
+        try:
+            barrier.wait()
+            target(index)
+        except Exception as e:  # pylint: disable=broad-except
+            errors.append(e)
+
+    threads = [threading.Thread(target=wrapper, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors, errors
+
+class TestConcurrentServices:
+    """多线程压力测试：共享仓储上的并发加购与下单"""
+
+    @pytest.fixture
+    def services(self, clean_data_dir):
+        item_repo = MenuItemRepository()
+        topping_repo = ToppingRepository()
+        menu_service = MenuService(item_repo=item_repo, topping_repo=topping_repo)
+        cart_service = CartService(SessionCartStore(), item_repo, topping_repo)
+        order_service = OrderService(OrderRepository(), cart_service)
+        item = menu_service.create_item("珍珠奶茶", Decimal("15.00"))
+        topping = menu_service.create_topping("珍珠", Decimal("2.00"))
+        return cart_service, order_service, item, topping
+
+    def test_add_to_cart_and_place_order(self, services, clean_data_dir, capsys):
+        cart_service, order_service, item, topping = services
+        # 每两个线程共享一个用户，制造同一购物车上的加购/下单竞争
+        users = [uuid4() for _ in range(THREADS // 2)]
+        placed = []
+
+        def hammer(index):
+            user_id = users[index % len(users)]
+            for i in range(ROUNDS):
+                success, _ = cart_service.add_to_cart(
+                    user_id, item.item_id, quantity=1,
+                    sweetness=Sweetness.FULL, topping_ids=[topping.topping_id])
+                assert success
+                if i % 5 == 4:
+                    success, _, order = order_service.place_order(user_id)
+                    if success:
+                        placed.append(order)
+
+        run_threads(hammer, THREADS)
+        capsys.readouterr()
+
+        # 剩余购物车一并下单，所有加购的商品都应恰好进入一个订单
+        for user_id in users:
+            success, _, order = order_service.place_order(user_id)
+            if success:
+                placed.append(order)
+
+        # 相同配置合并为一行，按数量核对
+        lines = [line for order in placed for line in order.items]
+        assert sum(line.quantity for line in lines) == THREADS * ROUNDS
+        assert len({line.order_item_id for line in lines}) == len(lines)
+        # 下单后的空购物车都已删除
+        for user_id in users:
+            assert cart_service.get_cart(user_id) is None
+        assert cart_service.cart_store.find_all() == []
+        # 用户锁在释放后移除，不随见过的用户数增长
+        assert len(cart_service.user_lock) == 0
+
+        # 落盘数据完整且与内存一致
+        flush_pending_writes()
+        stored = 0
+        for partition in (clean_data_dir / 'orders').glob('????-??-??.json'):
+            with open(partition, encoding='utf-8') as f:
+                stored += len(json.load(f))
+        assert stored == len(placed)
+        reloaded = OrderRepository()
+        assert sum(o.total_amount() for o in reloaded.find_all()) == Decimal("17.00") * THREADS * ROUNDS
+
+    def test_concurrent_saves_keep_file_consistent(self, clean_data_dir):
+        repo = MenuItemRepository()
+        menu_service = MenuService(item_repo=repo)
+
+        def create(index):
+            for i in range(ROUNDS):
+                menu_service.create_item(f"奶茶{index}-{i}", Decimal("10.00"))
+
+        run_threads(create, THREADS)
+        assert len(repo.find_all()) == THREADS * ROUNDS
+
+        repo.flush()
+        with open(clean_data_dir / 'menu_items.json', encoding='utf-8') as f:
+            assert len(json.load(f)) == THREADS * ROUNDS
+
+class TestOptimisticConcurrency:
+    """乐观锁：版本号与比较并交换"""
+
+    def test_stale_update_item_conflicts(self, clean_data_dir):
+        menu_service = MenuService()
+        item = menu_service.create_item("四季春", Decimal("12.00"))
+        assert item.version == 1
+
+        loaded_version = menu_service.get_item(item.item_id).version
+        updated = menu_service.update_item(item.item_id, price=Decimal("13.00"),
+                                           expected_version=loaded_version)
+        assert updated.version == 2
+
+        with pytest.raises(VersionConflictError):
+            menu_service.update_item(item.item_id, name="旧名称", expected_version=loaded_version)
+        current = menu_service.get_item(item.item_id)
+        assert current.name == "四季春"
+        assert current.price == Decimal("13.00")
+
+    def test_racing_writers_only_one_wins(self, clean_data_dir):
+        menu_service = MenuService()
+        item = menu_service.create_item("波霸奶茶", Decimal("16.00"))
+        winners, conflicts = [], []
+
+        def edit(index):
+            try:
+                menu_service.update_item(item.item_id, name=f"终端{index}",
+                                         expected_version=item.version)
+                winners.append(index)
+            except VersionConflictError:
+                conflicts.append(index)
+
+        run_threads(edit, THREADS)
+        assert len(winners) == 1
+        assert len(conflicts) == THREADS - 1
+        assert menu_service.get_item(item.item_id).name == f"终端{winners[0]}"
+
+    def test_stale_update_status_rejected(self, clean_data_dir, capsys):
+        menu_service = MenuService()
+        item = menu_service.create_item("椰果奶茶", Decimal("10.00"))
+        order_service = OrderService()
+        user_id = uuid4()
+        order_service.cart_service.add_to_cart(user_id, item.item_id)
+        _, _, order = order_service.place_order(user_id)
+        seen_version = order.version
+
+        success, _ = order_service.update_status(order.order_id, OrderStatus.PREPARING, seen_version)
+        assert success is True
+        success, msg = order_service.update_status(order.order_id, OrderStatus.CANCELLED, seen_version)
+        assert success is False
+        assert "其他终端" in msg
+        assert order_service.get_order(order.order_id).status == OrderStatus.PREPARING
+
+    def test_stale_reply_review_rejected(self, clean_data_dir):
+        review_service = ReviewService()
+        _, _, review = review_service.create_review(uuid4(), uuid4(), 4, "有点甜")
+        seen_version = review.version
+
+        success, _ = review_service.reply_review(review.review_id, "已反馈给门店", seen_version)
+        assert success is True
+        success, msg = review_service.reply_review(review.review_id, "下次少糖", seen_version)
+        assert success is False
+        assert "其他终端" in msg
+        current = review_service.review_repo.find_by_id(review.review_id)
+        assert current.reply == "已反馈给门店"
+        assert current.version == seen_version + 1
+
+WORKER_SCRIPT = """
+import sys
+from decimal import Decimal
+from services import MenuService
+service = MenuService()
+for i in range(int(sys.argv[2])):
+    service.create_item(f"进程{sys.argv[1]}-{i}", Decimal("9.00"))
+"""
+
+class TestMultiProcess:
+    """多进程共享数据目录"""
+
+    def test_processes_do_not_overwrite_each_other(self, clean_data_dir):
+        repo = MenuItemRepository()
+        menu_service = MenuService(item_repo=repo)
+        local = menu_service.create_item("本进程奶茶", Decimal("11.00"))
+        repo.flush()
+
+        root = Path(__file__).parent.parent
+        procs = [
+            subprocess.Popen([sys.executable, '-c', WORKER_SCRIPT, str(i), str(ROUNDS)], cwd=root)
+            for i in range(4)
+        ]
+        for proc in procs:
+            assert proc.wait(timeout=60) == 0
+
+        # 读取前检测到文件变更，合并其他进程写入的记录
+        items = repo.find_all()
+        assert len(items) == 4 * ROUNDS + 1
+        # 版本号未变化的记录沿用原内存对象
+        assert repo.find_by_id(local.item_id) is local
+
+        # 其他进程修改后，本进程持有的旧版本无法覆盖
+        other = next(i for i in items if i.name == "进程0-0")
+        subprocess.run([sys.executable, '-c', (
+            "from uuid import UUID; from services import MenuService; "
+            f"MenuService().update_item(UUID('{other.item_id}'), name='已改名'); "
+            "from repositories import flush_pending_writes; flush_pending_writes()"
+        )], cwd=root, check=True)
+        with pytest.raises(VersionConflictError):
+            menu_service.update_item(other.item_id, name="覆盖", expected_version=other.version)
+        assert repo.find_by_id(other.item_id).name == "已改名"
+
+    def test_concurrent_edit_across_processes_is_not_lost(self, clean_data_dir):
+        repo = MenuItemRepository()
+        menu_service = MenuService(item_repo=repo)
+        item = menu_service.create_item("四季春", Decimal("12.00"))
+        repo.flush()
+
+        # 两个进程都基于版本 1 修改；本进程的修改尚未写盘时另一进程先写盘
+        with repo.deferred_writes():
+            local = menu_service.update_item(item.item_id, name="本进程修改")
+            assert local.version == 2
+            subprocess.run([sys.executable, '-c', (
+                "from uuid import UUID; from services import MenuService; "
+                f"MenuService().update_item(UUID('{item.item_id}'), name='其他进程修改'); "
+                "from repositories import flush_pending_writes; flush_pending_writes()"
+            )], cwd=Path(__file__).parent.parent, check=True)
+        repo.flush()
+
+        # 先写盘者胜出，本进程的修改记为冲突而不是覆盖对方
+        assert item.item_id in repo.conflicts
+        assert repo.find_by_id(item.item_id).name == "其他进程修改"
+        with open(clean_data_dir / 'menu_items.json', encoding='utf-8') as f:
+            assert [record['name'] for record in json.load(f)] == ["其他进程修改"]
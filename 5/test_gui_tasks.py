@@ -0,0 +1,112 @@
+import threading
+import time
+
+from gui_tasks import TaskRunner
+
+class FakeRoot:
+    """只实现 TaskRunner 用到的窗口接口，after 回调由测试在当前线程中执行"""
+
+    def __init__(self):
+        self.callbacks = []
+        self.cursor = ''
+        self.destroy_handler = None
+
+    def after(self, delay, func, *args):
+        self.callbacks.append((func, args))
+
+    def bind(self, sequence, func, add=None):
+        self.destroy_handler = func
+
+    def config(self, **options):
+        self.cursor = options.get('cursor', self.cursor)
+
+    def run_until(self, condition, timeout=5.0):
+        """模拟主循环：执行已到期的 after 回调，直到条件满足"""
+        deadline = time.monotonic() + timeout
+        while not condition():
+            assert time.monotonic() < deadline, "等待超时"
+            callbacks, self.callbacks = self.callbacks, []
+            for func, args in callbacks:
+                func(*args)
+            time.sleep(0.001)
+
+class FakeLabel:
+    def __init__(self):
+        self.text = ""
+
+    def config(self, text):
+        self.text = text
+
+class TestTaskRunner:
+    """界面后台任务执行器"""
+
+    def test_tasks_run_in_order_off_the_ui_thread(self):
+        root, label = FakeRoot(), FakeLabel()
+        runner = TaskRunner(root, label)
+        ui_thread = threading.get_ident()
+        gate = threading.Event()
+        worker_threads, results = [], []
+
+        def task(value):
+            gate.wait(5)
+            worker_threads.append(threading.get_ident())
+            return value
+
+        def done(value):
+            assert threading.get_ident() == ui_thread
+            results.append(value)
+
+        for i in range(5):
+            runner.submit(task, i, on_done=done)
+        # 工作线程阻塞时界面线程照常运行，并显示忙碌指示
+        assert runner.busy and label.text and root.cursor == 'watch'
+        assert results == []
+
+        gate.set()
+        root.run_until(lambda: not runner.busy)
+        assert results == [0, 1, 2, 3, 4]
+        assert ui_thread not in worker_threads
+        assert label.text == "" and root.cursor == ''
+
+    def test_errors_and_close(self):
+        root = FakeRoot()
+        runner = TaskRunner(root)
+        errors = []
+        runner.submit(lambda: 1 / 0, on_done=errors.append, on_error=errors.append)
+        root.run_until(lambda: not runner.busy)
+        assert len(errors) == 1 and isinstance(errors[0], ZeroDivisionError)
+
+        # 窗口关闭后不再回调
+        gate = threading.Event()
+        called = []
+        runner.submit(gate.wait, 5, on_done=called.append)
+        runner.close()
+        gate.set()
+        time.sleep(0.05)
+        for func, args in root.callbacks:
+            func(*args)
+        assert called == []
+        assert runner.submit(lambda: None) is None
+
+    def test_post_from_other_thread(self):
+        root = FakeRoot()
+        runner = TaskRunner(root)
+        ui_thread = threading.get_ident()
+        received = []
+
+        def show(value):
+            assert threading.get_ident() == ui_thread
+            received.append(value)
+
+        poster = threading.Thread(target=runner.post, args=(show, "促销"))
+        poster.start()
+        poster.join()
+        # 其他线程只入队，不调用窗口
+        assert received == []
+        root.run_until(lambda: received == ["促销"])
+
+        runner.close()
+        runner.post(show, "关闭后")
+        for func, args in root.callbacks:
+            func(*args)
+        assert received == ["促销"]
@@ -1,19 +1,33 @@
 import pytest
+import os
+import shutil
+from datetime import datetime, timedelta
 from decimal import Decimal
 from uuid import uuid4
 from pathlib import Path
 
-from services import AuthService, MenuService, CartService, OrderService
-from models import OrderStatus, Sweetness
+from services import AuthService, MenuService, CartService, OrderService, PromotionService, ReviewService, IdempotencyIndex
+from models import Order, OrderStatus, PromotionRule, RuleType, Sweetness
+from repositories import MenuItemRepository, OrderRepository, SalesRollupStore, flush_pending_writes, snapshot_cache
+from dashboard import DashboardStats
+import csv
+import gzip
+import json
+import exporters
+import importers
 
 @pytest.fixture
 def clean_data_dir():
     """清理测试数据目录"""
+    # 先等待后台写盘线程完成，避免旧数据在删除后被重新写入
+    flush_pending_writes()
     data_dir = Path(__file__).parent.parent / 'data'
-    for filename in ['users.json', 'menu_items.json', 'carts.json', 'orders.json', 'toppings.json']:
+    for filename in ['users.json', 'menu_items.json', 'carts.json', 'orders.json', 'toppings.json', 'promotions.json', 'sales_rollups.json']:
         filepath = data_dir / filename
         if filepath.exists():
             filepath.unlink()
+    for dirname in ['orders', 'archive']:
+        shutil.rmtree(data_dir / dirname, ignore_errors=True)
     yield
 
 class TestSystemIntegration:
@@ -59,7 +73,7 @@ class TestSystemIntegration:
         assert order.total_amount() == Decimal("50.00")
         
         # 验证购物车已清空
-        assert len(order_service.cart_service.get_cart(user_id).items) == 0
+        assert order_service.cart_service.get_cart(user_id) is None
 
         # 5. 管理员更新订单状态
         success, msg = order_service.update_status(order.order_id, OrderStatus.PREPARING)
@@ -99,3 +113,429 @@ class TestSystemIntegration:
         cart = cart_service.get_cart(user_id)
         assert cart is None or len(cart.items) == 0
 
+
+    def test_idempotent_place_order(self, clean_data_dir):
+        """
+        测试用例 3: 重复提交同一幂等键只生成一个订单
+        """
+        menu_service = MenuService()
+        item = menu_service.create_item("杨枝甘露", Decimal("18.00"))
+        order_service = OrderService()
+        user_id = uuid4()
+        order_service.cart_service.add_to_cart(user_id, item.item_id, quantity=2)
+
+        success, _, order = order_service.place_order(user_id, idempotency_key="checkout-1")
+        assert success is True
+        # 重试：购物车已清空，但仍返回首次创建的订单
+        success, _, retried = order_service.place_order(user_id, idempotency_key="checkout-1")
+        assert success is True
+        assert retried.order_id == order.order_id
+        assert len(order_service.list_orders(user_id)) == 1
+
+        # 同一个键对其他用户无效
+        success, _, _ = order_service.place_order(uuid4(), idempotency_key="checkout-1")
+        assert success is False
+
+    def test_idempotency_index_bounded_and_expiring(self):
+        index = IdempotencyIndex(ttl_seconds=60, max_size=3)
+        keys = [uuid4() for _ in range(4)]
+        for i, key in enumerate(keys):
+            index.put(f"k{i}", key)
+        assert len(index) == 3
+        assert index.get("k0") is None
+        assert index.get("k3") == keys[3]
+
+        expired = IdempotencyIndex(ttl_seconds=0)
+        expired.put("k", keys[0])
+        assert expired.get("k") is None
+
+    def test_pickup_code_lookup(self, clean_data_dir):
+        """
+        测试用例 4: 取餐码按天递增且唯一，可按取餐码或订单号前缀查找
+        """
+        menu_service = MenuService()
+        item = menu_service.create_item("芋泥波波", Decimal("17.00"))
+        order_service = OrderService()
+        orders = []
+        for _ in range(3):
+            user_id = uuid4()
+            order_service.cart_service.add_to_cart(user_id, item.item_id)
+            _, msg, order = order_service.place_order(user_id)
+            assert order.pickup_code in msg
+            orders.append(order)
+
+        codes = [int(order.pickup_code) for order in orders]
+        assert codes == list(range(codes[0], codes[0] + 3))
+
+        target = orders[1]
+        assert order_service.find_by_code(target.pickup_code) == [target]
+        prefix = str(target.order_id)[:8]
+        assert target in order_service.find_by_code(prefix)
+        assert order_service.find_by_code(str(target.order_id)) == [target]
+
+        # 状态更新后取餐码不变，索引指向最新的订单对象
+        order_service.update_status(target.order_id, OrderStatus.READY)
+        found = order_service.find_by_code(target.pickup_code)[0]
+        assert found.status == OrderStatus.READY
+        assert found.pickup_code == target.pickup_code
+
+    def test_place_order_applies_promotions(self, clean_data_dir, capsys):
+        """
+        测试用例 5: 下单时按生效促销计价并记录优惠
+        """
+        menu_service = MenuService()
+        tea = menu_service.create_item("四季春", Decimal("12.00"), "茶饮")
+        milk_tea = menu_service.create_item("波霸奶茶", Decimal("16.00"), "经典")
+        red_bean = menu_service.create_topping("红豆", Decimal("3.00"))
+
+        promotion_service = PromotionService()
+        now = datetime.now()
+        promotion_service.create_promotion(
+            "茶饮八折", "", now - timedelta(days=1), now + timedelta(days=1),
+            rules=[PromotionRule(RuleType.CATEGORY_PERCENT, category="茶饮", percent_off=Decimal("20"))])
+        promotion_service.create_promotion(
+            "周末狂欢", "", now - timedelta(days=1), now + timedelta(days=1),
+            rules=[PromotionRule(RuleType.BUY_N_GET_M, item_id=milk_tea.item_id,
+                                 buy_quantity=2, free_quantity=1),
+                   PromotionRule(RuleType.FREE_TOPPING, threshold=Decimal("50"))])
+        # 已过期的促销不参与计价
+        promotion_service.create_promotion(
+            "往期五折", "", now - timedelta(days=10), now - timedelta(days=9),
+            rules=[PromotionRule(RuleType.CATEGORY_PERCENT, percent_off=Decimal("50"))])
+
+        order_service = OrderService(promotion_service=promotion_service)
+        user_id = uuid4()
+        order_service.cart_service.add_to_cart(user_id, tea.item_id, quantity=2,
+                                               topping_ids=[red_bean.topping_id])
+        order_service.cart_service.add_to_cart(user_id, milk_tea.item_id, quantity=3)
+
+        quote = promotion_service.quote(order_service.cart_service.get_cart(user_id).items)
+        assert quote.subtotal == Decimal("78.00")
+        assert quote.details == {"茶饮八折": Decimal("4.80"), "周末狂欢": Decimal("22.00")}
+
+        success, _, order = order_service.place_order(user_id)
+        assert success is True
+        assert order.discount == Decimal("26.80")
+        assert order.total_amount() == Decimal("51.20")
+        assert order.applied_promotions == ["茶饮八折", "周末狂欢"]
+        assert order_service.get_order(order.order_id).total_amount() == Decimal("51.20")
+
+        with pytest.raises(ValueError):
+            promotion_service.create_promotion(
+                "无效", "", now, now + timedelta(days=1),
+                rules=[PromotionRule(RuleType.BUY_N_GET_M, buy_quantity=0, free_quantity=1)])
+
+    def test_sales_rollups(self, clean_data_dir, capsys):
+        """
+        测试用例 6: 下单、取消时增量维护按天/小时/商品的销售汇总，并可从文件重新加载
+        """
+        menu_service = MenuService()
+        tea = menu_service.create_item("四季春", Decimal("12.00"), "茶饮")
+        milk_tea = menu_service.create_item("波霸奶茶", Decimal("16.00"), "经典")
+
+        order_service = OrderService()
+        user_id = uuid4()
+        order_service.cart_service.add_to_cart(user_id, tea.item_id, quantity=2)
+        _, _, first = order_service.place_order(user_id)
+        order_service.cart_service.add_to_cart(user_id, milk_tea.item_id)
+        _, _, second = order_service.place_order(user_id)
+        order_service.cart_service.add_to_cart(user_id, tea.item_id)
+        _, _, third = order_service.place_order(user_id)
+
+        assert order_service.cancel_order(second.order_id)[0] is True
+        # 重复取消不会重复记账
+        assert order_service.cancel_order(second.order_id)[0] is True
+
+        today = first.created_at.date()
+        daily = order_service.daily_sales(today, today)
+        assert len(daily) == 1
+        assert daily[0]['date'] == today
+        assert daily[0]['orders'] == 3
+        assert daily[0]['cancelled'] == 1
+        assert daily[0]['revenue'] == Decimal("52.00")
+        assert daily[0]['net_revenue'] == Decimal("36.00")
+        assert order_service.daily_sales(today + timedelta(days=1)) == []
+
+        hourly = order_service.hourly_sales(today, today)
+        assert len(hourly) == 24
+        assert hourly[first.created_at.hour]['orders'] >= 1
+        assert sum(h['orders'] for h in hourly) == 3
+
+        items = order_service.item_sales(today, today)
+        assert [(i['name'], i['quantity'], i['revenue']) for i in items] == \
+            [("四季春", 3, Decimal("36.00"))]
+
+        # 落盘后新的实例从汇总文件读取
+        flush_pending_writes()
+        assert OrderService().daily_sales() == daily
+
+        # 汇总文件缺失时由订单历史回填
+        (Path(__file__).parent.parent / 'data' / 'sales_rollups.json').unlink()
+        rebuilt = OrderService(rollups=SalesRollupStore())
+        assert rebuilt.daily_sales() == daily
+        assert rebuilt.item_sales() == items
+
+    def test_dashboard_stats_incremental(self, clean_data_dir, capsys):
+        """
+        测试用例 7: 经营看板只同步变更的订单，状态变化时修正排队、取消和销量指标
+        """
+        menu_service = MenuService()
+        tea = menu_service.create_item("四季春", Decimal("12.00"), "茶饮")
+        milk_tea = menu_service.create_item("波霸奶茶", Decimal("16.00"), "经典")
+
+        order_service = OrderService()
+        user_id = uuid4()
+        order_service.cart_service.add_to_cart(user_id, tea.item_id, quantity=2)
+        _, _, first = order_service.place_order(user_id)
+
+        now = [first.created_at]
+        stats = DashboardStats(order_service.order_repo, clock=lambda: now[0])
+        assert stats.refresh() is True
+        snapshot = stats.snapshot()
+        assert snapshot.order_count == 1
+        assert snapshot.queue_length == 1
+        assert snapshot.revenue == Decimal("24.00")
+        assert snapshot.orders_by_hour[first.created_at.hour] == 1
+        assert snapshot.average_wait is None
+        # 没有变更时不重复计算
+        revision = stats.revision
+        assert stats.refresh() is False
+        assert stats.revision == revision
+
+        order_service.cart_service.add_to_cart(user_id, milk_tea.item_id, quantity=3)
+        _, _, second = order_service.place_order(user_id)
+        order_service.update_status(first.order_id, OrderStatus.READY)
+        order_service.cancel_order(second.order_id)
+        assert stats.refresh() is True
+        snapshot = stats.snapshot()
+        assert snapshot.order_count == 1
+        assert snapshot.cancelled_count == 1
+        assert snapshot.queue_length == 0
+        assert snapshot.revenue == Decimal("24.00")
+        assert snapshot.average_wait is not None
+        assert snapshot.top_items == [("四季春", 2)]
+        assert order_service.get_order(first.order_id).ready_at is not None
+
+        # 跨天后只统计新一天的订单
+        now[0] = first.created_at + timedelta(days=1)
+        stats.refresh()
+        assert stats.snapshot().order_count == 0
+
+    def test_streaming_export(self, clean_data_dir, tmp_path, capsys):
+        """
+        测试用例 8: 流式导出订单明细（每个订单项一行）、评价和用户，支持时间过滤与 gzip
+        """
+        menu_service = MenuService()
+        tea = menu_service.create_item("四季春", Decimal("12.00"), "茶饮")
+        red_bean = menu_service.create_topping("红豆", Decimal("3.00"))
+        success, _, user = AuthService().register("小李", "13700001111")
+        assert success is True
+
+        order_service = OrderService()
+        order_service.cart_service.add_to_cart(user.user_id, tea.item_id, quantity=2,
+                                               topping_ids=[red_bean.topping_id])
+        order_service.cart_service.add_to_cart(user.user_id, tea.item_id, sweetness=Sweetness.NONE)
+        _, _, order = order_service.place_order(user.user_id, remark="少冰")
+        _, _, review = ReviewService().create_review(user.user_id, order.order_id, 5, "好喝")
+
+        # 以 JSON 数组写出的文件任意切块都能流式解析
+        assert [o.order_id for o in exporters.scan_entities('orders', exporters.Order)] == [order.order_id]
+
+        output = tmp_path / 'orders.csv'
+        assert exporters.main(['orders', '-o', str(output)]) == 0
+        with open(output, encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.DictReader(f))
+        assert [(r['line_no'], r['item_name'], r['quantity'], r['line_subtotal']) for r in rows] == \
+            [('1', "四季春", '2', "30.00"), ('2', "四季春", '1', "12.00")]
+        assert rows[0]['toppings'] == "红豆"
+        assert rows[1]['sweetness'] == Sweetness.NONE.value
+        assert rows[0]['order_total'] == rows[1]['order_total'] == str(order.total_amount())
+
+        # 时间范围之外的订单不导出
+        later = order.created_at + timedelta(seconds=1)
+        assert exporters.export('orders', str(tmp_path / 'none.csv'), start=later) == 0
+
+        output = tmp_path / 'reviews.jsonl.gz'
+        assert exporters.export('reviews', str(output)) >= 1
+        with gzip.open(output, 'rt', encoding='utf-8') as f:
+            reviews = [json.loads(line) for line in f]
+        assert {'review_id': str(review.review_id), 'rating': 5, 'content': "好喝"}.items() <= \
+            next(r for r in reviews if r['review_id'] == str(review.review_id)).items()
+
+        assert exporters.export('users', str(tmp_path / 'users.jsonl')) == 1
+        with pytest.raises(ValueError):
+            exporters.export('carts', str(tmp_path / 'carts.csv'))
+
+    def test_bulk_import(self, clean_data_dir, tmp_path, capsys):
+        """
+        测试用例 9: 批量导入菜单（报告无效行）和历史订单（导出的订单明细可原样导回）
+        """
+        menu_csv = tmp_path / 'menu.csv'
+        menu_csv.write_text("name,price,category,is_sold_out\n"
+                            "四季春,12,茶饮,否\n"
+                            ",10,茶饮,\n"
+                            "波霸奶茶,abc,经典,\n"
+                            "椰果奶茶,15.5,经典,是\n", encoding='utf-8')
+        progress = []
+        report = importers.import_file('menu_items', menu_csv, batch_size=1, progress=progress.append)
+        assert (report.rows, report.imported, report.rejected) == (4, 2, 2)
+        assert [(bad.line, bad.reason) for bad in report.bad_rows] == \
+            [(3, "缺少字段 name"), (4, "字段 price 不是合法的金额: abc")]
+        assert progress and progress[-1] is report
+        menu_service = MenuService()
+        assert {item.name: item.price for item in menu_service.list_all_items()} == \
+            {"四季春": Decimal("12.00"), "椰果奶茶": Decimal("15.50")}
+        tea = next(item for item in menu_service.list_all_items() if item.name == "四季春")
+
+        # 导出订单明细后清空订单，再从明细 CSV 导回
+        order_service = OrderService()
+        user_id = uuid4()
+        order_service.cart_service.add_to_cart(user_id, tea.item_id, quantity=2)
+        _, _, order = order_service.place_order(user_id)
+        order_service.cancel_order(order.order_id)
+        exported = tmp_path / 'orders.csv'
+        assert exporters.export('orders', str(exported)) == 1
+        flush_pending_writes()
+        data_dir = Path(__file__).parent.parent / 'data'
+        shutil.rmtree(data_dir / 'orders')
+        (data_dir / 'sales_rollups.json').unlink()
+
+        report = importers.import_file('orders', exported)
+        assert (report.imported, report.rejected) == (1, 0)
+        restored = OrderService().get_order(order.order_id)
+        assert restored.status == OrderStatus.CANCELLED
+        assert restored.items[0].menu_item.item_id == tea.item_id
+        assert restored.total_amount() == Decimal("24.00")
+        assert OrderService().daily_sales()[0]['cancelled'] == 1
+
+        # JSONL 订单：无效 JSON 和不一致的金额都作为无效行报告，其余照常导入
+        jsonl = tmp_path / 'orders.jsonl'
+        good = dict(order.to_dict(), order_id=str(uuid4()))
+        bad = dict(order.to_dict(), order_id=str(uuid4()), discount="999")
+        jsonl.write_text("\n".join([json.dumps(good), "{broken", json.dumps(bad)]) + "\n",
+                         encoding='utf-8')
+        report = importers.import_file('orders', jsonl)
+        assert (report.rows, report.imported, report.rejected) == (3, 1, 2)
+        assert report.bad_rows[0].line == 2
+        assert "超过订单原价" in report.bad_rows[1].reason
+        assert len(OrderService().list_orders()) == 2
+
+    def test_order_archive(self, clean_data_dir):
+        """归档：超过保留期的已结束订单移入压缩归档段，完整历史仍可查询"""
+        menu_service = MenuService()
+        tea = menu_service.create_item("四季春", Decimal("12.00"), "茶饮")
+        order_service = OrderService()
+        user_id = uuid4()
+        orders = []
+        for _ in range(3):
+            order_service.cart_service.add_to_cart(user_id, tea.item_id)
+            orders.append(order_service.place_order(user_id)[2])
+        old_done, old_active, recent = orders
+        order_service.update_status(old_done.order_id, OrderStatus.COMPLETED)
+        # 把前两个订单的下单时间改到 120 天前；进行中的订单不归档
+        long_ago = datetime.now() - timedelta(days=120)
+        repo = order_service.order_repo
+        for order in (old_done, old_active):
+            current = repo.find_by_id(order.order_id)
+            current.created_at = long_ago
+            repo.save(current)
+
+        success, _, count = order_service.archive_orders(days=90)
+        assert success and count == 1
+        assert repo.find_by_id(old_done.order_id) is None
+        assert len(order_service.list_orders(user_id)) == 2
+        segment = order_service.archive.directory / f"orders-{long_ago:%Y-%m}.jsonl.gz"
+        assert segment.exists()
+        assert len(order_service.archive) == 1
+        # 其他用户的历史不会解压任何归档段
+        assert order_service.archive.find_by_user(uuid4()) == []
+
+        history = order_service.list_order_history(user_id)
+        assert [o.order_id for o in history] == [recent.order_id, old_active.order_id, old_done.order_id]
+        assert history[-1].status == OrderStatus.COMPLETED
+        assert order_service.get_order(old_done.order_id) is None
+        archived = order_service.get_order(old_done.order_id, include_archive=True)
+        assert archived.total_amount() == Decimal("12.00")
+
+        # 再次归档是幂等的；新进程中的服务能读到相同的历史
+        assert order_service.archive_orders(days=90)[2] == 0
+        assert len(OrderService().list_order_history(user_id)) == 3
+
+        # 0 天表示归档全部已结束订单，而不是退回默认保留期
+        order_service.update_status(recent.order_id, OrderStatus.COMPLETED)
+        assert order_service.archive_orders(days=0)[2] == 1
+
+    def test_order_partitions(self, clean_data_dir):
+        """订单按下单日期分区存储：写盘只重写受影响的分区，其他实例只重新加载变化的分区"""
+        data_dir = Path(__file__).parent.parent / 'data'
+        day1, day2 = datetime(2026, 3, 1, 10), datetime(2026, 3, 2, 15)
+        first, second = Order(user_id=uuid4(), created_at=day1), Order(user_id=uuid4(), created_at=day2)
+        # 旧的单文件数据在首次加载时迁移为分区
+        with open(data_dir / 'orders.json', 'w', encoding='utf-8') as f:
+            json.dump([first.to_dict(), second.to_dict()], f)
+        repo = OrderRepository()
+        assert len(repo.find_all()) == 2
+        assert not (data_dir / 'orders.json').exists()
+        (data_dir / 'orders.json.migrated').unlink()
+        partition1, partition2 = data_dir / 'orders' / '2026-03-01.json', data_dir / 'orders' / '2026-03-02.json'
+        assert partition1.exists() and partition2.exists()
+
+        other = OrderRepository()
+        kept = other.find_by_id(first.order_id)
+        untouched = partition1.stat().st_mtime_ns
+        updated = repo.find_by_id(second.order_id)
+        updated.status = OrderStatus.COMPLETED
+        repo.save(updated)
+        repo.flush()
+        assert partition1.stat().st_mtime_ns == untouched
+        assert other.find_by_id(second.order_id).status == OrderStatus.COMPLETED
+        # 未变化的分区不会重新解析
+        assert other.find_by_id(first.order_id) is kept
+
+        # 改动下单时间后订单迁到新分区，旧分区为空时删除
+        moved = repo.find_by_id(first.order_id)
+        moved.created_at = datetime(2026, 3, 2, 10)
+        repo.save(moved)
+        repo.flush()
+        assert not partition1.exists()
+        assert [o.order_id for o in other.find_by_time_range(end=day2)] == [first.order_id]
+        assert other.find_by_time_range(end=datetime(2026, 3, 2)) == []
+        assert len(OrderRepository().find_by_time_range(datetime(2026, 3, 2))) == 2
+
+    def test_snapshot_cache(self, clean_data_dir, capsys):
+        """启动快照缓存：数据文件未变时直接反序列化，内容变化（即使大小和修改时间相同）时回退到 JSON"""
+        menu_service = MenuService()
+        tea = menu_service.create_item("四季春", Decimal("12.00"), "茶饮")
+        menu_service.create_item("波霸奶茶", Decimal("16.00"), "经典")
+        flush_pending_writes()
+        source = MenuItemRepository().filepath
+        assert snapshot_cache.path_for(source).exists()
+
+        hits = snapshot_cache.hits
+        warm = MenuItemRepository()
+        assert snapshot_cache.hits == hits + 1
+        assert warm.find_by_id(tea.item_id).price == Decimal("12.00")
+        assert [item.name for item in warm.search("四季")] == ["四季春"]
+
+        # 同样字节数的改动并恢复修改时间，只有内容摘要能发现
+        st = source.stat()
+        source.write_bytes(source.read_bytes().replace("四季春".encode(), "四季夏".encode()))
+        os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns))
+        assert MenuItemRepository().find_by_id(tea.item_id).name == "四季夏"
+        assert snapshot_cache.hits == hits + 1
+
+        # 损坏的缓存不影响加载
+        snapshot_cache.path_for(source).write_bytes(b"broken")
+        assert MenuItemRepository().find_by_id(tea.item_id).name == "四季夏"
+        assert "读取缓存失败" in capsys.readouterr().out
+
+        # 订单中的商品快照在缓存中只存一份，加载后共享且金额不变
+        order_service = OrderService()
+        for user_id in (uuid4(), uuid4()):
+            order_service.cart_service.add_to_cart(user_id, tea.item_id)
+            order_service.place_order(user_id)
+        flush_pending_writes()
+        OrderRepository()
+        first, second = OrderRepository().find_all()
+        assert first.items[0].menu_item is second.items[0].menu_item
+        assert first.total_amount() == second.total_amount() == Decimal("12.00")
@@ -1,18 +1,26 @@
 import pytest
 import os
 import shutil
+import threading
 from pathlib import Path
 from decimal import Decimal
+from datetime import datetime, time, timedelta
 from uuid import uuid4
 
 # 导入被测组件
-from models import Sweetness, OrderStatus
-from services import AuthService, CartService, MenuService
-from repositories import UserRepository, MenuItemRepository, CartRepository, ToppingRepository
+from cart_store import SessionCartStore
+from models import Cart, MenuItem, Topping, OrderItem, Promotion, PromotionRule, RuleType, Sweetness, OrderStatus
+from money import from_cents, to_cents
+from pricing import PricingEngine
+from services import AuthService, CartService, FavoriteService, MenuService, PromotionService
+from promotion_schedule import PromotionScheduler
+from repositories import UserRepository, MenuItemRepository, CartRepository, PromotionRepository, ToppingRepository, flush_pending_writes
 
 @pytest.fixture
 def clean_data_dir():
     """清理并准备测试数据目录"""
+    # 先等待后台写盘线程完成，避免旧数据在删除后被重新写入
+    flush_pending_writes()
     data_dir = Path(__file__).parent.parent / 'data'
     if data_dir.exists():
         # 备份原数据（可选，这里为了简单直接删除，实际环境需小心）
@@ -20,7 +28,7 @@ def clean_data_dir():
         pass
     
     # 确保 repos 重新加载数据，这里通过重新实例化或清理文件实现
-    for filename in ['users.json', 'menu_items.json', 'carts.json', 'toppings.json']:
+    for filename in ['users.json', 'menu_items.json', 'carts.json', 'toppings.json', 'promotions.json', 'favorites.json']:
         filepath = data_dir / filename
         if filepath.exists():
             filepath.unlink()
@@ -148,7 +156,8 @@ class TestCartService:
         
         success = service.remove_from_cart(user_id, order_item_id)
         assert success is True
-        assert len(service.get_cart(user_id).items) == 0
+        # 空购物车直接删除
+        assert service.get_cart(user_id) is None
 
     def test_clear_cart(self, clean_data_dir, setup_menu):
         item, _ = setup_menu
@@ -157,7 +166,332 @@ class TestCartService:
         service.add_to_cart(user_id, item.item_id)
         service.add_to_cart(user_id, item.item_id)
         
-        assert len(service.get_cart(user_id).items) == 2
+        # 相同配置合并为一行
+        cart = service.get_cart(user_id)
+        assert len(cart.items) == 1 and cart.items[0].quantity == 2
         service.clear_cart(user_id)
-        assert len(service.get_cart(user_id).items) == 0
+        assert service.get_cart(user_id) is None
+
+    
+    def test_cart_lines_merge_by_configuration(self, setup_menu):
+        item, topping = setup_menu
+        other = Topping(name="椰果", extra_price=Decimal("1.00"))
+        cart = Cart(user_id=uuid4())
+        first = cart.add_item(item, 1, Sweetness.FULL, [topping, other])
+        # 小料顺序不同仍是同一配置
+        assert cart.add_item(item, 2, Sweetness.FULL, [other, topping]) is first
+        second = cart.add_item(item, 1, Sweetness.NONE)
+        third = cart.add_item(item, 1, Sweetness.FULL, [topping, other], remark="少冰")
+        assert cart.items == [first, second, third] and first.quantity == 3
+        assert cart.total() == Decimal("18.00") * 4 + Decimal("15.00")
+        
+        cart.update_quantity(first.order_item_id, 1)
+        cart.remove_item(second.order_item_id)
+        assert cart.items == [first, third]
+        # 移除后同配置重新加入为新行
+        assert cart.add_item(item, 1, Sweetness.NONE) is not second
+        
+        # 序列化往返保持顺序，旧数据中的重复行加载时合并
+        restored = Cart.from_dict(cart.to_dict())
+        assert [line.order_item_id for line in restored.items] == [line.order_item_id for line in cart.items]
+        legacy = cart.to_dict()
+        legacy['items'].append(dict(legacy['items'][0], order_item_id=str(uuid4())))
+        merged = Cart.from_dict(legacy)
+        assert len(merged.items) == 3 and merged.items[0].quantity == 2
+
+
+class TestSessionCartStore:
+    """会话购物车存储：过期、淘汰与异步持久化"""
+    
+    class Clock:
+        def __init__(self):
+            self.now = 0.0
+        
+        def __call__(self):
+            return self.now
+    
+    def test_ttl_and_lru_eviction(self):
+        clock = self.Clock()
+        store = SessionCartStore(ttl=60, max_carts=2, clock=clock)
+        first, second, third = (Cart(user_id=uuid4()) for _ in range(3))
+        store.save(first)
+        store.save(second)
+        # 访问即续期，并成为最近使用
+        clock.now = 50
+        assert store.find_by_user(first.user_id) is first
+        store.save(third)
+        assert store.find_by_user(second.user_id) is None
+        assert store.evicted == 1
+        
+        clock.now = 105
+        assert store.find_by_user(first.user_id) is first
+        clock.now = 200
+        assert store.sweep() == 2
+        assert len(store) == 0 and store.expired == 2
+    
+    def test_evicted_cart_saved_again_is_persisted(self, clean_data_dir):
+        store = SessionCartStore(max_carts=1, persist_repo=CartRepository(), persist_interval=3600)
+        item = MenuItem(name="柠檬茶", price=Decimal("10.00"))
+        first, second = Cart(user_id=uuid4()), Cart(user_id=uuid4())
+        first.add_item(item)
+        second.add_item(item)
+        store.save(first)
+        # 保存第二个购物车时淘汰第一个，之后持有者又保存了第一个
+        store.save(second)
+        assert store.evicted == 1
+        store.save(first)
+        store.close()
+        assert [cart.cart_id for cart in CartRepository().find_all()] == [first.cart_id]
+    
+    def test_persistence_is_asynchronous(self, clean_data_dir):
+        item = MenuService().create_item("珍珠奶茶", Decimal("15.00"))
+        store = SessionCartStore(persist_repo=CartRepository(), persist_interval=3600)
+        service = CartService(store)
+        user_id, emptied = uuid4(), uuid4()
+        service.add_to_cart(user_id, item.item_id)
+        service.add_to_cart(emptied, item.item_id)
+        service.clear_cart(emptied)
+        flush_pending_writes()
+        # 加购不写盘
+        assert not (Path(__file__).parent.parent / 'data' / 'carts.json').exists()
+        # 写盘的是保存时的副本，之后对购物车对象的改动要再次保存才会写入
+        service.get_cart(user_id).items[0].quantity = 5
+        
+        store.close()
+        restored = SessionCartStore(persist_repo=CartRepository())
+        assert [cart.user_id for cart in restored.find_all()] == [user_id]
+        line = restored.find_by_user(user_id).items[0]
+        assert line.menu_item.name == "珍珠奶茶" and line.quantity == 1
+        restored.close()
+
+
+class TestFavoriteService:
+    """收藏与批量查询"""
+    
+    def test_list_favorite_items_batches_lookup(self, clean_data_dir):
+        menu_service = MenuService()
+        items = [menu_service.create_item(f"奶茶{i}", Decimal("10.00")) for i in range(3)]
+        service = FavoriteService(item_repo=menu_service.item_repo)
+        user_id, other_id = uuid4(), uuid4()
+        for item in reversed(items):
+            assert service.add_favorite(user_id, item.item_id)[0]
+        service.add_favorite(other_id, items[0].item_id)
+        assert service.add_favorite(user_id, items[0].item_id) == (False, "已经收藏过了")
+        
+        # 按传入顺序返回，找不到的ID不出现在结果中
+        missing = uuid4()
+        found = menu_service.item_repo.get_many([items[2].item_id, missing, items[0].item_id])
+        assert list(found) == [items[2].item_id, items[0].item_id]
+        
+        menu_service.delete_item(items[1].item_id)
+        joined = service.list_favorite_items(user_id)
+        assert [f.item.name for f in joined] == ["奶茶2", "奶茶0"]
+        assert all(f.favorite.user_id == user_id for f in joined)
+        
+        assert service.remove_favorite(user_id, items[2].item_id)[0]
+        assert not service.is_favorited(user_id, items[2].item_id)
+        assert [f.item_id for f in service.list_favorites(user_id)] == [items[1].item_id, items[0].item_id]
+        assert len(service.list_favorites(other_id)) == 1
+
+class TestMenuSearch:
+    """菜单检索单元测试"""
+
+    @pytest.fixture
+    def menu_service(self, clean_data_dir):
+        service = MenuService()
+        service.create_item("珍珠奶茶", Decimal("15.00"), "奶茶", description="经典黑糖珍珠")
+        service.create_item("波霸奶茶", Decimal("16.00"), "奶茶")
+        service.create_item("四季春", Decimal("12.00"), "茶饮")
+        service.create_item("Coco 柠檬茶", Decimal("13.00"), "果茶")
+        return service
+
+    def test_search_chinese_and_pinyin(self, menu_service):
+        assert [i.name for i in menu_service.search_items("奶茶")] == ["波霸奶茶", "珍珠奶茶"]
+        assert [i.name for i in menu_service.search_items("珍珠")] == ["珍珠奶茶"]
+        assert [i.name for i in menu_service.search_items("zznc")] == ["珍珠奶茶"]
+        assert [i.name for i in menu_service.search_items("sjc")] == ["四季春"]
+        assert [i.name for i in menu_service.search_items("coc")] == ["Coco 柠檬茶"]
+        # 描述也参与检索；不连续的字不应命中
+        assert [i.name for i in menu_service.search_items("黑糖")] == ["珍珠奶茶"]
+        assert menu_service.search_items("珍奶茶") == []
+
+    def test_facets_and_sold_out(self, menu_service):
+        assert menu_service.category_facets("奶茶") == {"奶茶": 2}
+        assert len(menu_service.search_items(category="茶饮")) == 1
+
+        item = menu_service.search_items("波霸")[0]
+        menu_service.mark_sold_out(item.item_id, True)
+        assert [i.name for i in menu_service.search_items("奶茶")] == ["珍珠奶茶"]
+        assert len(menu_service.search_items("奶茶", include_sold_out=True)) == 2
+
+    def test_index_updates_incrementally(self, menu_service):
+        item = menu_service.search_items("四季春")[0]
+        menu_service.update_item(item.item_id, name="冬瓜茶", category="古早味")
+        assert menu_service.search_items("四季春") == []
+        assert [i.name for i in menu_service.search_items("dgc")] == ["冬瓜茶"]
+        assert "茶饮" not in menu_service.list_categories()
+
+        menu_service.delete_item(item.item_id)
+        assert menu_service.search_items("冬瓜") == []
+
+class TestMenuCatalog:
+    """菜单目录快照单元测试"""
+
+    def test_snapshot_reused_until_mutation(self, clean_data_dir):
+        service = MenuService()
+        milk_tea = service.create_item("珍珠奶茶", Decimal("15.00"), "奶茶")
+        service.create_item("四季春", Decimal("12.00"), "茶饮")
+
+        catalog = service.catalog()
+        assert service.catalog() is catalog
+        assert service.list_items() is catalog.available
+        assert catalog.categories() == ["奶茶", "茶饮"]
+        assert [i.name for i in catalog.by_category["奶茶"]] == ["珍珠奶茶"]
+
+        service.mark_sold_out(milk_tea.item_id, True)
+        updated = service.catalog()
+        assert updated is not catalog
+        assert updated.version == catalog.version + 1
+        assert "奶茶" not in updated.by_category
+        assert updated.by_id[milk_tea.item_id].is_sold_out
+        # 旧快照不受影响
+        assert not catalog.by_id[milk_tea.item_id].is_sold_out
+
+        service.create_topping("珍珠", Decimal("2.00"))
+        assert [t.name for t in service.list_toppings()] == ["珍珠"]
+
+class TestPromotionSchedule:
+    """促销生效调度单元测试"""
+
+    def test_active_set_follows_boundaries(self, clean_data_dir):
+        service = PromotionService()
+        now = [datetime(2024, 6, 1, 12, 0)]
+        service.scheduler._clock = lambda: now[0]
+        events = []
+        service.subscribe(lambda promotions: events.append([p.title for p in promotions]))
+
+        start = now[0]
+        service.create_promotion("午市", "全场九折", start - timedelta(hours=1), start + timedelta(hours=2))
+        service.create_promotion("晚市", "第二杯半价", start + timedelta(hours=6), start + timedelta(hours=8))
+        service.create_promotion("往期", "已结束", start - timedelta(days=30), start - timedelta(days=29))
+        assert [p.title for p in service.list_active_promotions()] == ["午市"]
+        assert service.list_active_promotions() is service.list_active_promotions()
+
+        now[0] = start + timedelta(hours=7)
+        assert [p.title for p in service.list_active_promotions()] == ["晚市"]
+        now[0] = start + timedelta(days=1)
+        assert service.list_active_promotions() == ()
+        assert events == [["午市"], ["晚市"], []]
+
+        # 停用后即使在有效期内也不再生效
+        evening = service.list_all_promotions()[1]
+        now[0] = start + timedelta(hours=7)
+        service.update_promotion(evening.promotion_id, is_active=False)
+        assert service.list_active_promotions() == ()
+
+    def test_timer_activates_promotion(self, clean_data_dir):
+        service = PromotionService()
+        activated = threading.Event()
+        service.subscribe(lambda promotions: promotions and activated.set())
+        service.scheduler.start()
+        try:
+            now = datetime.now()
+            service.create_promotion("限时", "", now + timedelta(milliseconds=200), now + timedelta(hours=1))
+            assert service.list_active_promotions() == ()
+            assert activated.wait(timeout=5)
+        finally:
+            service.scheduler.stop()
+
+    def test_unsubscribe(self, clean_data_dir):
+        service = PromotionService()
+        events = []
+        callback = events.append
+        service.subscribe(callback)
+        now = datetime.now()
+        service.create_promotion("全天", "", now - timedelta(hours=1), now + timedelta(hours=1))
+        assert len(events) == 1
+        service.unsubscribe(callback)
+        service.create_promotion("再来", "", now - timedelta(hours=1), now + timedelta(hours=1))
+        assert len(service.list_active_promotions()) == 2
+        assert len(events) == 1
+
+    def test_refresh_without_future_boundary(self, clean_data_dir):
+        scheduler = PromotionScheduler(PromotionRepository())
+        assert scheduler.refresh() == ()
+        assert scheduler.refresh() == ()
+
+        service = PromotionService()
+        service.list_active_promotions()
+        assert service.delete_promotion(uuid4()) is False
+
+class TestPricingEngine:
+    """促销计价引擎单元测试"""
+
+    def test_best_discount_and_time_of_day(self):
+        milk_tea = MenuItem(name="珍珠奶茶", price=Decimal("10.00"), category="奶茶")
+        fruit_tea = MenuItem(name="满杯百香果", price=Decimal("20.00"), category="果茶")
+        engine = PricingEngine([
+            Promotion(title="奶茶九折", rules=[
+                PromotionRule(RuleType.CATEGORY_PERCENT, category="奶茶", percent_off=Decimal("10"))]),
+            Promotion(title="下午茶半价", rules=[
+                PromotionRule(RuleType.TIME_OF_DAY, percent_off=Decimal("50"),
+                              start_time=time(14, 0), end_time=time(17, 0))]),
+        ])
+        items = [OrderItem(menu_item=milk_tea), OrderItem(menu_item=fruit_tea)]
+
+        noon = engine.price(items, datetime(2024, 6, 1, 12, 0))
+        assert noon.details == {"奶茶九折": Decimal("1.00")}
+        assert noon.total == Decimal("29.00")
+        # 同一商品不叠加，取最优折扣
+        afternoon = engine.price(items, datetime(2024, 6, 1, 15, 30))
+        assert afternoon.details == {"下午茶半价": Decimal("15.00")}
+
+    def test_buy_n_get_m_frees_cheapest_units(self):
+        big = MenuItem(name="超大杯奶茶", price=Decimal("10.00"), category="奶茶")
+        small = MenuItem(name="小杯奶茶", price=Decimal("8.00"), category="奶茶")
+        engine = PricingEngine([Promotion(title="买二送一", rules=[
+            PromotionRule(RuleType.BUY_N_GET_M, category="奶茶", buy_quantity=2, free_quantity=1)])])
+        quote = engine.price([OrderItem(menu_item=big, quantity=2), OrderItem(menu_item=small)])
+        assert quote.discount == Decimal("8.00")
+        assert engine.price([OrderItem(menu_item=big, quantity=2)]).discount == 0
+
+    def test_free_topping_discount_per_promotion(self):
+        pearl = Topping(name="珍珠", extra_price=Decimal("2.00"))
+        coconut = Topping(name="椰果", extra_price=Decimal("1.00"))
+        milk_tea = MenuItem(name="奶茶", price=Decimal("10.00"))
+        engine = PricingEngine([
+            Promotion(title="珍珠免费", rules=[
+                PromotionRule(RuleType.FREE_TOPPING, topping_id=pearl.topping_id)]),
+            Promotion(title="满20小料全免", rules=[
+                PromotionRule(RuleType.FREE_TOPPING, threshold=Decimal("20"))]),
+        ])
+        line = OrderItem(menu_item=milk_tea, quantity=2, toppings=[pearl, coconut])
+        # 各促销只记自己免掉的小料
+        assert engine.price([line]).details == {"珍珠免费": Decimal("4.00"), "满20小料全免": Decimal("2.00")}
+        single = OrderItem(menu_item=milk_tea, toppings=[pearl, coconut])
+        assert engine.price([single]).details == {"珍珠免费": Decimal("2.00")}
+
+class TestMoney:
+    """整数分金额单元测试"""
+
+    def test_quantize_at_ingest(self, clean_data_dir):
+        service = MenuService()
+        item = service.create_item("百香果", Decimal("919.9766098242977250265539623796939849853515625"))
+        assert item.price == Decimal("919.98")
+        assert item.price_cents == 91998
+        updated = service.update_item(item.item_id, price=Decimal("12.345"))
+        assert updated.price == Decimal("12.35")
+        assert updated.price_cents == 1235
+        topping = service.create_topping("椰果", 1.005)
+        assert topping.extra_price_cents == 101
+        with pytest.raises(ValueError):
+            service.create_item("无效", Decimal("NaN"))
 
+    def test_cent_arithmetic(self):
+        assert to_cents("0.005") == 1
+        assert to_cents(Decimal("-1.005")) == -101
+        assert from_cents(1999) == Decimal("19.99")
+        assert str(from_cents(0)) == "0.00"
+        item = OrderItem(menu_item=MenuItem(price=Decimal("0.10")), quantity=3)
+        assert item.subtotal() == Decimal("0.30")
+        assert str(item.subtotal()) == "0.30"
@@ -0,0 +1,313 @@
+"""
+奶茶点单系统 - 销售分析
+把订单历史（热数据和归档）整理为按订单项排列的 NumPy 列式数组（时间、商品、数量、金额、
+甜度、小料位图），各类统计都以向量化的分组聚合完成；新订单到达后只追加增量部分。
+依赖可选的 numpy（pip install numpy）
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Tuple
+from uuid import UUID
+
+from archive import OrderArchive
+from models import Order, OrderStatus, Sweetness
+from money import from_cents, to_cents
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖，未安装时无法构建分析引擎
+    np = None
+
+_STATUS_CODES = {status: code for code, status in enumerate(OrderStatus)}
+_SWEETNESS_CODES = {sweetness: code for code, sweetness in enumerate(Sweetness)}
+# 订单被删除后的状态码，与已取消的订单一样不计入统计
+_DELETED = -1
+
+
+class _ColumnStore:
+    """按容量倍增的列式数组，追加均摊 O(1)"""
+
+    def __init__(self, dtypes: Dict[str, str]):
+        self._dtypes = dtypes
+        self.size = 0
+        self.columns = {name: np.zeros(16, dtype=dtype) for name, dtype in dtypes.items()}
+
+    def append(self, rows: Dict[str, list]):
+        """追加一批行，rows 为列名 -> 值列表"""
+        count = len(next(iter(rows.values())))
+        if not count:
+            return
+        needed = self.size + count
+        capacity = len(next(iter(self.columns.values())))
+        if needed > capacity:
+            while capacity < needed:
+                capacity *= 2
+            for name, column in self.columns.items():
+                grown = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                self.columns[name] = grown
+        for name, values in rows.items():
+            self.columns[name][self.size:needed] = values
+        self.size = needed
+
+    def widen(self, name: str, width: int):
+        """把二维列扩展到 width 列"""
+        column = self.columns[name]
+        if column.shape[1] < width:
+            grown = np.zeros((column.shape[0], width), dtype=column.dtype)
+            grown[:, :column.shape[1]] = column
+            self.columns[name] = grown
+
+    def __getitem__(self, name: str):
+        """有效部分的视图"""
+        return self.columns[name][:self.size]
+
+
+class SalesAnalytics:
+    """
+    销售分析引擎
+    通过 OrderRepository.changes_since 增量同步：新订单追加到列末尾，
+    状态变化只改写订单级的状态列。归档订单从热数据中删除后仍计入统计：
+    清单条目变化的归档段会被重新读取。所有金额以分计算，结果转换为 Decimal
+    """
+
+    def __init__(self, order_repo, archive: OrderArchive = None):
+        if np is None:
+            raise ImportError("销售分析需要安装 numpy：pip install numpy")
+        self.order_repo = order_repo
+        self.archive = archive or OrderArchive()
+        self._token = 0
+        # 已同步的归档段：段名 -> 清单条目
+        self._segments: Dict[str, dict] = {}
+        # 订单级列：订单在列中的行号由 _order_rows 记录
+        self._orders = _ColumnStore({
+            'ts': 'int64', 'day': 'int32', 'hour': 'int8',
+            'status': 'int8', 'discount': 'int64',
+        })
+        self._order_rows: Dict[UUID, int] = {}
+        # 订单项级列
+        self._lines = _ColumnStore({
+            'order': 'int32', 'ts': 'int64', 'day': 'int32', 'hour': 'int8',
+            'item': 'int32', 'quantity': 'int32', 'cents': 'int64', 'sweetness': 'int8',
+        })
+        self._lines.columns['toppings'] = np.zeros((16, 1), dtype='uint64')
+        # 商品、小料的字典编码
+        self._item_codes: Dict[UUID, int] = {}
+        self._item_names: List[str] = []
+        self._topping_codes: Dict[UUID, int] = {}
+        self._topping_names: List[str] = []
+
+    def __len__(self) -> int:
+        """已同步的订单项数"""
+        return self._lines.size
+
+    # 同步
+
+    def refresh(self) -> int:
+        """同步仓储和归档中的新增和变更订单，返回新追加的订单数"""
+        token, changed, deleted = self.order_repo.changes_since(self._token)
+        self._token = token
+        new_orders = []
+        for order in changed:
+            if not self._update_row(order):
+                new_orders.append(order)
+        status = self._orders.columns['status']
+        for order_id in deleted:
+            row = self._order_rows.get(order_id)
+            if row is not None:
+                status[row] = _DELETED
+        self._append(new_orders)
+        # 归档先写归档段再删除热数据：读完变更后再同步归档，被归档删除的订单在这里恢复
+        archived = []
+        for name, entry in sorted(self.archive.manifest().items()):
+            if self._segments.get(name) == entry:
+                continue
+            self._segments[name] = entry
+            # 每个订单只在一个段中（按下单月份），段内不会重复
+            archived += [order for order in self.archive.iter_segment(name)
+                         if not self._update_row(order)]
+        self._append(archived)
+        return len(new_orders) + len(archived)
+
+    def _update_row(self, order: Order) -> bool:
+        """已同步的订单只改写状态和优惠；返回订单是否已在列中"""
+        row = self._order_rows.get(order.order_id)
+        if row is None:
+            return False
+        self._orders.columns['status'][row] = _STATUS_CODES[order.status]
+        self._orders.columns['discount'][row] = to_cents(order.discount)
+        return True
+
+    def _encode(self, codes: Dict[UUID, int], names: List[str], entity_id: UUID, name: str) -> int:
+        """字典编码；名称以最近一次出现的为准"""
+        code = codes.get(entity_id)
+        if code is None:
+            code = codes[entity_id] = len(names)
+            names.append(name)
+        else:
+            names[code] = name
+        return code
+
+    def _append(self, orders: List[Order]):
+        """把新订单展开为订单项行追加到列末尾"""
+        if not orders:
+            return
+        order_rows = {'ts': [], 'day': [], 'hour': [], 'status': [], 'discount': []}
+        line_rows = {'order': [], 'ts': [], 'day': [], 'hour': [], 'item': [],
+                     'quantity': [], 'cents': [], 'sweetness': []}
+        masks: List[List[int]] = []
+        row = self._orders.size
+        for order in orders:
+            created = order.created_at
+            ts, day, hour = int(created.timestamp()), created.toordinal(), created.hour
+            self._order_rows[order.order_id] = row
+            order_rows['ts'].append(ts)
+            order_rows['day'].append(day)
+            order_rows['hour'].append(hour)
+            order_rows['status'].append(_STATUS_CODES[order.status])
+            order_rows['discount'].append(to_cents(order.discount))
+            for line in order.items:
+                if line.menu_item is None:
+                    continue
+                line_rows['order'].append(row)
+                line_rows['ts'].append(ts)
+                line_rows['day'].append(day)
+                line_rows['hour'].append(hour)
+                line_rows['item'].append(self._encode(
+                    self._item_codes, self._item_names, line.menu_item.item_id, line.menu_item.name))
+                line_rows['quantity'].append(line.quantity)
+                line_rows['cents'].append(line.subtotal_cents())
+                line_rows['sweetness'].append(_SWEETNESS_CODES[line.sweetness])
+                words = []
+                for topping in line.toppings:
+                    code = self._encode(self._topping_codes, self._topping_names,
+                                        topping.topping_id, topping.name)
+                    word, bit = divmod(code, 64)
+                    words.extend([0] * (word + 1 - len(words)))
+                    words[word] |= 1 << bit
+                masks.append(words)
+            row += 1
+
+        self._orders.append(order_rows)
+        width = max(1, (len(self._topping_names) + 63) // 64)
+        self._lines.widen('toppings', width)
+        padded = [words + [0] * (width - len(words)) for words in masks]
+        self._lines.append({**line_rows, 'toppings': np.array(padded, dtype='uint64').reshape(-1, width)})
+
+    # 查询
+
+    def _line_mask(self, start: datetime = None, end: datetime = None):
+        """有效订单（未取消、未删除）且在 [start, end) 时间范围内的订单项"""
+        status = self._orders['status'][self._lines['order']]
+        mask = (status != _STATUS_CODES[OrderStatus.CANCELLED]) & (status != _DELETED)
+        ts = self._lines['ts']
+        if start is not None:
+            mask &= ts >= int(start.timestamp())
+        if end is not None:
+            mask &= ts < int(end.timestamp())
+        return mask
+
+    def _order_mask(self, start: datetime = None, end: datetime = None):
+        """有效订单且在时间范围内"""
+        status = self._orders['status']
+        mask = (status != _STATUS_CODES[OrderStatus.CANCELLED]) & (status != _DELETED)
+        ts = self._orders['ts']
+        if start is not None:
+            mask &= ts >= int(start.timestamp())
+        if end is not None:
+            mask &= ts < int(end.timestamp())
+        return mask
+
+    @staticmethod
+    def _sum_by(keys, weights, size: int):
+        """按整数键分组求和；bincount 以 float64 累加，金额在 2^53 分以内结果精确"""
+        return np.rint(np.bincount(keys, weights=weights, minlength=size)).astype('int64')
+
+    def order_count(self, start: datetime = None, end: datetime = None) -> int:
+        """有效订单数"""
+        self.refresh()
+        return int(self._order_mask(start, end).sum())
+
+    def revenue(self, start: datetime = None, end: datetime = None) -> Decimal:
+        """实收金额（扣除促销优惠）"""
+        self.refresh()
+        lines = self._line_mask(start, end)
+        orders = self._order_mask(start, end)
+        cents = int(self._lines['cents'][lines].sum()) - int(self._orders['discount'][orders].sum())
+        return from_cents(cents)
+
+    def revenue_by_hour(self, start: datetime = None, end: datetime = None) -> List[Decimal]:
+        """按一天中的小时（0-23）统计实收金额"""
+        self.refresh()
+        lines = self._line_mask(start, end)
+        orders = self._order_mask(start, end)
+        gross = self._sum_by(self._lines['hour'][lines], self._lines['cents'][lines], 24)
+        discount = self._sum_by(self._orders['hour'][orders], self._orders['discount'][orders], 24)
+        return [from_cents(int(cents)) for cents in gross - discount]
+
+    def orders_by_hour(self, start: datetime = None, end: datetime = None) -> List[int]:
+        """按一天中的小时（0-23）统计订单数"""
+        self.refresh()
+        orders = self._order_mask(start, end)
+        return [int(n) for n in np.bincount(self._orders['hour'][orders], minlength=24)]
+
+    def revenue_by_day(self, start: datetime = None, end: datetime = None) -> Dict[date, Decimal]:
+        """按日期统计实收金额"""
+        self.refresh()
+        lines = self._line_mask(start, end)
+        orders = self._order_mask(start, end)
+        days = np.concatenate([self._lines['day'][lines], self._orders['day'][orders]])
+        cents = np.concatenate([self._lines['cents'][lines], -self._orders['discount'][orders]])
+        if not len(days):
+            return {}
+        unique, inverse = np.unique(days, return_inverse=True)
+        totals = self._sum_by(inverse, cents, len(unique))
+        return {date.fromordinal(int(day)): from_cents(int(total))
+                for day, total in zip(unique, totals)}
+
+    def top_items(self, limit: int = 10, start: datetime = None, end: datetime = None,
+                  by_revenue: bool = False) -> List[Tuple[str, int, Decimal]]:
+        """
+        畅销商品排行
+        返回: [(商品名称, 杯数, 销售额)]，默认按杯数排序
+        """
+        self.refresh()
+        lines = self._line_mask(start, end)
+        size = len(self._item_names)
+        if not size:
+            return []
+        items = self._lines['item'][lines]
+        quantity = self._sum_by(items, self._lines['quantity'][lines], size)
+        cents = self._sum_by(items, self._lines['cents'][lines], size)
+        key = cents if by_revenue else quantity
+        order = np.argsort(-key, kind='stable')[:limit]
+        return [(self._item_names[i], int(quantity[i]), from_cents(int(cents[i])))
+                for i in order if quantity[i] > 0]
+
+    def topping_attach_rate(self, start: datetime = None, end: datetime = None) -> Dict[str, float]:
+        """各小料的加料率：加了该小料的杯数 / 总杯数"""
+        self.refresh()
+        lines = self._line_mask(start, end)
+        quantity = self._lines['quantity'][lines]
+        total = int(quantity.sum())
+        if not total:
+            return {}
+        masks = self._lines['toppings'][lines]
+        rates = {}
+        for code, name in enumerate(self._topping_names):
+            word, bit = divmod(code, 64)
+            if word >= masks.shape[1]:
+                continue
+            has = ((masks[:, word] >> np.uint64(bit)) & np.uint64(1)).astype(bool)
+            rates[name] = int(quantity[has].sum()) / total
+        return rates
+
+    def sweetness_distribution(self, start: datetime = None,
+                               end: datetime = None) -> Dict[Sweetness, int]:
+        """各甜度的杯数"""
+        self.refresh()
+        lines = self._line_mask(start, end)
+        counts = np.bincount(self._lines['sweetness'][lines],
+                             weights=self._lines['quantity'][lines], minlength=len(Sweetness))
+        return {sweetness: int(counts[code]) for sweetness, code in _SWEETNESS_CODES.items()}
@@ -0,0 +1,193 @@
+"""
+奶茶点单系统 - HTTP API 压力测试脚本
+每个并发客户端保持一条 keep-alive 连接，循环执行浏览菜单、加购、下单等请求
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from api_server import ApiServer
+
+
+class HttpClient:
+    """基于单条 keep-alive 连接的最小 HTTP/1.1 客户端"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self):
+        """建立连接"""
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        """关闭连接"""
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def request(self, method: str, path: str, body: Any = None) -> Tuple[int, dict]:
+        """发送请求并读取 JSON 响应"""
+        if self.writer is None:
+            await self.connect()
+        payload = json.dumps(body).encode('utf-8') if body is not None else b""
+        head = (
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "\r\n"
+        )
+        self.writer.write(head.encode('latin-1') + payload)
+        await self.writer.drain()
+
+        raw_head = await self.reader.readuntil(b'\r\n\r\n')
+        lines = raw_head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split(' ')[1])
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        data = await self.reader.readexactly(int(headers.get('content-length', '0')))
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+            self.writer = None
+        return status, json.loads(data.decode('utf-8')) if data else {}
+
+
+async def prepare(host: str, port: int) -> Tuple[List[str], List[str]]:
+    """准备压测数据：确保至少有一个在售商品和一个小料"""
+    client = HttpClient(host, port)
+    try:
+        _, resp = await client.request('GET', '/api/menu/items')
+        items = [i['item_id'] for i in resp.get('data', [])]
+        if not items:
+            _, resp = await client.request('POST', '/api/menu/items',
+                                           {'name': "压测奶茶", 'price': "12.00", 'category': "压测"})
+            items = [resp['data']['item_id']]
+        _, resp = await client.request('GET', '/api/menu/toppings')
+        toppings = [t['topping_id'] for t in resp.get('data', [])]
+        if not toppings:
+            _, resp = await client.request('POST', '/api/menu/toppings',
+                                           {'name': "压测珍珠", 'extra_price': "2.00"})
+            toppings = [resp['data']['topping_id']]
+        return items, toppings
+    finally:
+        await client.close()
+
+
+async def worker(index: int, host: str, port: int, scenario: str, deadline: float,
+                 items: List[str], toppings: List[str], stats: Dict[str, list]):
+    """单个并发客户端"""
+    client = HttpClient(host, port)
+    rng = random.Random(index)
+    phone = f"199{int(time.time() * 1000) % 100000:05d}{index:04d}"
+
+    async def timed(method: str, path: str, body: Any = None) -> dict:
+        start = time.perf_counter()
+        try:
+            status, resp = await client.request(method, path, body)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            stats['errors'].append(path)
+            client.writer = None
+            return {}
+        stats['latency'].append(time.perf_counter() - start)
+        if status >= 500:
+            stats['errors'].append(path)
+        return resp
+
+    try:
+        resp = await timed('POST', '/api/auth/register', {'nickname': f"压测{index}", 'phone': phone})
+        if not resp.get('ok'):
+            resp = await timed('POST', '/api/auth/login', {'phone': phone})
+        user_id = resp.get('data', {}).get('result', {}).get('user_id')
+        if not user_id:
+            return
+
+        while time.perf_counter() < deadline:
+            if scenario == 'menu':
+                await timed('GET', '/api/menu/items')
+                continue
+            await timed('GET', '/api/menu/items')
+            await timed('POST', f'/api/carts/{user_id}/items', {
+                'item_id': rng.choice(items),
+                'quantity': rng.randint(1, 3),
+                'sweetness': rng.choice(['NONE', 'THREE', 'FIVE', 'SEVEN', 'FULL']),
+                'topping_ids': rng.sample(toppings, k=rng.randint(0, len(toppings))),
+            })
+            if scenario == 'order' or rng.random() < 0.3:
+                resp = await timed('POST', '/api/orders', {'user_id': user_id})
+                if resp.get('ok'):
+                    stats['orders'].append(resp['data']['result']['order_id'])
+    finally:
+        await client.close()
+
+
+def report(stats: Dict[str, list], elapsed: float, concurrency: int):
+    """输出压测结果"""
+    latency = sorted(stats['latency'])
+    total = len(latency)
+    print(f"并发连接数: {concurrency}")
+    print(f"持续时间: {elapsed:.2f} 秒")
+    print(f"请求总数: {total}，错误: {len(stats['errors'])}，下单成功: {len(stats['orders'])}")
+    if not total:
+        return
+    print(f"吞吐量: {total / elapsed:.1f} 请求/秒")
+
+    def pct(p: float) -> float:
+        return latency[min(total - 1, int(total * p))] * 1000
+
+    print(f"延迟(ms): 平均 {statistics.mean(latency) * 1000:.2f}, "
+          f"P50 {pct(0.50):.2f}, P95 {pct(0.95):.2f}, P99 {pct(0.99):.2f}, 最大 {latency[-1] * 1000:.2f}")
+
+
+async def run(args):
+    """执行压测"""
+    server = None
+    host, port = args.host, args.port
+    if args.spawn:
+        server = ApiServer(host='127.0.0.1', port=0)
+        await server.start()
+        host, port = server.host, server.port
+        print(f"已在本进程启动 API 服务: http://{host}:{port}")
+
+    try:
+        items, toppings = await prepare(host, port)
+        stats = {'latency': [], 'errors': [], 'orders': []}
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(
+            worker(i, host, port, args.scenario, deadline, items, toppings, stats)
+            for i in range(args.concurrency)
+        ))
+        report(stats, time.perf_counter() - start, args.concurrency)
+    finally:
+        if server is not None:
+            await server.close()
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="奶茶点单系统 HTTP API 压力测试")
+    parser.add_argument('--host', default='127.0.0.1', help="API 服务地址")
+    parser.add_argument('--port', type=int, default=8080, help="API 服务端口")
+    parser.add_argument('--concurrency', type=int, default=32, help="并发连接数")
+    parser.add_argument('--duration', type=float, default=10.0, help="持续时间（秒）")
+    parser.add_argument('--scenario', choices=['menu', 'mixed', 'order'], default='mixed',
+                        help="menu=只读浏览, mixed=浏览+加购+30%%下单, order=每轮都下单")
+    parser.add_argument('--spawn', action='store_true', help="在本进程内启动一个本地 API 实例")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
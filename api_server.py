@@ -0,0 +1,764 @@
+"""
+奶茶点单系统 - HTTP/JSON API 服务
+基于 asyncio 的轻量级 HTTP/1.1 服务，供自助点单机和小程序前端调用
+"""
+
+import argparse
+import asyncio
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+from uuid import UUID
+
+from models import OrderStatus, PromotionRule, RuleType, Sweetness
+from repositories import (
+    UserRepository, MenuRepository, MenuItemRepository,
+    OrderRepository, CartRepository, ReviewRepository,
+    FavoriteRepository, PromotionRepository, ToppingRepository,
+    VersionConflictError
+)
+from cart_store import SessionCartStore
+from services import (
+    AuthService, MenuService, CartService, OrderService,
+    ReviewService, FavoriteService, PromotionService
+)
+
+
+MAX_HEADER_SIZE = 64 * 1024
+MAX_BODY_SIZE = 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 15.0
+
+
+class ApiError(Exception):
+    """API 错误，携带 HTTP 状态码"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+@dataclass
+class Request:
+    """已解析的 HTTP 请求"""
+    method: str
+    path: str
+    query: Dict[str, str] = field(default_factory=dict)
+    headers: Dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+    params: Dict[str, str] = field(default_factory=dict)
+
+    def json(self) -> dict:
+        """解析 JSON 请求体"""
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ApiError(400, f"请求体不是合法的JSON: {e}") from e
+        if not isinstance(data, dict):
+            raise ApiError(400, "请求体必须是JSON对象")
+        return data
+
+
+def _parse_uuid(value: Any, name: str) -> UUID:
+    """解析 UUID 参数"""
+    try:
+        return UUID(str(value))
+    except (TypeError, ValueError) as e:
+        raise ApiError(400, f"参数 {name} 不是合法的ID") from e
+
+
+def _parse_decimal(value: Any, name: str) -> Decimal:
+    """解析金额参数"""
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, ValueError) as e:
+        raise ApiError(400, f"参数 {name} 不是合法的金额") from e
+
+
+def _parse_datetime(value: Any, name: str) -> datetime:
+    """解析 ISO 格式时间参数"""
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError as e:
+        raise ApiError(400, f"参数 {name} 不是合法的时间") from e
+
+
+def _parse_date(value: Any, name: str) -> Optional[date]:
+    """解析 ISO 格式日期参数（可为空）"""
+    if value in (None, ""):
+        return None
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError as e:
+        raise ApiError(400, f"参数 {name} 不是合法的日期") from e
+
+
+def _parse_enum(enum_class, value: Any, name: str):
+    """按名称或取值解析枚举（如 READY 或 待取餐）"""
+    for member in enum_class:
+        if value in (member.name, member.value):
+            return member
+    raise ApiError(400, f"参数 {name} 取值无效: {value}")
+
+
+def _parse_rules(value: Any) -> List[PromotionRule]:
+    """解析促销规则列表，rule_type 可用名称或取值"""
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(isinstance(r, dict) for r in value):
+        raise ApiError(400, "参数 rules 必须是对象数组")
+    rules = []
+    for data in value:
+        data = dict(data)
+        data['rule_type'] = _parse_enum(RuleType, data.get('rule_type'), 'rule_type')
+        try:
+            rules.append(PromotionRule.from_dict(data))
+        except TypeError as e:
+            raise ApiError(400, f"促销规则字段无效: {e}") from e
+    return rules
+
+
+def _require(data: dict, name: str) -> Any:
+    """获取必填字段"""
+    if data.get(name) in (None, ""):
+        raise ApiError(400, f"缺少参数 {name}")
+    return data[name]
+
+
+def _optional(data: dict, name: str, expected: type, label: str) -> Any:
+    """获取可选字段并检查类型，缺省为 None"""
+    value = data.get(name)
+    if value is not None and not isinstance(value, expected):
+        raise ApiError(400, f"{name} 必须是{label}")
+    return value
+
+
+def _flag(value: Optional[str]) -> bool:
+    """解析查询字符串中的布尔开关"""
+    return value is not None and value.lower() in ('1', 'true', 'yes')
+
+
+def _serialize(obj: Any) -> Any:
+    """将领域对象转换为可 JSON 序列化的结构"""
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    if isinstance(obj, (list, tuple)):
+        return [_serialize(o) for o in obj]
+    if isinstance(obj, dict):
+        return {k: _serialize(v) for k, v in obj.items()}
+    if hasattr(obj, 'to_dict'):
+        data = obj.to_dict()
+        if hasattr(obj, 'total_amount'):
+            data['total_amount'] = str(obj.total_amount())
+        elif hasattr(obj, 'total'):
+            data['total'] = str(obj.total())
+        return data
+    return str(obj)
+
+
+class ServiceContainer:
+    """
+    服务容器
+    所有服务共享同一组仓储实例，保证各接口看到一致的内存数据
+    """
+
+    def __init__(self):
+        self.user_repo = UserRepository()
+        self.menu_repo = MenuRepository()
+        self.item_repo = MenuItemRepository()
+        self.topping_repo = ToppingRepository()
+        # 购物车保存在内存会话中，修改由后台线程异步写入 carts.json，重启后恢复
+        self.cart_store = SessionCartStore(persist_repo=CartRepository())
+        self.order_repo = OrderRepository()
+        self.review_repo = ReviewRepository()
+        self.favorite_repo = FavoriteRepository()
+        self.promotion_repo = PromotionRepository()
+
+        self.auth_service = AuthService(self.user_repo)
+        self.menu_service = MenuService(self.menu_repo, self.item_repo, self.topping_repo)
+        self.cart_service = CartService(self.cart_store, self.item_repo, self.topping_repo)
+        self.promotion_service = PromotionService(self.promotion_repo)
+        self.order_service = OrderService(self.order_repo, self.cart_service,
+                                          promotion_service=self.promotion_service)
+        self.review_service = ReviewService(self.review_repo)
+        self.favorite_service = FavoriteService(self.favorite_repo, self.item_repo)
+
+
+Handler = Callable[[Request], Tuple[int, Any]]
+
+
+class ApiApplication:
+    """API 路由与业务处理"""
+
+    def __init__(self, services: ServiceContainer = None):
+        self.services = services or ServiceContainer()
+        self._routes: List[Tuple[str, re.Pattern, Handler]] = []
+        self._register_routes()
+
+    def route(self, method: str, pattern: str, handler: Handler):
+        """注册路由，pattern 中的 {name} 为路径参数"""
+        regex = re.sub(r'{(\w+)}', r'(?P<\1>[^/]+)', pattern)
+        self._routes.append((method, re.compile(f'^{regex}$'), handler))
+
+    def _register_routes(self):
+        """注册全部接口"""
+        self.route('GET', '/api/health', self.health)
+        # 用户
+        self.route('POST', '/api/auth/register', self.register)
+        self.route('POST', '/api/auth/login', self.login)
+        # 菜单
+        self.route('GET', '/api/menu/catalog', self.get_catalog)
+        self.route('GET', '/api/menu/items', self.list_items)
+        self.route('POST', '/api/menu/items', self.create_item)
+        self.route('GET', '/api/menu/search', self.search_items)
+        self.route('GET', '/api/menu/items/{item_id}', self.get_item)
+        self.route('PATCH', '/api/menu/items/{item_id}', self.update_item)
+        self.route('DELETE', '/api/menu/items/{item_id}', self.delete_item)
+        self.route('POST', '/api/menu/items/{item_id}/sold_out', self.mark_sold_out)
+        self.route('GET', '/api/menu/toppings', self.list_toppings)
+        self.route('POST', '/api/menu/toppings', self.create_topping)
+        self.route('DELETE', '/api/menu/toppings/{topping_id}', self.delete_topping)
+        # 购物车
+        self.route('GET', '/api/carts/{user_id}', self.get_cart)
+        self.route('DELETE', '/api/carts/{user_id}', self.clear_cart)
+        self.route('GET', '/api/carts/{user_id}/quote', self.quote_cart)
+        self.route('POST', '/api/carts/{user_id}/items', self.add_to_cart)
+        self.route('DELETE', '/api/carts/{user_id}/items/{order_item_id}', self.remove_from_cart)
+        # 订单
+        self.route('GET', '/api/orders', self.list_orders)
+        self.route('POST', '/api/orders', self.place_order)
+        self.route('GET', '/api/orders/{order_id}', self.get_order)
+        self.route('POST', '/api/orders/{order_id}/status', self.update_status)
+        self.route('POST', '/api/orders/{order_id}/cancel', self.cancel_order)
+        self.route('GET', '/api/reports/sales', self.sales_report)
+        # 评价
+        self.route('GET', '/api/reviews', self.list_reviews)
+        self.route('POST', '/api/reviews', self.create_review)
+        self.route('POST', '/api/reviews/{review_id}/reply', self.reply_review)
+        # 收藏
+        self.route('GET', '/api/favorites/{user_id}', self.list_favorites)
+        self.route('POST', '/api/favorites/{user_id}', self.add_favorite)
+        self.route('DELETE', '/api/favorites/{user_id}/{item_id}', self.remove_favorite)
+        # 促销
+        self.route('GET', '/api/promotions', self.list_promotions)
+        self.route('POST', '/api/promotions', self.create_promotion)
+        self.route('PATCH', '/api/promotions/{promotion_id}', self.update_promotion)
+        self.route('DELETE', '/api/promotions/{promotion_id}', self.delete_promotion)
+
+    def dispatch(self, request: Request) -> Tuple[int, dict]:
+        """
+        分发请求（在工作线程中执行）
+        返回: (HTTP状态码, 响应JSON)
+        """
+        allowed = False
+        for method, regex, handler in self._routes:
+            match = regex.match(request.path)
+            if not match:
+                continue
+            if method != request.method:
+                allowed = True
+                continue
+            request.params = match.groupdict()
+            try:
+                status, data = handler(request)
+            except ApiError as e:
+                return e.status, {'ok': False, 'error': e.message}
+            except VersionConflictError as e:
+                return 409, {'ok': False, 'error': str(e)}
+            except ValueError as e:
+                return 400, {'ok': False, 'error': str(e)}
+            except Exception as e:  # pylint: disable=broad-except
+                return 500, {'ok': False, 'error': f"服务器内部错误: {e}"}
+            if status >= 400:
+                return status, {'ok': False, 'error': data}
+            return status, {'ok': True, 'data': _serialize(data)}
+        if allowed:
+            return 405, {'ok': False, 'error': "请求方法不被允许"}
+        return 404, {'ok': False, 'error': "接口不存在"}
+
+    @staticmethod
+    def _version(data: dict) -> Optional[int]:
+        """读取请求体中的乐观锁版本号"""
+        version = data.get('version')
+        if version is not None and not isinstance(version, int):
+            raise ApiError(400, "version 必须是整数")
+        return version
+
+    @staticmethod
+    def _result(success: bool, message: str, data: Any = None,
+                error_status: int = 400) -> Tuple[int, Any]:
+        """将服务层 (是否成功, 消息, 对象) 返回值转换为响应"""
+        if not success:
+            return error_status, message
+        return 200, {'message': message, 'result': data} if data is not None else {'message': message}
+
+    # 系统
+
+    def health(self, request: Request):
+        """健康检查"""
+        return 200, {'status': 'ok', 'time': datetime.now().isoformat()}
+
+    # 用户
+
+    def register(self, request: Request):
+        """注册"""
+        data = request.json()
+        success, message, user = self.services.auth_service.register(
+            str(data.get('nickname', '')), str(data.get('phone', '')))
+        return self._result(success, message, user)
+
+    def login(self, request: Request):
+        """
+        登录
+        API 无会话状态，直接查询用户，由客户端在后续请求中携带 user_id
+        """
+        phone = str(_require(request.json(), 'phone'))
+        user = self.services.auth_service.user_repo.find_by_phone(phone)
+        if not user:
+            return 404, "用户不存在"
+        return 200, {'message': "登录成功", 'result': user}
+
+    # 菜单
+
+    def list_items(self, request: Request):
+        """菜单列表，?all=1 时包含售罄商品"""
+        if _flag(request.query.get('all')):
+            return 200, self.services.menu_service.list_all_items()
+        return 200, self.services.menu_service.list_items()
+
+    def get_catalog(self, request: Request):
+        """按分类分组的在售菜单目录"""
+        return 200, self.services.menu_service.catalog()
+
+    def search_items(self, request: Request):
+        """检索菜单：?q= 关键字/拼音首字母，?category= 分类，?all=1 包含售罄"""
+        query = request.query.get('q', '')
+        include_sold_out = _flag(request.query.get('all'))
+        menu_service = self.services.menu_service
+        return 200, {
+            'items': menu_service.search_items(query, request.query.get('category'), include_sold_out),
+            'facets': menu_service.category_facets(query, include_sold_out),
+        }
+
+    def get_item(self, request: Request):
+        """菜单项详情"""
+        item = self.services.menu_service.get_item(_parse_uuid(request.params['item_id'], 'item_id'))
+        if not item:
+            return 404, "商品不存在"
+        return 200, item
+
+    def create_item(self, request: Request):
+        """创建菜单项"""
+        data = request.json()
+        item = self.services.menu_service.create_item(
+            name=str(_require(data, 'name')),
+            price=_parse_decimal(_require(data, 'price'), 'price'),
+            category=str(data.get('category', '')),
+            allow_toppings=bool(data.get('allow_toppings', True)),
+            description=str(data.get('description', ''))
+        )
+        return 201, item
+
+    def update_item(self, request: Request):
+        """更新菜单项，可携带 version 做并发冲突检测"""
+        data = request.json()
+        price = data.get('price')
+        item = self.services.menu_service.update_item(
+            _parse_uuid(request.params['item_id'], 'item_id'),
+            name=_optional(data, 'name', str, "字符串"),
+            price=_parse_decimal(price, 'price') if price is not None else None,
+            category=_optional(data, 'category', str, "字符串"),
+            allow_toppings=_optional(data, 'allow_toppings', bool, "布尔值"),
+            description=_optional(data, 'description', str, "字符串"),
+            expected_version=self._version(data)
+        )
+        if not item:
+            return 404, "商品不存在"
+        return 200, item
+
+    def delete_item(self, request: Request):
+        """删除菜单项"""
+        if not self.services.menu_service.delete_item(_parse_uuid(request.params['item_id'], 'item_id')):
+            return 404, "商品不存在"
+        return 200, {'message': "已删除"}
+
+    def mark_sold_out(self, request: Request):
+        """标记售罄"""
+        is_sold_out = bool(request.json().get('is_sold_out', True))
+        item_id = _parse_uuid(request.params['item_id'], 'item_id')
+        if not self.services.menu_service.mark_sold_out(item_id, is_sold_out):
+            return 404, "商品不存在"
+        return 200, self.services.menu_service.get_item(item_id)
+
+    def list_toppings(self, request: Request):
+        """小料列表"""
+        return 200, self.services.menu_service.list_toppings()
+
+    def create_topping(self, request: Request):
+        """创建小料"""
+        data = request.json()
+        topping = self.services.menu_service.create_topping(
+            str(_require(data, 'name')),
+            _parse_decimal(_require(data, 'extra_price'), 'extra_price'))
+        return 201, topping
+
+    def delete_topping(self, request: Request):
+        """删除小料"""
+        topping_id = _parse_uuid(request.params['topping_id'], 'topping_id')
+        if not self.services.menu_service.delete_topping(topping_id):
+            return 404, "小料不存在"
+        return 200, {'message': "已删除"}
+
+    # 购物车
+
+    def _cart_or_empty(self, user_id: UUID):
+        """用户的购物车；没有时返回空购物车的数据，不在会话存储中创建购物车"""
+        cart = self.services.cart_service.get_cart(user_id)
+        if cart is not None:
+            return cart
+        return {'cart_id': None, 'user_id': str(user_id), 'items': [], 'version': 0, 'total': "0.00"}
+
+    def get_cart(self, request: Request):
+        """获取购物车"""
+        user_id = _parse_uuid(request.params['user_id'], 'user_id')
+        return 200, self._cart_or_empty(user_id)
+
+    def add_to_cart(self, request: Request):
+        """添加商品到购物车"""
+        data = request.json()
+        user_id = _parse_uuid(request.params['user_id'], 'user_id')
+        quantity = data.get('quantity', 1)
+        if not isinstance(quantity, int) or quantity <= 0:
+            raise ApiError(400, "数量必须是正整数")
+        sweetness = Sweetness.FIVE
+        if data.get('sweetness') is not None:
+            sweetness = _parse_enum(Sweetness, data['sweetness'], 'sweetness')
+        topping_ids = [_parse_uuid(t, 'topping_ids') for t in data.get('topping_ids') or []]
+        success, message = self.services.cart_service.add_to_cart(
+            user_id, _parse_uuid(_require(data, 'item_id'), 'item_id'),
+            quantity, sweetness, topping_ids, str(data.get('remark', '')))
+        return self._result(success, message, self.services.cart_service.get_cart(user_id))
+
+    def remove_from_cart(self, request: Request):
+        """从购物车移除商品"""
+        user_id = _parse_uuid(request.params['user_id'], 'user_id')
+        order_item_id = _parse_uuid(request.params['order_item_id'], 'order_item_id')
+        if not self.services.cart_service.remove_from_cart(user_id, order_item_id):
+            return 404, "购物车不存在"
+        return 200, self._cart_or_empty(user_id)
+
+    def quote_cart(self, request: Request):
+        """按当前生效促销为购物车计价"""
+        user_id = _parse_uuid(request.params['user_id'], 'user_id')
+        cart = self.services.cart_service.get_cart(user_id)
+        return 200, self.services.promotion_service.quote(cart.items if cart else [])
+
+    def clear_cart(self, request: Request):
+        """清空购物车"""
+        user_id = _parse_uuid(request.params['user_id'], 'user_id')
+        self.services.cart_service.clear_cart(user_id)
+        return 200, {'message': "购物车已清空"}
+
+    # 订单
+
+    def list_orders(self, request: Request):
+        """订单列表，?user_id= 时只返回该用户的订单，?code= 按取餐码/订单号前缀查找"""
+        if request.query.get('code'):
+            return 200, self.services.order_service.find_by_code(request.query['code'])
+        user_id = request.query.get('user_id')
+        if user_id:
+            return 200, self.services.order_service.list_orders(_parse_uuid(user_id, 'user_id'))
+        return 200, self.services.order_service.list_orders()
+
+    def place_order(self, request: Request):
+        """下单，支持 Idempotency-Key 请求头（或请求体 idempotency_key）防止重试重复下单"""
+        data = request.json()
+        idempotency_key = request.headers.get('idempotency-key') or data.get('idempotency_key')
+        success, message, order = self.services.order_service.place_order(
+            _parse_uuid(_require(data, 'user_id'), 'user_id'), str(data.get('remark', '')),
+            str(idempotency_key) if idempotency_key else None)
+        if not success:
+            return 400, message
+        return 201, {'message': message, 'result': order}
+
+    def get_order(self, request: Request):
+        """订单详情"""
+        order = self.services.order_service.get_order(_parse_uuid(request.params['order_id'], 'order_id'))
+        if not order:
+            return 404, "订单不存在"
+        return 200, order
+
+    def update_status(self, request: Request):
+        """更新订单状态，可携带 version 做并发冲突检测"""
+        data = request.json()
+        status = _parse_enum(OrderStatus, _require(data, 'status'), 'status')
+        order_id = _parse_uuid(request.params['order_id'], 'order_id')
+        if not self.services.order_service.get_order(order_id):
+            return 404, "订单不存在"
+        success, message = self.services.order_service.update_status(
+            order_id, status, self._version(data))
+        return self._result(success, message, error_status=409)
+
+    def cancel_order(self, request: Request):
+        """取消订单"""
+        order_id = _parse_uuid(request.params['order_id'], 'order_id')
+        success, message = self.services.order_service.cancel_order(order_id)
+        return self._result(success, message, error_status=404)
+
+    def sales_report(self, request: Request):
+        """销售汇总，?by=day|hour|item，?start=&end= 为日期范围（含首尾）"""
+        start = _parse_date(request.query.get('start'), 'start')
+        end = _parse_date(request.query.get('end'), 'end')
+        by = request.query.get('by', 'day')
+        order_service = self.services.order_service
+        if by == 'day':
+            return 200, order_service.daily_sales(start, end)
+        if by == 'hour':
+            return 200, order_service.hourly_sales(start, end)
+        if by == 'item':
+            return 200, order_service.item_sales(start, end)
+        raise ApiError(400, f"参数 by 取值无效: {by}")
+
+    # 评价
+
+    def list_reviews(self, request: Request):
+        """评价列表"""
+        user_id = request.query.get('user_id')
+        if user_id:
+            return 200, self.services.review_service.list_reviews(_parse_uuid(user_id, 'user_id'))
+        return 200, self.services.review_service.list_reviews()
+
+    def create_review(self, request: Request):
+        """创建评价"""
+        data = request.json()
+        rating = data.get('rating', 5)
+        if not isinstance(rating, int):
+            raise ApiError(400, "评分必须是整数")
+        success, message, review = self.services.review_service.create_review(
+            _parse_uuid(_require(data, 'user_id'), 'user_id'),
+            _parse_uuid(_require(data, 'order_id'), 'order_id'),
+            rating, str(data.get('content', '')))
+        return self._result(success, message, review)
+
+    def reply_review(self, request: Request):
+        """回复评价"""
+        review_id = _parse_uuid(request.params['review_id'], 'review_id')
+        success, message = self.services.review_service.reply_review(
+            review_id, str(_require(request.json(), 'reply')))
+        return self._result(success, message, error_status=404)
+
+    # 收藏
+
+    def list_favorites(self, request: Request):
+        """收藏列表，?items=1 时一并返回对应的菜单项"""
+        user_id = _parse_uuid(request.params['user_id'], 'user_id')
+        if _flag(request.query.get('items')):
+            return 200, self.services.favorite_service.list_favorite_items(user_id)
+        return 200, self.services.favorite_service.list_favorites(user_id)
+
+    def add_favorite(self, request: Request):
+        """添加收藏"""
+        user_id = _parse_uuid(request.params['user_id'], 'user_id')
+        item_id = _parse_uuid(_require(request.json(), 'item_id'), 'item_id')
+        success, message = self.services.favorite_service.add_favorite(user_id, item_id)
+        return self._result(success, message, error_status=409)
+
+    def remove_favorite(self, request: Request):
+        """取消收藏"""
+        user_id = _parse_uuid(request.params['user_id'], 'user_id')
+        item_id = _parse_uuid(request.params['item_id'], 'item_id')
+        success, message = self.services.favorite_service.remove_favorite(user_id, item_id)
+        return self._result(success, message, error_status=404)
+
+    # 促销
+
+    def list_promotions(self, request: Request):
+        """促销列表，?all=1 时包含已失效的促销"""
+        if _flag(request.query.get('all')):
+            return 200, self.services.promotion_service.list_all_promotions()
+        return 200, self.services.promotion_service.list_active_promotions()
+
+    def create_promotion(self, request: Request):
+        """创建促销"""
+        data = request.json()
+        promotion = self.services.promotion_service.create_promotion(
+            str(_require(data, 'title')), str(data.get('content', '')),
+            _parse_datetime(_require(data, 'start_at'), 'start_at'),
+            _parse_datetime(_require(data, 'end_at'), 'end_at'),
+            _parse_rules(data.get('rules')))
+        return 201, promotion
+
+    def update_promotion(self, request: Request):
+        """更新促销"""
+        data = request.json()
+        promotion = self.services.promotion_service.update_promotion(
+            _parse_uuid(request.params['promotion_id'], 'promotion_id'),
+            title=data.get('title'), content=data.get('content'),
+            is_active=data.get('is_active'))
+        if not promotion:
+            return 404, "促销不存在"
+        return 200, promotion
+
+    def delete_promotion(self, request: Request):
+        """删除促销"""
+        promotion_id = _parse_uuid(request.params['promotion_id'], 'promotion_id')
+        if not self.services.promotion_service.delete_promotion(promotion_id):
+            return 404, "促销不存在"
+        return 200, {'message': "已删除"}
+
+
+class ApiServer:
+    """
+    asyncio HTTP/1.1 服务器
+    支持 keep-alive 长连接，每个请求在线程池中执行业务逻辑
+    """
+
+    def __init__(self, app: ApiApplication = None, host: str = '127.0.0.1',
+                 port: int = 8080, workers: int = 8):
+        self.app = app or ApiApplication()
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api')
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections = set()
+
+    async def start(self):
+        """启动监听；port 为 0 时自动分配端口"""
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, limit=MAX_HEADER_SIZE)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        """启动并持续运行"""
+        if self._server is None:
+            await self.start()
+        print(f"API 服务已启动: http://{self.host}:{self.port}")
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        """关闭服务器"""
+        if self._server is not None:
+            self._server.close()
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+        self.executor.shutdown(wait=False)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter):
+        """处理一个连接上的多个请求（keep-alive）"""
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    request, keep_alive = await asyncio.wait_for(
+                        self._read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except ApiError as e:
+                    await self._write_response(writer, e.status, {'ok': False, 'error': e.message}, False)
+                    break
+                if request is None:
+                    break
+
+                loop = asyncio.get_running_loop()
+                status, payload = await loop.run_in_executor(self.executor, self.app.dispatch, request)
+                await self._write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            # 对端断开，或服务关闭时取消空闲连接
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Tuple[Optional[Request], bool]:
+        """读取并解析一个请求；连接正常关闭时返回 (None, False)"""
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None, False
+            raise
+        except asyncio.LimitOverrunError as e:
+            raise ApiError(431, "请求头过大") from e
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ', 2)
+        except ValueError as e:
+            raise ApiError(400, "请求行格式错误") from e
+
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', '0'))
+        except ValueError as e:
+            raise ApiError(400, "Content-Length 格式错误") from e
+        if length < 0 or length > MAX_BODY_SIZE:
+            raise ApiError(413, "请求体过大")
+        body = await reader.readexactly(length) if length else b""
+
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            keep_alive = connection != 'close'
+        else:
+            keep_alive = connection == 'keep-alive'
+
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query))
+        return Request(method.upper(), url.path.rstrip('/') or '/', query, headers, body), keep_alive
+
+    @staticmethod
+    async def _write_response(writer: asyncio.StreamWriter, status: int,
+                              payload: dict, keep_alive: bool):
+        """写出 JSON 响应"""
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        reason = HTTPStatus(status).phrase
+        head = (
+            f"HTTP/1.1 {status} {reason}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="奶茶点单系统 HTTP API 服务")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址")
+    parser.add_argument('--port', type=int, default=8080, help="监听端口")
+    parser.add_argument('--workers', type=int, default=8, help="业务线程数")
+    args = parser.parse_args()
+
+    server = ApiServer(host=args.host, port=args.port, workers=args.workers)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("API 服务已停止")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+奶茶点单系统 - 服务装配
+各前端（启动器、顾客端、管理员端、命令行）共用的一组服务，首次访问时才导入服务层并加载数据。
+同一进程中打开的多个窗口共享同一组仓储，数据只加载一次，彼此的修改也立即可见
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+
+def _shared(factory: Callable):
+    """按需创建的共享服务：首次访问时在锁内创建并缓存，之后直接返回同一对象"""
+    name = factory.__name__
+
+    def getter(self):
+        service = self.__dict__.get(name)
+        if service is None:
+            with self._lock:
+                service = self.__dict__.get(name)
+                if service is None:
+                    service = self.__dict__[name] = factory(self)
+        return service
+
+    return property(getter, doc=factory.__doc__)
+
+
+def service_property(name: str) -> property:
+    """界面类的服务属性：转发到 self.services 上的同名服务，首次访问时才创建"""
+    return property(lambda self: getattr(self.services, name))
+
+
+class AppServices:
+    """
+    共享服务容器
+    可在后台线程调用 warm_up() 预先加载，界面线程之后访问各服务时不再读盘
+    """
+
+    def __init__(self):
+        # 可重入：创建订单服务时会再取购物车服务和促销服务
+        self._lock = threading.RLock()
+        self.warm_up_seconds: Optional[float] = None
+
+    # pylint: disable=import-outside-toplevel
+
+    @_shared
+    def auth_service(self):
+        """用户认证服务"""
+        from services import AuthService
+        return AuthService()
+
+    @_shared
+    def menu_service(self):
+        """菜单管理服务"""
+        from services import MenuService
+        return MenuService()
+
+    @_shared
+    def cart_service(self):
+        """购物车服务，与菜单服务共用菜单项和小料仓储"""
+        from services import CartService
+        return CartService(item_repo=self.menu_service.item_repo,
+                           topping_repo=self.menu_service.topping_repo)
+
+    @_shared
+    def promotion_service(self):
+        """促销服务"""
+        from services import PromotionService
+        return PromotionService()
+
+    @_shared
+    def order_service(self):
+        """订单服务"""
+        from services import OrderService
+        return OrderService(cart_service=self.cart_service,
+                            promotion_service=self.promotion_service)
+
+    @_shared
+    def review_service(self):
+        """评价服务"""
+        from services import ReviewService
+        return ReviewService()
+
+    @_shared
+    def favorite_service(self):
+        """收藏服务，与菜单服务共用菜单项仓储"""
+        from services import FavoriteService
+        return FavoriteService(item_repo=self.menu_service.item_repo)
+
+    # pylint: enable=import-outside-toplevel
+
+    def warm_up(self) -> float:
+        """创建全部服务并构建菜单目录和促销生效集合，返回耗时（秒）"""
+        started = time.perf_counter()
+        for name in ('auth_service', 'menu_service', 'cart_service', 'promotion_service',
+                     'order_service', 'review_service', 'favorite_service'):
+            getattr(self, name)
+        self.menu_service.catalog()
+        self.promotion_service.list_active_promotions()
+        self.warm_up_seconds = time.perf_counter() - started
+        return self.warm_up_seconds
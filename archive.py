@@ -0,0 +1,200 @@
+"""
+奶茶点单系统 - 订单归档
+把超过保留期的已完成、已取消订单从订单仓储移入按月分段的压缩归档
+（data/archive/orders/orders-YYYY-MM.jsonl.gz），热数据只保留近期和进行中的订单。
+归档段带有清单（各段的订单数、时间范围和用户），查询历史时只解压可能命中的段。
+
+用法:
+    python archive.py --days 90
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+from uuid import UUID
+
+from models import Order, OrderStatus
+from repositories import file_lock, write_json_atomic
+
+# 默认保留期：超过该天数的已结束订单会被归档
+ARCHIVE_AFTER_DAYS = 90
+
+# 可以归档的订单状态
+FINISHED = (OrderStatus.COMPLETED, OrderStatus.CANCELLED)
+
+
+@dataclass
+class ArchiveResult:
+    """一次归档的结果"""
+    archived: int = 0
+    segments: List[str] = field(default_factory=list)
+
+
+class OrderArchive:
+    """
+    订单归档段
+    每月一个 gzip 压缩的 JSONL 文件；写入在跨进程文件锁内进行，先写临时文件再原子替换。
+    清单 manifest.json 记录各段的订单数、最早/最晚下单时间和用户ID，用于跳过无关的段
+    """
+
+    def __init__(self, directory: Path = None):
+        self.directory = directory or Path(__file__).parent / 'data' / 'archive' / 'orders'
+        self.manifest_path = self.directory / 'manifest.json'
+        self.lock_path = self.directory / 'archive.lock'
+        self._manifest: Optional[Dict[str, dict]] = None
+        self._manifest_mtime: Optional[int] = None
+
+    @staticmethod
+    def segment_name(moment: datetime) -> str:
+        """订单所在的归档段（按下单月份）"""
+        return f"orders-{moment:%Y-%m}.jsonl.gz"
+
+    def manifest(self) -> Dict[str, dict]:
+        """归档清单；文件变化后重新读取"""
+        try:
+            mtime = self.manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if self._manifest is None or mtime != self._manifest_mtime:
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    self._manifest = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"加载数据失败 {self.manifest_path}: {e}")
+                self._manifest = {}
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def __len__(self) -> int:
+        return sum(entry['orders'] for entry in self.manifest().values())
+
+    def _read_segment(self, name: str) -> Iterator[Order]:
+        """逐行解压、解析一个归档段"""
+        path = self.directory / name
+        if not path.exists():
+            return
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield Order.from_dict(json.loads(line))
+
+    def iter_segment(self, name: str) -> Iterator[Order]:
+        """读取一个归档段的全部订单（增量同步归档的消费者按清单条目变化重新读取）"""
+        return self._read_segment(name)
+
+    def _write_segment(self, name: str, orders: Iterable[Order]) -> dict:
+        """原子地写出一个归档段，返回其清单条目"""
+        path = self.directory / name
+        tmp_path = path.with_name(path.name + '.tmp')
+        count, first, last, users = 0, None, None, set()
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            for order in orders:
+                f.write(json.dumps(order.to_dict(), ensure_ascii=False))
+                f.write('\n')
+                count += 1
+                first = order.created_at if first is None else min(first, order.created_at)
+                last = order.created_at if last is None else max(last, order.created_at)
+                if order.user_id:
+                    users.add(str(order.user_id))
+        os.replace(tmp_path, path)
+        return {'orders': count, 'first': first.isoformat() if first else None,
+                'last': last.isoformat() if last else None, 'users': sorted(users)}
+
+    def add(self, orders: List[Order]) -> List[str]:
+        """
+        把订单并入对应月份的归档段（按订单ID去重，新数据优先），返回写过的段名
+        归档段和清单都写好之后调用方才能从热数据中删除这些订单
+        """
+        by_segment: Dict[str, Dict[UUID, Order]] = {}
+        for order in orders:
+            by_segment.setdefault(self.segment_name(order.created_at), {})[order.order_id] = order
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.lock_path):
+            manifest = dict(self.manifest())
+            for name, incoming in sorted(by_segment.items()):
+                existing = [o for o in self._read_segment(name) if o.order_id not in incoming]
+                merged = sorted(existing + list(incoming.values()), key=lambda o: o.created_at)
+                manifest[name] = self._write_segment(name, merged)
+            write_json_atomic(self.manifest_path, manifest)
+        return sorted(by_segment)
+
+    def iter_orders(self, start: datetime = None, end: datetime = None,
+                    user_id: UUID = None) -> Iterator[Order]:
+        """
+        按时间顺序惰性读取归档订单，可按 [start, end) 和用户过滤；
+        清单中时间范围或用户不匹配的段直接跳过，不解压
+        """
+        user_key = str(user_id) if user_id else None
+        for name, entry in sorted(self.manifest().items()):
+            if not entry.get('orders'):
+                continue
+            if start and datetime.fromisoformat(entry['last']) < start:
+                continue
+            if end and datetime.fromisoformat(entry['first']) >= end:
+                continue
+            if user_key and user_key not in entry.get('users', ()):
+                continue
+            for order in self._read_segment(name):
+                if start and order.created_at < start:
+                    continue
+                if end and order.created_at >= end:
+                    continue
+                if user_id and order.user_id != user_id:
+                    continue
+                yield order
+
+    def find_by_user(self, user_id: UUID) -> List[Order]:
+        """用户的归档订单，按下单时间倒序"""
+        return sorted(self.iter_orders(user_id=user_id), key=lambda o: o.created_at, reverse=True)
+
+    def find_by_id(self, order_id: UUID) -> Optional[Order]:
+        """按订单ID查找（需要逐段扫描，只在热数据中找不到时使用）"""
+        for name in sorted(self.manifest(), reverse=True):
+            for order in self._read_segment(name):
+                if order.order_id == order_id:
+                    return order
+        return None
+
+
+def archive_orders(order_repo, archive: OrderArchive = None, older_than: timedelta = None,
+                   now: datetime = None) -> ArchiveResult:
+    """
+    归档早于 now - older_than 的已完成、已取消订单
+    先写归档段再从热数据批量删除；中途失败时订单可能同时存在于两处，查询时以热数据为准
+    """
+    archive = archive or OrderArchive()
+    if older_than is None:
+        older_than = timedelta(days=ARCHIVE_AFTER_DAYS)
+    cutoff = (now or datetime.now()) - older_than
+    candidates = [order for order in order_repo.find_by_time_range(end=cutoff)
+                  if order.status in FINISHED]
+    if not candidates:
+        return ArchiveResult()
+    segments = archive.add(candidates)
+    order_repo.delete_many([order.order_id for order in candidates])
+    order_repo.flush()
+    return ArchiveResult(len(candidates), segments)
+
+
+def main(argv: List[str] = None) -> int:
+    """命令行入口"""
+    from repositories import OrderRepository  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(description="奶茶点单系统订单归档")
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                        help=f"归档早于多少天的已结束订单（默认 {ARCHIVE_AFTER_DAYS}）")
+    args = parser.parse_args(argv)
+    result = archive_orders(OrderRepository(), older_than=timedelta(days=args.days))
+    print(f"已归档 {result.archived} 个订单" +
+          (f"，写入 {', '.join(result.segments)}" if result.segments else ""))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+奶茶点单系统 - 会话购物车存储
+购物车是会话状态，保存在进程内存中：加购、移除、清空都不读写磁盘。
+  - 每个用户的购物车在最后一次访问 ttl 秒后过期（访问即续期）
+  - 购物车数超过 max_carts 时淘汰最久未访问的购物车
+  - 清空或下单后变空的购物车直接删除，不再保留
+可选地由后台线程把修改批量异步写入 carts.json，进程重启后恢复未清空的购物车
+"""
+
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from models import Cart
+from repositories import CartRepository
+
+# 购物车闲置过期时间（秒）
+DEFAULT_TTL = 2 * 60 * 60
+
+# 内存中最多保留的购物车数
+DEFAULT_MAX_CARTS = 10000
+
+# 后台写盘间隔（秒）
+PERSIST_INTERVAL = 5.0
+
+# 两次过期清理之间的最短间隔（秒）
+SWEEP_INTERVAL = 30.0
+
+
+class SessionCartStore:
+    """
+    按用户保存购物车的内存存储
+    购物车按最近访问顺序保存在 OrderedDict 中，最久未访问的在最前面：
+    过期清理和容量淘汰都只需从头部弹出，单次操作均摊 O(1)
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_carts: int = DEFAULT_MAX_CARTS,
+                 persist_repo: CartRepository = None,
+                 persist_interval: float = PERSIST_INTERVAL,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        ttl: 购物车闲置过期时间（秒）
+        max_carts: 内存中最多保留的购物车数
+        persist_repo: 提供时把修改异步写入该仓储，并在创建时从中恢复购物车
+        clock: 单调时钟（测试用）
+        """
+        self.ttl = ttl
+        self.max_carts = max_carts
+        self.persist_repo = persist_repo
+        self.clock = clock
+        self.expired = 0
+        self.evicted = 0
+        # user_id -> (购物车, 过期时刻)
+        self._carts: 'OrderedDict[UUID, Tuple[Cart, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_sweep = clock() + SWEEP_INTERVAL
+        # 待写盘的修改：user_id -> 保存时的购物车副本，以及待删除的 cart_id
+        self._dirty: Dict[UUID, Cart] = {}
+        self._deleted: Set[UUID] = set()
+        self._stop = threading.Event()
+        self._flusher = None
+        if persist_repo is not None:
+            self._restore()
+            self._flusher = threading.Thread(target=self._flush_loop, args=(persist_interval,),
+                                             name='cart-persist', daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+
+    def __len__(self) -> int:
+        return len(self._carts)
+
+    def find_by_user(self, user_id: UUID) -> Optional[Cart]:
+        """查找用户的购物车（续期）；已过期的购物车视为不存在"""
+        with self._lock:
+            entry = self._carts.get(user_id)
+            if entry is None:
+                return None
+            cart, expires_at = entry
+            now = self.clock()
+            if expires_at <= now:
+                self._drop(user_id, cart)
+                self.expired += 1
+                return None
+            self._carts[user_id] = (cart, now + self.ttl)
+            self._carts.move_to_end(user_id)
+            return cart
+
+    def save(self, cart: Cart) -> Cart:
+        """
+        保存用户的购物车（续期），版本号加一
+        调用方修改购物车和调用 save 时持有该用户的锁（CartService.user_lock）
+        """
+        with self._lock:
+            now = self.clock()
+            previous = self._carts.get(cart.user_id)
+            if previous is not None and previous[0].cart_id != cart.cart_id:
+                self._deleted.add(previous[0].cart_id)
+            cart.version += 1
+            self._carts[cart.user_id] = (cart, now + self.ttl)
+            self._carts.move_to_end(cart.user_id)
+            if self.persist_repo is not None:
+                # 在此复制明细：调用方持有用户锁，购物车不会被同时修改；
+                # 后台写盘线程只接触副本，不会读到加购、合并到一半的明细
+                self._dirty[cart.user_id] = replace(
+                    cart, lines={line_id: replace(line) for line_id, line in cart.lines.items()})
+                # 购物车可能刚被淘汰或过期清理（在调用方查到它和保存之间），撤销其待删除记录
+                self._deleted.discard(cart.cart_id)
+            while len(self._carts) > self.max_carts:
+                user_id, (oldest, _) = self._carts.popitem(last=False)
+                self._drop(user_id, oldest, popped=True)
+                self.evicted += 1
+            if now >= self._next_sweep:
+                self._sweep(now)
+        return cart
+
+    def remove(self, user_id: UUID) -> bool:
+        """删除用户的购物车"""
+        with self._lock:
+            entry = self._carts.get(user_id)
+            if entry is None:
+                return False
+            self._drop(user_id, entry[0])
+            return True
+
+    def find_all(self) -> List[Cart]:
+        """所有未过期的购物车"""
+        with self._lock:
+            self._sweep(self.clock())
+            return [cart for cart, _ in self._carts.values()]
+
+    def sweep(self) -> int:
+        """清理过期的购物车，返回清理数量"""
+        with self._lock:
+            return self._sweep(self.clock())
+
+    def _sweep(self, now: float) -> int:
+        """从最久未访问的一端弹出过期购物车（调用方持有锁）"""
+        self._next_sweep = now + SWEEP_INTERVAL
+        count = 0
+        while self._carts:
+            user_id, (cart, expires_at) = next(iter(self._carts.items()))
+            if expires_at > now:
+                break
+            self._drop(user_id, cart)
+            count += 1
+        self.expired += count
+        return count
+
+    def _drop(self, user_id: UUID, cart: Cart, popped: bool = False):
+        """移出内存，并记录待删除的持久化副本（调用方持有锁）"""
+        if not popped:
+            del self._carts[user_id]
+        if self.persist_repo is not None:
+            self._dirty.pop(user_id, None)
+            self._deleted.add(cart.cart_id)
+
+    def _restore(self):
+        """从持久化仓储恢复未清空的购物车；空购物车和同一用户的多余购物车随下次写盘删除"""
+        now = self.clock()
+        for cart in self.persist_repo.find_all():
+            if not cart.items or cart.user_id is None or cart.user_id in self._carts:
+                self._deleted.add(cart.cart_id)
+                continue
+            self._carts[cart.user_id] = (cart, now + self.ttl)
+        while len(self._carts) > self.max_carts:
+            _, (oldest, _) = self._carts.popitem(last=False)
+            self._deleted.add(oldest.cart_id)
+
+    def _write_behind(self):
+        """把积累的修改合并为一次仓储写入；写盘本身由仓储的写盘线程完成"""
+        with self._lock:
+            self._sweep(self.clock())
+            saves = list(self._dirty.values())
+            deletes = list(self._deleted)
+            self._dirty.clear()
+            self._deleted.clear()
+        if not saves and not deletes:
+            return
+        try:
+            with self.persist_repo.deferred_writes():
+                if saves:
+                    self.persist_repo.save_many(saves)
+                if deletes:
+                    self.persist_repo.delete_many(deletes)
+        except Exception:
+            # 放回待写队列，下次写盘时重试；期间已被更新或删除的购物车以内存为准
+            with self._lock:
+                for cart in saves:
+                    entry = self._carts.get(cart.user_id)
+                    if entry is not None and entry[0].cart_id == cart.cart_id:
+                        self._dirty.setdefault(cart.user_id, cart)
+                live = {entry[0].cart_id for entry in self._carts.values()}
+                self._deleted.update(cart_id for cart_id in deletes if cart_id not in live)
+            raise
+
+    def _flush_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self._write_behind()
+            except Exception as e:  # pylint: disable=broad-except
+                # 写盘失败不影响会话
+                print(f"购物车写盘失败: {e}")
+
+    def flush(self):
+        """立即写入未落盘的修改并等待写盘完成；未启用持久化时无操作"""
+        if self.persist_repo is None:
+            return
+        self._write_behind()
+        self.persist_repo.flush()
+
+    def close(self):
+        """停止后台写盘线程并写入剩余修改（启用持久化时在进程退出时自动调用）"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+
+# 进程内共享的会话购物车（不落盘）；未指定存储的 CartService 都使用它
+session_carts = SessionCartStore()
@@ -0,0 +1,419 @@
+"""
+奶茶点单系统 - 命令行工具
+不依赖图形界面，直接调用服务层完成下单、推进订单状态、批量修改菜单、导入导出和健康检查，
+便于脚本化操作和对服务层做基准测试。服务层在命令执行时才导入，只解析参数时不加载任何数据。
+
+用法:
+    python cli.py health
+    python cli.py menu list
+    python cli.py menu price 四季春 13.50
+    python cli.py order place --phone 13800000000 "四季春*2" "波霸奶茶:珍珠,椰果" --sweetness 三分糖
+    python cli.py order status 001 制作中
+    python cli.py export orders -o orders.csv
+    python cli.py batch commands.txt        # 每行一条命令（不含 "python cli.py"），# 开头为注释
+"""
+
+import argparse
+import json
+import shlex
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import List, Optional, TextIO
+
+from app_services import AppServices
+
+
+class CommandError(Exception):
+    """命令执行失败，消息直接展示给用户"""
+
+
+class Context(AppServices):
+    """
+    命令执行上下文
+    服务按需创建并在批处理的多条命令之间共用，仓储数据只加载一次
+    """
+
+    def __init__(self, out: TextIO = None):
+        super().__init__()
+        self.out = out or sys.stdout
+
+    def print(self, *values):
+        """输出到命令结果流"""
+        print(*values, file=self.out)
+
+
+# 参数解析
+
+
+def _decimal(value: str) -> Decimal:
+    try:
+        amount = Decimal(value)
+    except InvalidOperation as e:
+        raise argparse.ArgumentTypeError(f"不是合法的金额: {value}") from e
+    if not amount.is_finite() or amount < 0:
+        raise argparse.ArgumentTypeError(f"不是合法的金额: {value}")
+    return amount
+
+
+def _enum_member(enum_class, value: str):
+    """按中文取值或英文名称（不区分大小写）查找枚举成员"""
+    for member in enum_class:
+        if value in (member.value, member.name) or value.upper() == member.name:
+            return member
+    choices = '、'.join(member.value for member in enum_class)
+    raise CommandError(f"无效的取值: {value}（可选: {choices}）")
+
+
+def _find_item(ctx: Context, ref: str):
+    """按商品ID或名称查找菜单项"""
+    items = ctx.menu_service.list_all_items()
+    for item in items:
+        if str(item.item_id) == ref or item.name == ref:
+            return item
+    raise CommandError(f"商品不存在: {ref}")
+
+
+def _find_topping(ctx: Context, ref: str):
+    """按小料ID或名称查找小料"""
+    for topping in ctx.menu_service.list_toppings():
+        if str(topping.topping_id) == ref or topping.name == ref:
+            return topping
+    raise CommandError(f"小料不存在: {ref}")
+
+
+def _find_order(ctx: Context, ref: str):
+    """按取餐码（当天）、订单ID或ID前缀查找唯一的订单"""
+    orders = ctx.order_service.find_by_code(ref)
+    if not orders:
+        raise CommandError(f"订单不存在: {ref}")
+    if len(orders) > 1:
+        raise CommandError(f"订单号不唯一: {ref}（匹配 {len(orders)} 个订单）")
+    return orders[0]
+
+
+def _parse_line(spec: str):
+    """解析下单商品：名称[*数量][:小料,小料]"""
+    name, _, toppings = spec.partition(':')
+    name, _, quantity = name.partition('*')
+    try:
+        quantity = int(quantity) if quantity else 1
+    except ValueError as e:
+        raise CommandError(f"无效的数量: {spec}") from e
+    if quantity <= 0:
+        raise CommandError(f"无效的数量: {spec}")
+    return name.strip(), quantity, [t.strip() for t in toppings.split(',') if t.strip()]
+
+
+def _format_order(order) -> str:
+    return (f"{order.short_code()}\t{order.status.value}\t¥{order.total_amount()}\t"
+            f"{order.created_at:%Y-%m-%d %H:%M}\t{order.order_id}")
+
+
+# 命令
+
+
+def cmd_health(ctx: Context, args) -> int:
+    """检查数据目录可写、各数据文件可解析，返回失败项数"""
+    from repositories import flush_pending_writes  # pylint: disable=import-outside-toplevel
+    flush_pending_writes()
+    data_dir = Path(__file__).parent / 'data'
+    failures = 0
+
+    def report(ok: bool, name: str, detail: str):
+        nonlocal failures
+        failures += not ok
+        ctx.print(f"{'OK  ' if ok else 'FAIL'} {name}: {detail}")
+
+    probe = data_dir / '.health'
+    try:
+        data_dir.mkdir(exist_ok=True)
+        probe.write_text('ok', encoding='utf-8')
+        probe.unlink()
+        report(True, 'data/', "可写")
+    except OSError as e:
+        report(False, 'data/', str(e))
+    files = sorted(data_dir.glob('*.json')) + sorted(data_dir.glob('orders/*.json'))
+    files += sorted(data_dir.glob('archive/orders/manifest.json'))
+    for path in files:
+        name = str(path.relative_to(data_dir))
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            report(True, name, f"{len(data)} 条，{path.stat().st_size:,} 字节")
+        except (OSError, ValueError) as e:
+            report(False, name, str(e))
+    if args.deep:
+        # 通过仓储完整加载一遍，校验每条记录都能还原为模型
+        started = time.perf_counter()
+        counts = {
+            'menu_items': len(ctx.menu_service.list_all_items()),
+            'toppings': len(ctx.menu_service.list_toppings()),
+            'orders': len(ctx.order_service.list_orders()),
+            'users': len(ctx.auth_service.user_repo.find_all()),
+        }
+        detail = '，'.join(f"{name} {count}" for name, count in counts.items())
+        report(True, '仓储', f"{detail}（{time.perf_counter() - started:.2f} 秒）")
+    return 1 if failures else 0
+
+
+def cmd_menu_list(ctx: Context, args) -> int:
+    items = ctx.menu_service.list_all_items() if args.all else ctx.menu_service.list_items()
+    for item in items:
+        ctx.print(f"{item.name}\t¥{item.price}\t{item.category or '-'}\t"
+                  f"{'售罄' if item.is_sold_out else '在售'}\t{item.item_id}")
+    return 0
+
+
+def cmd_menu_add(ctx: Context, args) -> int:
+    item = ctx.menu_service.create_item(args.name, args.price, category=args.category,
+                                        description=args.description)
+    ctx.print(f"已添加 {item.name} ¥{item.price}\t{item.item_id}")
+    return 0
+
+
+def cmd_menu_price(ctx: Context, args) -> int:
+    item = _find_item(ctx, args.item)
+    updated = ctx.menu_service.update_item(item.item_id, price=args.price)
+    if updated is None:
+        raise CommandError(f"商品不存在: {args.item}")
+    ctx.print(f"{item.name}: ¥{item.price} -> ¥{updated.price}")
+    return 0
+
+
+def cmd_menu_sold_out(ctx: Context, args) -> int:
+    item = _find_item(ctx, args.item)
+    ctx.menu_service.mark_sold_out(item.item_id, not args.undo)
+    ctx.print(f"{item.name}: {'在售' if args.undo else '售罄'}")
+    return 0
+
+
+def cmd_menu_delete(ctx: Context, args) -> int:
+    item = _find_item(ctx, args.item)
+    ctx.menu_service.delete_item(item.item_id)
+    ctx.print(f"已删除 {item.name}")
+    return 0
+
+
+def cmd_order_place(ctx: Context, args) -> int:
+    from models import Sweetness  # pylint: disable=import-outside-toplevel
+    sweetness = _enum_member(Sweetness, args.sweetness)
+    if args.phone:
+        user = ctx.auth_service.user_repo.find_by_phone(args.phone)
+        if user is None:
+            raise CommandError(f"用户不存在: {args.phone}")
+        user_id = user.user_id
+    else:
+        from uuid import UUID  # pylint: disable=import-outside-toplevel
+        try:
+            user_id = UUID(args.user)
+        except ValueError as e:
+            raise CommandError(f"无效的用户ID: {args.user}") from e
+    lines = []
+    for spec in args.items:
+        name, quantity, toppings = _parse_line(spec)
+        lines.append((_find_item(ctx, name), quantity,
+                      [_find_topping(ctx, topping).topping_id for topping in toppings]))
+
+    cart_service = ctx.cart_service
+    cart = cart_service.get_cart(user_id)
+    if cart and cart.items:
+        raise CommandError("该用户的购物车中已有商品，请先结算或清空")
+    for item, quantity, topping_ids in lines:
+        success, message = cart_service.add_to_cart(user_id, item.item_id, quantity,
+                                                    sweetness, topping_ids, args.line_remark)
+        if not success:
+            cart_service.clear_cart(user_id)
+            raise CommandError(f"{item.name}: {message}")
+    success, message, order = ctx.order_service.place_order(user_id, args.remark, args.key)
+    if not success:
+        cart_service.clear_cart(user_id)
+        raise CommandError(message)
+    ctx.print(f"{message}\t¥{order.total_amount()}\t{order.order_id}")
+    return 0
+
+
+def cmd_order_status(ctx: Context, args) -> int:
+    from models import OrderStatus  # pylint: disable=import-outside-toplevel
+    status = _enum_member(OrderStatus, args.status)
+    order = _find_order(ctx, args.order)
+    success, message = ctx.order_service.update_status(order.order_id, status)
+    if not success:
+        raise CommandError(message)
+    ctx.print(f"{order.short_code()}: {message}")
+    return 0
+
+
+def cmd_order_list(ctx: Context, args) -> int:
+    orders = ctx.order_service.list_orders()
+    if args.status:
+        from models import OrderStatus  # pylint: disable=import-outside-toplevel
+        status = _enum_member(OrderStatus, args.status)
+        orders = [order for order in orders if order.status == status]
+    for order in orders[:args.limit]:
+        ctx.print(_format_order(order))
+    return 0
+
+
+def cmd_order_show(ctx: Context, args) -> int:
+    order = _find_order(ctx, args.order)
+    ctx.print(_format_order(order))
+    for line in order.items:
+        toppings = '、'.join(t.name for t in line.toppings) or '无'
+        ctx.print(f"  {line.menu_item.name if line.menu_item else '?'} x{line.quantity}\t"
+                  f"{line.sweetness.value}\t小料: {toppings}\t¥{line.subtotal()}")
+    if order.discount:
+        ctx.print(f"  优惠: -¥{order.discount}（{'、'.join(order.applied_promotions)}）")
+    return 0
+
+
+def cmd_import(ctx: Context, args) -> int:
+    import importers  # pylint: disable=import-outside-toplevel
+    return importers.main(args.argv)
+
+
+def cmd_export(ctx: Context, args) -> int:
+    import exporters  # pylint: disable=import-outside-toplevel
+    return exporters.main(args.argv)
+
+
+def cmd_batch(ctx: Context, args) -> int:
+    """逐行执行命令文件，共用同一组服务；返回失败的命令数是否为零"""
+    stream = sys.stdin if args.file == '-' else open(args.file, 'r', encoding='utf-8')
+    parser = build_parser(batch=True)
+    executed, failed = 0, 0
+    started = time.perf_counter()
+    try:
+        for line_no, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            executed += 1
+            try:
+                argv = shlex.split(line)
+            except ValueError as e:
+                status = _fail(f"第 {line_no} 行: {e}")
+            else:
+                status = run(argv, ctx, parser, prefix=f"第 {line_no} 行: ")
+            if status:
+                failed += 1
+                if args.stop_on_error:
+                    break
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    elapsed = time.perf_counter() - started
+    print(f"执行 {executed} 条命令，失败 {failed} 条，用时 {elapsed:.2f} 秒"
+          f"（{executed / max(elapsed, 1e-9):,.0f} 条/秒）", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def _fail(message: str) -> int:
+    print(f"错误: {message}", file=sys.stderr)
+    return 1
+
+
+class _Parser(argparse.ArgumentParser):
+    """批处理中参数错误不退出进程，改为抛出 CommandError"""
+
+    def error(self, message):
+        raise CommandError(message)
+
+
+def build_parser(batch: bool = False) -> argparse.ArgumentParser:
+    """构造参数解析器；batch 为 True 时用于解析批处理文件中的命令（不允许嵌套 batch）"""
+    parser_class = _Parser if batch else argparse.ArgumentParser
+    parser = parser_class(prog='cli.py', description="奶茶点单系统命令行工具")
+    commands = parser.add_subparsers(dest='command', required=True, parser_class=parser_class)
+
+    health = commands.add_parser('health', help="检查数据目录和数据文件")
+    health.add_argument('--deep', action='store_true', help="通过仓储完整加载数据")
+    health.set_defaults(handler=cmd_health)
+
+    menu = commands.add_parser('menu', help="菜单管理").add_subparsers(
+        dest='action', required=True, parser_class=parser_class)
+    menu_list = menu.add_parser('list', help="列出在售商品")
+    menu_list.add_argument('--all', action='store_true', help="包含售罄商品")
+    menu_list.set_defaults(handler=cmd_menu_list)
+    menu_add = menu.add_parser('add', help="添加商品")
+    menu_add.add_argument('name')
+    menu_add.add_argument('price', type=_decimal)
+    menu_add.add_argument('--category', default="")
+    menu_add.add_argument('--description', default="")
+    menu_add.set_defaults(handler=cmd_menu_add)
+    menu_price = menu.add_parser('price', help="修改价格")
+    menu_price.add_argument('item', help="商品名称或ID")
+    menu_price.add_argument('price', type=_decimal)
+    menu_price.set_defaults(handler=cmd_menu_price)
+    menu_sold_out = menu.add_parser('sold-out', help="标记售罄")
+    menu_sold_out.add_argument('item', help="商品名称或ID")
+    menu_sold_out.add_argument('--undo', action='store_true', help="恢复在售")
+    menu_sold_out.set_defaults(handler=cmd_menu_sold_out)
+    menu_delete = menu.add_parser('delete', help="删除商品")
+    menu_delete.add_argument('item', help="商品名称或ID")
+    menu_delete.set_defaults(handler=cmd_menu_delete)
+
+    order = commands.add_parser('order', help="订单操作").add_subparsers(
+        dest='action', required=True, parser_class=parser_class)
+    place = order.add_parser('place', help="下单（用户购物车须为空）")
+    who = place.add_mutually_exclusive_group(required=True)
+    who.add_argument('--phone', help="用户手机号")
+    who.add_argument('--user', help="用户ID")
+    place.add_argument('items', nargs='+', metavar='ITEM', help="商品名称[*数量][:小料,小料]")
+    place.add_argument('--sweetness', default="五分糖", help="甜度（默认五分糖）")
+    place.add_argument('--remark', default="", help="订单备注")
+    place.add_argument('--line-remark', default="", help="每杯的备注")
+    place.add_argument('--key', help="幂等键，重复执行同一键不会重复下单")
+    place.set_defaults(handler=cmd_order_place)
+    status = order.add_parser('status', help="推进订单状态")
+    status.add_argument('order', help="取餐码、订单ID或ID前缀")
+    status.add_argument('status', help="目标状态，如 制作中、待取餐、已完成、已取消")
+    status.set_defaults(handler=cmd_order_status)
+    order_list = order.add_parser('list', help="列出订单（最新在前）")
+    order_list.add_argument('--status', help="只列出该状态的订单")
+    order_list.add_argument('--limit', type=int, default=50)
+    order_list.set_defaults(handler=cmd_order_list)
+    show = order.add_parser('show', help="查看订单明细")
+    show.add_argument('order', help="取餐码、订单ID或ID前缀")
+    show.set_defaults(handler=cmd_order_show)
+
+    for name, handler, help_text in (('import', cmd_import, "批量导入，参数同 importers.py"),
+                                     ('export', cmd_export, "导出，参数同 exporters.py")):
+        sub = commands.add_parser(name, help=help_text, add_help=False)
+        sub.add_argument('argv', nargs=argparse.REMAINDER)
+        sub.set_defaults(handler=handler)
+
+    if not batch:
+        batch_parser = commands.add_parser('batch', help="逐行执行命令文件（- 为标准输入）")
+        batch_parser.add_argument('file')
+        batch_parser.add_argument('--stop-on-error', action='store_true', help="遇到失败的命令即停止")
+        batch_parser.set_defaults(handler=cmd_batch)
+    return parser
+
+
+def run(argv: List[str], ctx: Context, parser: argparse.ArgumentParser = None, prefix: str = "") -> int:
+    """解析并执行一条命令，返回退出码"""
+    parser = parser or build_parser()
+    try:
+        args = parser.parse_args(argv)
+        return args.handler(ctx, args)
+    except CommandError as e:
+        return _fail(f"{prefix}{e}")
+    except SystemExit as e:
+        # import/export 的参数错误或 --help
+        return e.code if isinstance(e.code, int) else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        return args.handler(Context(), args)
+    except CommandError as e:
+        return _fail(str(e))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+奶茶点单系统 - 经营看板
+增量维护当天的经营指标（每小时订单数、营业额、排队时长、畅销商品）：
+每次刷新只处理订单仓储自上次刷新以来变更的订单，不重新扫描历史订单
+"""
+
+import heapq
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from models import Order, OrderStatus
+from money import from_cents, to_cents
+
+# 排队中的订单状态
+_QUEUED = (OrderStatus.PENDING, OrderStatus.PREPARING)
+
+
+@dataclass(frozen=True)
+class _Contribution:
+    """单个订单对看板指标的贡献；订单变化时先减去旧贡献再加上新贡献"""
+    hour: int
+    counted: bool  # 未取消的订单才计入订单数、营业额和销量
+    cents: int
+    items: Tuple[Tuple[UUID, str, int], ...]
+    wait: Optional[float]  # 排队秒数，尚未出餐为 None
+    queued: bool
+
+
+@dataclass
+class DashboardSnapshot:
+    """看板数据"""
+    day: date
+    orders_by_hour: List[int] = field(default_factory=lambda: [0] * 24)
+    order_count: int = 0
+    cancelled_count: int = 0
+    revenue: Decimal = Decimal('0.00')
+    queue_length: int = 0
+    average_wait: Optional[timedelta] = None
+    top_items: List[Tuple[str, int]] = field(default_factory=list)
+
+
+class DashboardStats:
+    """
+    当天经营指标的增量聚合
+    通过 OrderRepository.changes_since 读取变更；非当天的订单只做一次日期比较即跳过，
+    跨天时清空聚合并从头同步一次
+    """
+
+    def __init__(self, order_repo, clock: Callable[[], datetime] = datetime.now):
+        self.order_repo = order_repo
+        self._clock = clock
+        # 每次聚合变化时递增，界面据此判断是否需要重绘
+        self.revision = 0
+        self._reset(None)
+
+    def _reset(self, day: Optional[date]):
+        """清空聚合，从头同步 day 当天的订单"""
+        self._day = day
+        self._token = 0
+        self._contributions: Dict[UUID, _Contribution] = {}
+        self._orders_by_hour = [0] * 24
+        self._order_count = 0
+        self._cancelled_count = 0
+        self._revenue_cents = 0
+        self._queue_length = 0
+        self._wait_seconds = 0.0
+        self._wait_count = 0
+        self._item_quantity: Dict[UUID, int] = {}
+        self._item_names: Dict[UUID, str] = {}
+
+    @staticmethod
+    def _contribution(order: Order) -> _Contribution:
+        """计算订单的贡献"""
+        counted = order.status != OrderStatus.CANCELLED
+        wait = None
+        if order.ready_at is not None:
+            wait = max((order.ready_at - order.created_at).total_seconds(), 0.0)
+        items = tuple((line.menu_item.item_id, line.menu_item.name, line.quantity)
+                      for line in order.items if line.menu_item is not None)
+        return _Contribution(order.created_at.hour, counted, to_cents(order.total_amount()),
+                             items, wait, order.status in _QUEUED)
+
+    def _apply(self, contribution: _Contribution, sign: int):
+        """加上（sign=1）或减去（sign=-1）一个订单的贡献"""
+        if contribution.counted:
+            self._orders_by_hour[contribution.hour] += sign
+            self._order_count += sign
+            self._revenue_cents += sign * contribution.cents
+            for item_id, name, quantity in contribution.items:
+                self._item_quantity[item_id] = self._item_quantity.get(item_id, 0) + sign * quantity
+                self._item_names[item_id] = name
+        else:
+            self._cancelled_count += sign
+        if contribution.wait is not None:
+            self._wait_seconds += sign * contribution.wait
+            self._wait_count += sign
+        if contribution.queued:
+            self._queue_length += sign
+
+    def refresh(self) -> bool:
+        """同步变更的订单，返回聚合是否有变化"""
+        today = self._clock().date()
+        rollover = today != self._day
+        if rollover:
+            self._reset(today)
+        token, changed, deleted = self.order_repo.changes_since(self._token)
+        self._token = token
+        dirty = rollover
+        for order in changed:
+            old = self._contributions.pop(order.order_id, None)
+            if old is not None:
+                self._apply(old, -1)
+                dirty = True
+            if order.created_at.date() == today:
+                new = self._contributions[order.order_id] = self._contribution(order)
+                self._apply(new, 1)
+                dirty = True
+        for order_id in deleted:
+            old = self._contributions.pop(order_id, None)
+            if old is not None:
+                self._apply(old, -1)
+                dirty = True
+        if dirty:
+            self.revision += 1
+        return dirty
+
+    def snapshot(self, top: int = 5) -> DashboardSnapshot:
+        """当前的看板数据（不触发同步）"""
+        sellers = heapq.nlargest(top, ((quantity, item_id) for item_id, quantity
+                                       in self._item_quantity.items() if quantity > 0))
+        average_wait = None
+        if self._wait_count:
+            average_wait = timedelta(seconds=round(self._wait_seconds / self._wait_count))
+        return DashboardSnapshot(
+            day=self._day,
+            orders_by_hour=list(self._orders_by_hour),
+            order_count=self._order_count,
+            cancelled_count=self._cancelled_count,
+            revenue=from_cents(self._revenue_cents),
+            queue_length=self._queue_length,
+            average_wait=average_wait,
+            top_items=[(self._item_names[item_id], quantity) for quantity, item_id in sellers]
+        )
@@ -0,0 +1,83 @@
+"""
+奶茶点单系统 - 数据导出基准测试
+生成指定行数的合成订单文件，测量流式导出为 CSV、gzip CSV 和 JSONL 的吞吐量；
+--memory 时另用 tracemalloc 测量导出过程的内存峰值
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from exporters import export_rows
+from models import MenuItem, Order, OrderItem, OrderStatus, Sweetness, Topping
+from repositories import iter_json_array
+
+
+def write_fixture(path: Path, lines: int, seed: int) -> int:
+    """逐个写出合成订单（每单 1-3 项），返回订单数"""
+    rng = random.Random(seed)
+    menu = [MenuItem(name=f"饮品{i}", price=Decimal(rng.randint(800, 3000)) / 100,
+                     category=f"分类{i % 8}") for i in range(60)]
+    toppings = [Topping(name=f"小料{i}", extra_price=Decimal(rng.randint(100, 400)) / 100)
+                for i in range(8)]
+    start = datetime(2026, 1, 1)
+    written, orders = 0, 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        while written < lines:
+            order = Order(status=rng.choice(list(OrderStatus)),
+                          created_at=start + timedelta(seconds=rng.randint(0, 180 * 86400)))
+            for _ in range(min(rng.randint(1, 3), lines - written)):
+                order.add_item(OrderItem(menu_item=rng.choice(menu), quantity=rng.randint(1, 3),
+                                         sweetness=rng.choice(list(Sweetness)),
+                                         toppings=rng.sample(toppings, k=rng.randint(0, 2))))
+                written += 1
+            f.write(',\n' if orders else '\n')
+            json.dump(order.to_dict(), f, ensure_ascii=False)
+            orders += 1
+        f.write('\n]')
+    return orders
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="奶茶点单系统数据导出基准测试")
+    parser.add_argument('--lines', type=int, default=1_000_000, help="订单明细行数")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--memory', action='store_true', help="额外测量内存峰值（较慢）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / 'orders.json'
+        started = time.perf_counter()
+        orders = write_fixture(source, args.lines, args.seed)
+        print(f"生成 {orders} 个订单 / {args.lines} 行明细，"
+              f"{source.stat().st_size / 2 ** 20:.0f} MB，用时 {time.perf_counter() - started:.1f} 秒")
+
+        def stream():
+            return (Order.from_dict(data) for data in iter_json_array(source))
+
+        for name in ('orders.csv', 'orders.csv.gz', 'orders.jsonl'):
+            output = Path(tmp) / name
+            started = time.perf_counter()
+            count = export_rows('orders', stream(), str(output))
+            elapsed = time.perf_counter() - started
+            print(f"{name:<14} {count} 行，{elapsed:.1f} 秒，{count / elapsed:,.0f} 行/秒，"
+                  f"{output.stat().st_size / 2 ** 20:.0f} MB")
+
+        if args.memory:
+            tracemalloc.start()
+            export_rows('orders', stream(), str(Path(tmp) / 'memory.csv'))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"导出内存峰值: {peak / 2 ** 20:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""
+奶茶点单系统 - 数据导出
+以生成器逐条读取数据文件并写出 CSV / JSONL，全程不构建完整列表，内存占用恒定；
+支持按创建时间过滤和 gzip 压缩。导出订单时一并读取时间范围内的归档段。
+
+用法:
+    python exporters.py orders -o orders.csv --start 2026-01-01 --end 2026-02-01
+    python exporters.py reviews -o reviews.jsonl.gz
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from archive import OrderArchive
+from models import Order, Review, User
+from money import format_cents, to_cents
+from repositories import scan_entities
+
+ORDER_LINE_FIELDS = [
+    'order_id', 'pickup_code', 'created_at', 'status', 'user_id', 'line_no',
+    'item_name', 'category', 'sweetness', 'toppings', 'remark', 'quantity',
+    'unit_price', 'toppings_price', 'line_subtotal',
+    'order_subtotal', 'order_discount', 'order_total', 'applied_promotions'
+]
+REVIEW_FIELDS = ['review_id', 'order_id', 'user_id', 'created_at', 'rating', 'content', 'reply']
+USER_FIELDS = ['user_id', 'nickname', 'phone', 'created_at']
+
+FORMATS = ('csv', 'jsonl')
+
+
+def in_range(moment: datetime, start: Optional[datetime], end: Optional[datetime]) -> bool:
+    """moment 是否在 [start, end) 范围内，未指定的一端不限"""
+    return (start is None or moment >= start) and (end is None or moment < end)
+
+
+def order_line_rows(orders: Iterable[Order], start: datetime = None,
+                    end: datetime = None) -> Iterator[Dict[str, object]]:
+    """
+    订单明细：每个订单项一行
+    订单级字段（原价、优惠、实付）在同一订单的各行中重复出现，汇总时按 line_no == 1 去重
+    """
+    for order in orders:
+        if not in_range(order.created_at, start, end):
+            continue
+        common = {
+            'order_id': str(order.order_id),
+            'pickup_code': order.short_code(),
+            'created_at': order.created_at.isoformat(timespec='seconds'),
+            'status': order.status.value,
+            'user_id': str(order.user_id) if order.user_id else '',
+        }
+        # 金额以分计算一次，直接格式化为字符串，不经过 Decimal
+        lines = []
+        for line in order.items:
+            toppings_cents = sum(t.extra_price_cents for t in line.toppings)
+            unit_cents = line.menu_item.price_cents if line.menu_item else 0
+            lines.append((line, unit_cents, toppings_cents,
+                          (unit_cents + toppings_cents) * line.quantity))
+        subtotal = sum(entry[3] for entry in lines)
+        discount = to_cents(order.discount)
+        totals = {
+            'order_subtotal': format_cents(subtotal),
+            'order_discount': format_cents(discount),
+            'order_total': format_cents(subtotal - discount),
+            'applied_promotions': '|'.join(order.applied_promotions),
+        }
+        for line_no, (line, unit_cents, toppings_cents, line_cents) in enumerate(lines, 1):
+            menu_item = line.menu_item
+            yield {
+                **common,
+                'line_no': line_no,
+                'item_name': menu_item.name if menu_item else '',
+                'category': menu_item.category if menu_item else '',
+                'sweetness': line.sweetness.value,
+                'toppings': '|'.join(t.name for t in line.toppings),
+                'remark': line.remark,
+                'quantity': line.quantity,
+                'unit_price': format_cents(unit_cents) if menu_item else '',
+                'toppings_price': format_cents(toppings_cents),
+                'line_subtotal': format_cents(line_cents),
+                **totals,
+            }
+
+
+def review_rows(reviews: Iterable[Review], start: datetime = None,
+                end: datetime = None) -> Iterator[Dict[str, object]]:
+    """评价：每条评价一行"""
+    for review in reviews:
+        if in_range(review.created_at, start, end):
+            yield {
+                'review_id': str(review.review_id),
+                'order_id': str(review.order_id) if review.order_id else '',
+                'user_id': str(review.user_id) if review.user_id else '',
+                'created_at': review.created_at.isoformat(timespec='seconds'),
+                'rating': review.rating,
+                'content': review.content,
+                'reply': review.reply,
+            }
+
+
+def user_rows(users: Iterable[User], start: datetime = None,
+              end: datetime = None) -> Iterator[Dict[str, object]]:
+    """用户：每个用户一行（按注册时间过滤）"""
+    for user in users:
+        if in_range(user.created_at, start, end):
+            yield {
+                'user_id': str(user.user_id),
+                'nickname': user.nickname,
+                'phone': user.phone,
+                'created_at': user.created_at.isoformat(timespec='seconds'),
+            }
+
+
+# 导出类型 -> (数据文件或分区目录, 模型类, 列名, 行生成器)
+EXPORTS: Dict[str, tuple] = {
+    'orders': ('orders', Order, ORDER_LINE_FIELDS, order_line_rows),
+    'reviews': ('reviews.json', Review, REVIEW_FIELDS, review_rows),
+    'users': ('users.json', User, USER_FIELDS, user_rows),
+}
+
+
+def write_csv(rows: Iterable[Dict[str, object]], out: TextIO, fieldnames: List[str]) -> int:
+    """逐行写出 CSV（含表头），返回数据行数"""
+    writer = csv.writer(out)
+    writer.writerow(fieldnames)
+    count = 0
+    for row in rows:
+        writer.writerow([row[name] for name in fieldnames])
+        count += 1
+    return count
+
+
+def write_jsonl(rows: Iterable[Dict[str, object]], out: TextIO, fieldnames: List[str] = None) -> int:
+    """逐行写出 JSON Lines，返回行数"""
+    count = 0
+    for row in rows:
+        out.write(json.dumps(row, ensure_ascii=False))
+        out.write('\n')
+        count += 1
+    return count
+
+
+WRITERS: Dict[str, Callable[..., int]] = {'csv': write_csv, 'jsonl': write_jsonl}
+
+
+def detect_format(output: str) -> str:
+    """按输出文件扩展名（忽略 .gz）推断格式，默认 CSV"""
+    name = output[:-3] if output.endswith('.gz') else output
+    return 'jsonl' if name.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def open_output(output: str, fmt: str, compress: bool) -> TextIO:
+    """
+    打开输出流；output 为 '-' 时写到标准输出
+    CSV 带 BOM，便于 Excel 直接打开中文内容
+    """
+    encoding = 'utf-8-sig' if fmt == 'csv' else 'utf-8'
+    if output == '-':
+        stream = sys.stdout.buffer
+        if compress:
+            stream = gzip.GzipFile(fileobj=stream, mode='wb')
+        return io.TextIOWrapper(stream, encoding=encoding, newline='', write_through=False)
+    if compress:
+        return gzip.open(output, 'wt', encoding=encoding, newline='', compresslevel=6)
+    return open(output, 'w', encoding=encoding, newline='')
+
+
+def export_rows(kind: str, entities: Iterable, output: str, fmt: str = None,
+                start: datetime = None, end: datetime = None, compress: bool = None) -> int:
+    """
+    把实体流导出到文件
+    fmt 和 compress 未指定时按文件扩展名推断；返回写出的行数
+    """
+    if kind not in EXPORTS:
+        raise ValueError(f"不支持的导出类型: {kind}")
+    fmt = fmt or detect_format(output)
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    if compress is None:
+        compress = output.endswith('.gz')
+    _, _, fieldnames, row_generator = EXPORTS[kind]
+    out = open_output(output, fmt, compress)
+    try:
+        return WRITERS[fmt](row_generator(entities, start, end), out, fieldnames)
+    finally:
+        if output == '-':
+            out.flush()
+            stream = out.detach()
+            if compress:
+                stream.close()  # 写出 gzip 尾部，不会关闭标准输出
+        else:
+            out.close()
+
+
+def export(kind: str, output: str, fmt: str = None, start: datetime = None,
+           end: datetime = None, compress: bool = None) -> int:
+    """从数据目录流式读取并导出，返回写出的行数"""
+    if kind not in EXPORTS:
+        raise ValueError(f"不支持的导出类型: {kind}")
+    filename, model_class = EXPORTS[kind][:2]
+    # 按日期分区的数据只读取时间范围涉及的分区
+    entities = scan_entities(filename, model_class,
+                             start.date() if start else None, end.date() if end else None)
+    if kind == 'orders':
+        entities = with_archived_orders(entities, OrderArchive(), start, end)
+    return export_rows(kind, entities, output, fmt, start, end, compress)
+
+
+def with_archived_orders(orders: Iterable[Order], archive: OrderArchive,
+                         start: datetime = None, end: datetime = None) -> Iterator[Order]:
+    """
+    先产出 [start, end) 内的归档订单，再产出热数据中的订单
+    归档中途失败时订单可能同时存在于两处，只记录归档订单的ID用于去重
+    """
+    archived = set()
+    for order in archive.iter_orders(start, end):
+        archived.add(order.order_id)
+        yield order
+    for order in orders:
+        if order.order_id not in archived:
+            yield order
+
+
+def _parse_time(value: str) -> datetime:
+    """解析命令行中的 ISO 日期或时间"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"不是合法的时间: {value}") from e
+
+
+def main(argv: List[str] = None) -> int:
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="奶茶点单系统数据导出")
+    parser.add_argument('kind', choices=sorted(EXPORTS), help="导出类型")
+    parser.add_argument('-o', '--output', default='-', help="输出文件，默认标准输出；以 .gz 结尾时压缩")
+    parser.add_argument('--format', choices=FORMATS, help="输出格式，默认按扩展名推断")
+    parser.add_argument('--start', type=_parse_time, help="起始时间（含）")
+    parser.add_argument('--end', type=_parse_time, help="截止时间（不含）")
+    parser.add_argument('--gzip', action='store_true', default=None, help="gzip 压缩输出")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    count = export(args.kind, args.output, args.format, args.start, args.end, args.gzip)
+    elapsed = time.perf_counter() - started
+    print(f"导出 {count} 行，用时 {elapsed:.2f} 秒（{count / max(elapsed, 1e-9):,.0f} 行/秒）",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
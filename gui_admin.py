@@ -5,33 +5,55 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
+from datetime import date, timedelta
 from decimal import Decimal
 from uuid import UUID
 
+from app_services import AppServices, service_property
+from dashboard import DashboardStats
+from gui_tasks import TaskRunner
 from models import MenuItem, OrderStatus
-from services import MenuService, OrderService
+from repositories import VersionConflictError
+
+
+# 经营看板的刷新间隔（毫秒）
+DASHBOARD_REFRESH_MS = 2000
 
 
 class AdminGUI:
     """管理员端GUI主类"""
     
-    def __init__(self, root: tk.Tk):
+    menu_service = service_property('menu_service')
+    order_service = service_property('order_service')
+    
+    def __init__(self, root: tk.Tk, services: AppServices = None):
         self.root = root
         self.root.title("奶茶点单系统 - 管理员端")
         self.root.geometry("900x600")
         
-        # 初始化服务
-        self.menu_service = MenuService()
-        self.order_service = OrderService()
+        # 共享服务；未预先加载时在首次使用时读盘
+        self.services = services or AppServices()
+        self.dashboard_stats = None
+        self.dashboard_revision = None
+        self.busy_label = None
+        self.tasks = None
         
-        # 创建主界面
+        # 订单列表刷新时各订单的版本号，用于检测其他终端的并发修改
+        self.order_versions = {}
+        
+        # 创建主界面；服务调用经 self.tasks 在工作线程中执行，回调在界面线程中更新界面
         self.create_widgets()
+        self.tasks = TaskRunner(self.root, self.busy_label)
     
     def create_widgets(self):
         """创建主界面组件"""
         # 创建标签页
         self.notebook = ttk.Notebook(self.root)
-        self.notebook.pack(fill='both', expand=True, padx=10, pady=10)
+        self.notebook.pack(fill='both', expand=True, padx=10, pady=(10, 0))
+        
+        # 状态栏：有后台任务未完成时显示
+        self.busy_label = tk.Label(self.root, text="", font=('Arial', 10), anchor='e')
+        self.busy_label.pack(fill='x', padx=10)
         
         # 菜单管理页
         self.menu_frame = ttk.Frame(self.notebook)
@@ -43,9 +65,19 @@ class AdminGUI:
         self.notebook.add(self.order_frame, text="订单管理")
         self.create_order_tab()
         
-        # 自动加载数据
+        # 经营看板页
+        self.dashboard_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.dashboard_frame, text="经营看板")
+        self.create_dashboard_tab()
+        
+        # 窗口绘制之后再加载数据
+        self.root.after_idle(self.load_initial_data)
+    
+    def load_initial_data(self):
+        """加载菜单、订单并启动经营看板的定时刷新"""
         self.refresh_menu()
         self.refresh_orders()
+        self.tick_dashboard()
     
     def create_menu_tab(self):
         """创建菜单管理标签页"""
@@ -96,7 +128,7 @@ class AdminGUI:
         tk.Label(list_frame, text="订单列表", font=('Arial', 14, 'bold')).pack()
         
         # 创建表格
-        columns = ('订单号', '状态', '金额', '时间')
+        columns = ('取餐码', '状态', '金额', '时间')
         self.order_tree = ttk.Treeview(list_frame, columns=columns, show='tree headings', height=15)
         
         self.order_tree.heading('#0', text='ID')
@@ -128,23 +160,141 @@ class AdminGUI:
                  bg='#9C27B0', fg='white', width=12).pack(side='left', padx=5)
         tk.Button(bottom_frame, text="刷新", command=self.refresh_orders,
                  bg='#9E9E9E', fg='white', width=10).pack(side='left', padx=5)
+        
+        # 取餐码查找
+        tk.Button(bottom_frame, text="查找", command=self.find_order_by_code,
+                 bg='#607D8B', fg='white', width=8).pack(side='right', padx=5)
+        self.code_entry = tk.Entry(bottom_frame, width=12)
+        self.code_entry.pack(side='right', padx=5)
+        self.code_entry.bind('<Return>', lambda event: self.find_order_by_code())
+        tk.Label(bottom_frame, text="取餐码/订单号:").pack(side='right')
+    
+    def create_dashboard_tab(self):
+        """创建经营看板标签页"""
+        summary_frame = ttk.Frame(self.dashboard_frame)
+        summary_frame.pack(fill='x', padx=10, pady=10)
+        
+        self.dashboard_labels = {}
+        for key, title in (('orders', "今日订单"), ('revenue', "今日营业额"), ('queue', "排队中"),
+                           ('wait', "平均排队"), ('cancelled', "已取消")):
+            cell = ttk.Frame(summary_frame)
+            cell.pack(side='left', expand=True, fill='x')
+            tk.Label(cell, text=title, font=('Arial', 10)).pack()
+            label = tk.Label(cell, text="-", font=('Arial', 16, 'bold'))
+            label.pack()
+            self.dashboard_labels[key] = label
+        
+        body_frame = ttk.Frame(self.dashboard_frame)
+        body_frame.pack(fill='both', expand=True, padx=10)
+        
+        # 左侧：每小时订单数柱状图
+        chart_frame = ttk.Frame(body_frame)
+        chart_frame.pack(side='left', fill='both', expand=True)
+        tk.Label(chart_frame, text="每小时订单数", font=('Arial', 12, 'bold')).pack()
+        self.hour_canvas = tk.Canvas(chart_frame, height=260, bg='white')
+        self.hour_canvas.pack(fill='both', expand=True)
+        self.hour_canvas.bind('<Configure>', lambda event: self.draw_hour_chart())
+        
+        # 右侧：畅销商品
+        top_frame = ttk.Frame(body_frame)
+        top_frame.pack(side='right', fill='y', padx=(10, 0))
+        tk.Label(top_frame, text="今日畅销", font=('Arial', 12, 'bold')).pack()
+        self.top_tree = ttk.Treeview(top_frame, columns=('名称', '杯数'), show='headings', height=10)
+        self.top_tree.heading('名称', text='名称')
+        self.top_tree.heading('杯数', text='杯数')
+        self.top_tree.column('名称', width=150)
+        self.top_tree.column('杯数', width=60)
+        self.top_tree.pack(fill='y', expand=True)
+        
+        # 底部：近 7 日营业额（读取销售汇总，与历史订单量无关）
+        self.week_label = tk.Label(self.dashboard_frame, text="", font=('Arial', 10), anchor='w')
+        self.week_label.pack(fill='x', padx=10, pady=10)
+        self.hour_counts = [0] * 24
+    
+    def tick_dashboard(self):
+        """定时刷新经营看板：只同步变更的订单，指标有变化时才重绘"""
+        def refresh():
+            if self.dashboard_stats is None:
+                self.dashboard_stats = DashboardStats(self.order_service.order_repo)
+            self.dashboard_stats.refresh()
+            if self.dashboard_stats.revision == self.dashboard_revision:
+                return None
+            self.dashboard_revision = self.dashboard_stats.revision
+            snapshot = self.dashboard_stats.snapshot(top=10)
+            today = snapshot.day or date.today()
+            week = self.order_service.daily_sales(today - timedelta(days=6), today)
+            return snapshot, week
+        
+        def done(result):
+            self.root.after(DASHBOARD_REFRESH_MS, self.tick_dashboard)
+            if result is not None:
+                self.render_dashboard(*result)
+        
+        def failed(error):
+            print(f"刷新经营看板失败: {error}")
+            self.root.after(DASHBOARD_REFRESH_MS, self.tick_dashboard)
+        
+        self.tasks.submit(refresh, on_done=done, on_error=failed)
+    
+    def render_dashboard(self, snapshot, week):
+        """把看板数据显示到界面"""
+        wait = snapshot.average_wait
+        self.dashboard_labels['orders'].config(text=str(snapshot.order_count))
+        self.dashboard_labels['revenue'].config(text=f"¥{snapshot.revenue}")
+        self.dashboard_labels['queue'].config(text=str(snapshot.queue_length))
+        self.dashboard_labels['wait'].config(
+            text=f"{int(wait.total_seconds()) // 60}分{int(wait.total_seconds()) % 60}秒" if wait else "-")
+        self.dashboard_labels['cancelled'].config(text=str(snapshot.cancelled_count))
+        
+        for item in self.top_tree.get_children():
+            self.top_tree.delete(item)
+        for name, quantity in snapshot.top_items:
+            self.top_tree.insert('', 'end', values=(name, quantity))
+        
+        self.hour_counts = snapshot.orders_by_hour
+        self.draw_hour_chart()
+        
+        self.week_label.config(text="近7日营业额: " + "  ".join(
+            f"{row['date'].strftime('%m-%d')} ¥{row['net_revenue']}" for row in week))
+    
+    def draw_hour_chart(self):
+        """绘制每小时订单数柱状图"""
+        canvas = self.hour_canvas
+        canvas.delete('all')
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        if width < 50 or height < 50:
+            return
+        peak = max(max(self.hour_counts), 1)
+        bar_width = (width - 20) / 24
+        for hour, count in enumerate(self.hour_counts):
+            x0 = 10 + hour * bar_width
+            bar_height = (height - 40) * count / peak
+            canvas.create_rectangle(x0 + 2, height - 20 - bar_height, x0 + bar_width - 2, height - 20,
+                                    fill='#2196F3', outline='')
+            if count:
+                canvas.create_text(x0 + bar_width / 2, height - 28 - bar_height, text=str(count),
+                                   font=('Arial', 8))
+            if hour % 3 == 0:
+                canvas.create_text(x0 + bar_width / 2, height - 10, text=str(hour), font=('Arial', 8))
     
     def refresh_menu(self):
         """刷新菜单列表"""
-        # 清空树
-        for item in self.menu_tree.get_children():
-            self.menu_tree.delete(item)
-        
-        items = self.menu_service.list_all_items()
-        for item in items:
-            status = "售罄" if item.is_sold_out else "在售"
-            values = (
-                item.name,
-                f"¥{item.price}",
-                item.category or "未分类",
-                status
-            )
-            self.menu_tree.insert('', 'end', text=str(item.item_id), values=values)
+        def done(items):
+            # 清空树
+            for item in self.menu_tree.get_children():
+                self.menu_tree.delete(item)
+            
+            for item in items:
+                status = "售罄" if item.is_sold_out else "在售"
+                values = (
+                    item.name,
+                    f"¥{item.price}",
+                    item.category or "未分类",
+                    status
+                )
+                self.menu_tree.insert('', 'end', text=str(item.item_id), values=values)
+        
+        self.tasks.submit(lambda: self.menu_service.list_all_items(), on_done=done)
     
     def add_menu_item(self):
         """添加菜品"""
@@ -175,35 +325,35 @@ class AdminGUI:
         description_text.grid(row=3, column=1, padx=10, pady=10)
         
         def save():
+            name = name_entry.get().strip()
+            price_str = price_entry.get().strip()
+            category = category_entry.get().strip()
+            description = description_text.get('1.0', 'end').strip()
+            
+            if not name or not price_str:
+                messagebox.showwarning("警告", "请填写名称和价格")
+                return
+            
             try:
-                name = name_entry.get().strip()
-                price_str = price_entry.get().strip()
-                category = category_entry.get().strip()
-                description = description_text.get('1.0', 'end').strip()
-                
-                if not name or not price_str:
-                    messagebox.showwarning("警告", "请填写名称和价格")
-                    return
-                
                 price = Decimal(price_str)
-                if price < 0:
-                    messagebox.showwarning("警告", "价格不能为负数")
-                    return
-                
-                item = self.menu_service.create_item(
-                    name=name,
-                    price=price,
-                    category=category,
-                    description=description
-                )
-                
+            except (ValueError, ArithmeticError):
+                messagebox.showerror("错误", "价格格式不正确")
+                return
+            if price < 0:
+                messagebox.showwarning("警告", "价格不能为负数")
+                return
+            
+            def done(item):
                 messagebox.showinfo("成功", f"菜品 '{item.name}' 添加成功")
                 dialog.destroy()
                 self.refresh_menu()
-            except ValueError:
-                messagebox.showerror("错误", "价格格式不正确")
-            except Exception as e:
-                messagebox.showerror("错误", str(e))
+            
+            self.tasks.submit(lambda: self.menu_service.create_item(
+                name=name,
+                price=price,
+                category=category,
+                description=description
+            ), on_done=done, on_error=lambda e: messagebox.showerror("错误", str(e)))
         
         tk.Button(dialog, text="保存", command=save,
                  bg='#4CAF50', fg='white', width=15).grid(row=4, column=0, columnspan=2, pady=20)
@@ -216,11 +366,18 @@ class AdminGUI:
             return
         
         item_id = UUID(self.menu_tree.item(selection[0])['text'])
-        item = self.menu_service.get_item(item_id)
+        self.tasks.submit(lambda: self.menu_service.get_item(item_id),
+                          on_done=self.show_edit_dialog)
+    
+    def show_edit_dialog(self, item: MenuItem):
+        """显示编辑菜品对话框"""
         if not item:
             messagebox.showerror("错误", "菜品不存在")
             return
         
+        item_id = item.item_id
+        loaded_version = item.version
+        
         dialog = tk.Toplevel(self.root)
         dialog.title("编辑菜品")
         dialog.geometry("400x300")
@@ -252,37 +409,46 @@ class AdminGUI:
         description_text.grid(row=3, column=1, padx=10, pady=10)
         
         def save():
+            name = name_entry.get().strip()
+            price_str = price_entry.get().strip()
+            category = category_entry.get().strip()
+            description = description_text.get('1.0', 'end').strip()
+            
+            if not name or not price_str:
+                messagebox.showwarning("警告", "请填写名称和价格")
+                return
+            
             try:
-                name = name_entry.get().strip()
-                price_str = price_entry.get().strip()
-                category = category_entry.get().strip()
-                description = description_text.get('1.0', 'end').strip()
-                
-                if not name or not price_str:
-                    messagebox.showwarning("警告", "请填写名称和价格")
-                    return
-                
                 price = Decimal(price_str)
-                if price < 0:
-                    messagebox.showwarning("警告", "价格不能为负数")
-                    return
-                
-                updated_item = self.menu_service.update_item(
-                    item_id=item_id,
-                    name=name,
-                    price=price,
-                    category=category,
-                    description=description
-                )
-                
+            except (ValueError, ArithmeticError):
+                messagebox.showerror("错误", "价格格式不正确")
+                return
+            if price < 0:
+                messagebox.showwarning("警告", "价格不能为负数")
+                return
+            
+            def done(updated_item):
                 if updated_item:
                     messagebox.showinfo("成功", f"菜品 '{updated_item.name}' 更新成功")
                     dialog.destroy()
                     self.refresh_menu()
-            except ValueError:
-                messagebox.showerror("错误", "价格格式不正确")
-            except Exception as e:
-                messagebox.showerror("错误", str(e))
+            
+            def failed(error):
+                if isinstance(error, VersionConflictError):
+                    messagebox.showerror("冲突", str(error))
+                    dialog.destroy()
+                    self.refresh_menu()
+                else:
+                    messagebox.showerror("错误", str(error))
+            
+            self.tasks.submit(lambda: self.menu_service.update_item(
+                item_id=item_id,
+                name=name,
+                price=price,
+                category=category,
+                description=description,
+                expected_version=loaded_version
+            ), on_done=done, on_error=failed)
         
         tk.Button(dialog, text="保存", command=save,
                  bg='#4CAF50', fg='white', width=15).grid(row=4, column=0, columnspan=2, pady=20)
@@ -295,21 +461,24 @@ class AdminGUI:
             return
         
         item_id = UUID(self.menu_tree.item(selection[0])['text'])
-        item = self.menu_service.get_item(item_id)
-        if not item:
-            messagebox.showerror("错误", "菜品不存在")
-            return
-        
-        # 切换售罄状态（下架=售罄，上架=在售）
-        new_status = not item.is_sold_out
-        success = self.menu_service.mark_sold_out(item_id, new_status)
         
-        if success:
+        def toggle():
+            item = self.menu_service.get_item(item_id)
+            if not item:
+                return None
+            # 切换售罄状态（下架=售罄，上架=在售）
+            new_status = not item.is_sold_out
+            return new_status if self.menu_service.mark_sold_out(item_id, new_status) else None
+        
+        def done(new_status):
+            if new_status is None:
+                messagebox.showerror("错误", "操作失败")
+                return
             status_text = "下架" if new_status else "上架"
             messagebox.showinfo("成功", f"菜品已{status_text}")
             self.refresh_menu()
-        else:
-            messagebox.showerror("错误", "操作失败")
+        
+        self.tasks.submit(toggle, on_done=done)
     
     def delete_menu_item(self):
         """删除菜品"""
@@ -319,34 +488,66 @@ class AdminGUI:
             return
         
         item_id = UUID(self.menu_tree.item(selection[0])['text'])
-        item = self.menu_service.get_item(item_id)
-        if not item:
-            messagebox.showerror("错误", "菜品不存在")
-            return
+        name = self.menu_tree.item(selection[0])['values'][0]
         
-        if messagebox.askyesno("确认", f"确定要删除菜品 '{item.name}' 吗？"):
-            success = self.menu_service.delete_item(item_id)
+        def done(success):
             if success:
                 messagebox.showinfo("成功", "菜品已删除")
                 self.refresh_menu()
             else:
                 messagebox.showerror("错误", "删除失败")
+        
+        if messagebox.askyesno("确认", f"确定要删除菜品 '{name}' 吗？"):
+            self.tasks.submit(lambda: self.menu_service.delete_item(item_id), on_done=done)
     
-    def refresh_orders(self):
-        """刷新订单列表"""
-        # 清空树
-        for item in self.order_tree.get_children():
-            self.order_tree.delete(item)
-        
-        orders = self.order_service.list_orders()
-        for order in orders:
-            values = (
-                str(order.order_id)[:8],
-                order.status.value,
-                f"¥{order.total_amount()}",
-                order.created_at.strftime("%Y-%m-%d %H:%M")
-            )
-            self.order_tree.insert('', 'end', text=str(order.order_id), values=values)
+    def refresh_orders(self, then=None):
+        """刷新订单列表；then 为刷新完成后在界面线程中执行的回调"""
+        def done(orders):
+            # 清空树
+            for item in self.order_tree.get_children():
+                self.order_tree.delete(item)
+            
+            self.order_versions = {order.order_id: order.version for order in orders}
+            for order in orders:
+                values = (
+                    order.short_code(),
+                    order.status.value,
+                    f"¥{order.total_amount()}",
+                    order.created_at.strftime("%Y-%m-%d %H:%M")
+                )
+                self.order_tree.insert('', 'end', iid=str(order.order_id),
+                                       text=str(order.order_id), values=values)
+            if then:
+                then()
+        
+        self.tasks.submit(lambda: self.order_service.list_orders(), on_done=done)
+    
+    def find_order_by_code(self):
+        """按取餐码或订单号前缀定位订单"""
+        code = self.code_entry.get().strip()
+        if not code:
+            messagebox.showwarning("警告", "请输入取餐码或订单号")
+            return
+        
+        def done(orders):
+            if not orders:
+                messagebox.showinfo("提示", f"未找到订单：{code}")
+                return
+            
+            iids = [str(order.order_id) for order in orders]
+            
+            def select():
+                iids_shown = [iid for iid in iids if self.order_tree.exists(iid)]
+                if iids_shown:
+                    self.order_tree.selection_set(iids_shown)
+                    self.order_tree.see(iids_shown[0])
+            
+            if all(self.order_tree.exists(iid) for iid in iids):
+                select()
+            else:
+                self.refresh_orders(then=select)
+        
+        self.tasks.submit(lambda: self.order_service.find_by_code(code), on_done=done)
     
     def update_order_status(self, status: OrderStatus):
         """更新订单状态"""
@@ -356,13 +557,18 @@ class AdminGUI:
             return
         
         order_id = UUID(self.order_tree.item(selection[0])['text'])
-        success, message = self.order_service.update_status(order_id, status)
+        expected_version = self.order_versions.get(order_id)
         
-        if success:
-            messagebox.showinfo("成功", message)
+        def done(result):
+            success, message = result
+            if success:
+                messagebox.showinfo("成功", message)
+            else:
+                messagebox.showerror("错误", message)
             self.refresh_orders()
-        else:
-            messagebox.showerror("错误", message)
+        
+        self.tasks.submit(lambda: self.order_service.update_status(
+            order_id, status, expected_version), on_done=done)
     
     def view_order_detail(self):
         """查看订单详情"""
@@ -372,8 +578,11 @@ class AdminGUI:
             return
         
         order_id = UUID(self.order_tree.item(selection[0])['text'])
-        order = self.order_service.get_order(order_id)
-        
+        self.tasks.submit(lambda: self.order_service.get_order(order_id),
+                          on_done=self.show_order_detail)
+    
+    def show_order_detail(self, order):
+        """显示订单详情窗口"""
         if not order:
             messagebox.showerror("错误", "订单不存在")
             return
@@ -388,7 +597,7 @@ class AdminGUI:
         text.pack(fill='both', expand=True, padx=10, pady=10)
         
         # 显示订单信息
-        text.insert('end', f"订单号: {str(order.order_id)[:8]}\n")
+        text.insert('end', f"取餐码: {order.short_code()}\n")
         text.insert('end', f"状态: {order.status.value}\n")
         text.insert('end', f"时间: {order.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n")
         text.insert('end', f"备注: {order.remark or '无'}\n")
@@ -405,6 +614,8 @@ class AdminGUI:
             text.insert('end', f"  小计: ¥{item.subtotal()}\n")
         
         text.insert('end', "\n" + "-" * 50 + "\n")
+        if order.discount:
+            text.insert('end', f"优惠: -¥{order.discount}（{'、'.join(order.applied_promotions)}）\n")
         text.insert('end', f"总计: ¥{order.total_amount()}\n")
         
         text.config(state='disabled')
@@ -8,47 +8,81 @@ from tkinter import ttk, messagebox, scrolledtext
 from decimal import Decimal
 from typing import Optional
 
+from app_services import AppServices, service_property
+from gui_tasks import TaskRunner
 from models import User, MenuItem, Sweetness, OrderStatus
-from services import (
-    AuthService, MenuService, CartService, OrderService,
-    ReviewService, FavoriteService, PromotionService
-)
 
 
 class CustomerGUI:
     """顾客端GUI主类"""
     
-    def __init__(self, root: tk.Tk):
+    auth_service = service_property('auth_service')
+    menu_service = service_property('menu_service')
+    cart_service = service_property('cart_service')
+    promotion_service = service_property('promotion_service')
+    order_service = service_property('order_service')
+    review_service = service_property('review_service')
+    favorite_service = service_property('favorite_service')
+    
+    def __init__(self, root: tk.Tk, services: AppServices = None):
         self.root = root
         self.root.title("奶茶点单系统 - 顾客端")
         self.root.geometry("1000x700")
         
-        # 初始化服务
-        self.auth_service = AuthService()
-        self.menu_service = MenuService()
-        self.cart_service = CartService()
-        self.order_service = OrderService()
-        self.review_service = ReviewService()
-        self.favorite_service = FavoriteService()
-        self.promotion_service = PromotionService()
+        # 共享服务；未预先加载时在首次使用时读盘
+        self.services = services or AppServices()
         
         # 当前用户
         self.current_user: Optional[User] = None
         
         # 声明 UI 组件属性 (修复 Pylint W0201)
         self.user_label = None
+        self.busy_label = None
+        self.tasks = None
         self.notebook = None
         self.login_phone = None
         self.register_nickname = None
         self.register_phone = None
         self.menu_listbox = None
+        self.menu_search_var = None
+        self.menu_category_var = None
+        self.menu_category_box = None
+        # 菜单列表当前显示的商品，与 Listbox 行号一一对应
+        self.displayed_items = []
+        # 小料列表当前显示的小料，与 Listbox 行号一一对应
+        self.displayed_toppings = ()
         self.cart_tree = None
         self.order_tree = None
+        self.order_cache = {}
         self.favorite_listbox = None
+        # 收藏列表当前显示的收藏，与 Listbox 行号一一对应
+        self.displayed_favorites = []
         self.promotion_text = None
         
-        # 创建主界面
+        # 创建主界面，窗口绘制之后再加载数据
         self.create_widgets()
+        self.tasks = TaskRunner(self.root, self.busy_label)
+        self.root.after_idle(self.load_initial_data)
+    
+    def load_initial_data(self):
+        """加载促销并订阅生效变化；促销开始或结束时由调度器通知，切回界面线程刷新"""
+        def subscribe():
+            self.promotion_service.subscribe(self.on_promotions_changed)
+            self.promotion_service.scheduler.start()
+            return self.promotion_service.list_active_promotions()
+        
+        self.tasks.submit(subscribe, on_done=self.show_promotions)
+        # 服务可能被其他窗口共用，关闭窗口时取消订阅
+        self.root.bind('<Destroy>', self.on_destroy, add='+')
+    
+    def on_promotions_changed(self, promotions):
+        """调度器线程回调：把新的生效集合交给界面线程显示"""
+        self.tasks.post(self.show_promotions, promotions)
+    
+    def on_destroy(self, event):
+        """窗口关闭"""
+        if event.widget is self.root:
+            self.services.promotion_service.unsubscribe(self.on_promotions_changed)
     
     def create_widgets(self):
         """创建主界面组件"""
@@ -103,6 +137,11 @@ class CustomerGUI:
                                    font=('Arial', 12),
                                    bg='#FF6B9D', fg='white')
         self.user_label.pack(side='right', padx=20)
+        
+        # 忙碌指示：有后台任务未完成时显示
+        self.busy_label = tk.Label(header, text="", font=('Arial', 10),
+                                   bg='#FF6B9D', fg='white')
+        self.busy_label.pack(side='right')
     
     def create_login_tab(self):
         """创建登录/注册标签页"""
@@ -140,6 +179,21 @@ class CustomerGUI:
         
         tk.Label(left_frame, text="菜单列表", font=('Arial', 14, 'bold')).pack()
         
+        # 搜索栏：关键字 / 拼音首字母 + 分类筛选
+        search_frame = ttk.Frame(left_frame)
+        search_frame.pack(fill='x', pady=5)
+        
+        tk.Label(search_frame, text="搜索:").pack(side='left')
+        self.menu_search_var = tk.StringVar()
+        self.menu_search_var.trace_add('write', lambda *args: self.filter_menu())
+        tk.Entry(search_frame, textvariable=self.menu_search_var, width=16).pack(side='left', padx=5)
+        
+        self.menu_category_var = tk.StringVar(value="全部")
+        self.menu_category_box = ttk.Combobox(search_frame, textvariable=self.menu_category_var,
+                                              state='readonly', width=10, values=["全部"])
+        self.menu_category_box.pack(side='left', padx=5)
+        self.menu_category_box.bind('<<ComboboxSelected>>', lambda event: self.filter_menu())
+        
         # 菜单列表
         menu_list_frame = ttk.Frame(left_frame)
         menu_list_frame.pack(fill='both', expand=True, pady=10)
@@ -252,7 +306,7 @@ class CustomerGUI:
         tk.Label(list_frame, text="我的订单", font=('Arial', 14, 'bold')).pack()
         
         # 创建表格
-        columns = ('订单号', '状态', '金额', '时间', '备注')
+        columns = ('取餐码', '状态', '金额', '时间', '备注')
         self.order_tree = ttk.Treeview(list_frame, columns=columns, show='tree headings', height=15)
         
         self.order_tree.heading('#0', text='ID')
@@ -274,6 +328,8 @@ class CustomerGUI:
         
         tk.Button(bottom_frame, text="刷新订单", command=self.load_orders,
                  bg='#2196F3', fg='white', width=15).pack(side='left', padx=5)
+        tk.Button(bottom_frame, text="全部历史", command=lambda: self.load_orders(full_history=True),
+                 bg='#607D8B', fg='white', width=15).pack(side='left', padx=5)
         tk.Button(bottom_frame, text="查看详情", command=self.view_order_detail,
                  bg='#9C27B0', fg='white', width=15).pack(side='left', padx=5)
         tk.Button(bottom_frame, text="评价订单", command=self.review_order,
@@ -317,11 +373,9 @@ class CustomerGUI:
         # 按钮
         tk.Button(self.promotion_frame, text="刷新", command=self.load_promotions,
                  bg='#2196F3', fg='white', width=15).pack(pady=10)
-        
-        # 自动加载促销
-        self.load_promotions()
     
     # 事件处理方法
+    # 服务调用都经 self.tasks 在工作线程中执行，回调在界面线程中更新界面
     
     def do_login(self):
         """执行登录"""
@@ -330,8 +384,11 @@ class CustomerGUI:
             messagebox.showwarning("警告", "请输入手机号")
             return
         
-        success, message, user = self.auth_service.login(phone)
-        if success:
+        def done(result):
+            success, message, user = result
+            if not success:
+                messagebox.showerror("错误", message)
+                return
             self.current_user = user
             self.user_label.config(text=f"欢迎，{user.nickname}")
             messagebox.showinfo("成功", message)
@@ -343,8 +400,8 @@ class CustomerGUI:
             # 切换到菜单页
             self.notebook.select(1)
             self.load_menu()
-        else:
-            messagebox.showerror("错误", message)
+        
+        self.tasks.submit(lambda: self.auth_service.login(phone), on_done=done)
     
     def do_register(self):
         """执行注册"""
@@ -355,30 +412,61 @@ class CustomerGUI:
             messagebox.showwarning("警告", "请填写所有字段")
             return
         
-        success, message, user = self.auth_service.register(nickname, phone)
-        if success:
-            messagebox.showinfo("成功", message)
-            self.register_nickname.delete(0, 'end')
-            self.register_phone.delete(0, 'end')
-        else:
-            messagebox.showerror("错误", message)
+        def done(result):
+            success, message, _ = result
+            if success:
+                messagebox.showinfo("成功", message)
+                self.register_nickname.delete(0, 'end')
+                self.register_phone.delete(0, 'end')
+            else:
+                messagebox.showerror("错误", message)
+        
+        self.tasks.submit(lambda: self.auth_service.register(nickname, phone), on_done=done)
     
     def load_menu(self):
         """加载菜单"""
-        self.menu_listbox.delete(0, 'end')
-        items = self.menu_service.list_items()
-        
-        for item in items:
-            status = "【售罄】" if item.is_sold_out else ""
-            self.menu_listbox.insert('end', 
-                                    f"{status}{item.name} - ¥{item.price}")
+        self.filter_menu()
         
         # 加载小料
-        self.topping_listbox.delete(0, 'end')
-        toppings = self.menu_service.list_toppings()
-        for topping in toppings:
-            self.topping_listbox.insert('end', 
-                                       f"{topping.name} +¥{topping.extra_price}")
+        def done(toppings):
+            self.topping_listbox.delete(0, 'end')
+            self.displayed_toppings = toppings
+            for topping in toppings:
+                self.topping_listbox.insert('end', 
+                                           f"{topping.name} +¥{topping.extra_price}")
+        
+        self.tasks.submit(lambda: self.menu_service.list_toppings(), on_done=done)
+    
+    def filter_menu(self):
+        """按搜索关键字和分类刷新菜单列表"""
+        query = self.menu_search_var.get().strip()
+        category = self.menu_category_var.get().rsplit(' (', 1)[0]
+        
+        def search():
+            facets = self.menu_service.category_facets(query)
+            if query:
+                items = self.menu_service.search_items(
+                    query, category=None if category == "全部" else category)
+            elif category == "全部":
+                # 无关键字时直接使用共享的目录快照
+                items = self.menu_service.list_items()
+            else:
+                items = self.menu_service.list_items_by_category(category)
+            return facets, items
+        
+        def done(result):
+            facets, items = result
+            self.menu_category_box.config(
+                values=["全部"] + [f"{name} ({count})" for name, count in sorted(facets.items()) if name])
+            self.menu_listbox.delete(0, 'end')
+            self.displayed_items = items
+            for item in items:
+                status = "【售罄】" if item.is_sold_out else ""
+                self.menu_listbox.insert('end', 
+                                        f"{status}{item.name} - ¥{item.price}")
+        
+        # 任务按顺序完成，连续输入时最后一次搜索的结果最后显示
+        self.tasks.submit(search, on_done=done)
     
     def on_menu_item_select(self, event):
         """菜单项选择事件"""
@@ -397,8 +485,7 @@ class CustomerGUI:
             return
         
         # 获取选中的商品
-        items = self.menu_service.list_items()
-        item = items[selection[0]]
+        item = self.displayed_items[selection[0]]
         
         # 获取甜度
         sweetness_value = self.sweetness_var.get()
@@ -409,22 +496,22 @@ class CustomerGUI:
         
         # 获取小料
         topping_indices = self.topping_listbox.curselection()
-        toppings = self.menu_service.list_toppings()
-        topping_ids = [toppings[i].topping_id for i in topping_indices]
+        topping_ids = [self.displayed_toppings[i].topping_id for i in topping_indices]
         
         # 获取备注
         remark = self.remark_entry.get()
         
-        # 添加到购物车
-        success, message = self.cart_service.add_to_cart(
-            self.current_user.user_id, item.item_id, quantity,
-            sweetness, topping_ids, remark
-        )
+        def done(result):
+            success, message = result
+            if success:
+                messagebox.showinfo("成功", message)
+            else:
+                messagebox.showerror("错误", message)
         
-        if success:
-            messagebox.showinfo("成功", message)
-        else:
-            messagebox.showerror("错误", message)
+        # 添加到购物车
+        user_id = self.current_user.user_id
+        self.tasks.submit(lambda: self.cart_service.add_to_cart(
+            user_id, item.item_id, quantity, sweetness, topping_ids, remark), on_done=done)
     
     def toggle_favorite(self):
         """切换收藏状态"""
@@ -437,51 +524,71 @@ class CustomerGUI:
             messagebox.showwarning("警告", "请选择商品")
             return
         
-        items = self.menu_service.list_items()
-        item = items[selection[0]]
+        item = self.displayed_items[selection[0]]
+        user_id = self.current_user.user_id
         
-        # 检查是否已收藏
-        if self.favorite_service.is_favorited(self.current_user.user_id, item.item_id):
-            success, message = self.favorite_service.remove_favorite(
-                self.current_user.user_id, item.item_id)
-        else:
-            success, message = self.favorite_service.add_favorite(
-                self.current_user.user_id, item.item_id)
+        def toggle():
+            # 检查是否已收藏
+            if self.favorite_service.is_favorited(user_id, item.item_id):
+                return self.favorite_service.remove_favorite(user_id, item.item_id)
+            return self.favorite_service.add_favorite(user_id, item.item_id)
         
-        if success:
-            messagebox.showinfo("成功", message)
-        else:
-            messagebox.showwarning("提示", message)
+        def done(result):
+            success, message = result
+            if success:
+                messagebox.showinfo("成功", message)
+            else:
+                messagebox.showwarning("提示", message)
+        
+        self.tasks.submit(toggle, on_done=done)
     
     def load_cart(self):
         """加载购物车"""
         if not self.current_user:
             return
+        user_id = self.current_user.user_id
+        
+        def fetch():
+            cart = self.cart_service.get_cart(user_id)
+            if not cart:
+                return [], None
+            # 复制一份明细：界面线程显示时工作线程可能正在修改购物车
+            items = list(cart.items)
+            # 按当前生效促销计价
+            return items, self.promotion_service.quote(items)
+        
+        def done(result):
+            items, quote = result
+            
+            # 清空树
+            for item in self.cart_tree.get_children():
+                self.cart_tree.delete(item)
+            
+            if quote is None:
+                self.cart_total_label.config(text="总计: ¥0.00")
+                return
+            
+            # 添加项目
+            for order_item in items:
+                toppings_str = ", ".join(t.name for t in order_item.toppings)
+                values = (
+                    order_item.menu_item.name,
+                    order_item.sweetness.value,
+                    toppings_str or "无",
+                    order_item.quantity,
+                    f"¥{order_item.menu_item.price}",
+                    f"¥{order_item.subtotal()}"
+                )
+                self.cart_tree.insert('', 'end', text=str(order_item.order_item_id), values=values)
+            
+            # 更新总计
+            if quote.discount:
+                self.cart_total_label.config(
+                    text=f"原价: ¥{quote.subtotal}  优惠: -¥{quote.discount}  总计: ¥{quote.total}")
+            else:
+                self.cart_total_label.config(text=f"总计: ¥{quote.total}")
         
-        # 清空树
-        for item in self.cart_tree.get_children():
-            self.cart_tree.delete(item)
-        
-        cart = self.cart_service.get_cart(self.current_user.user_id)
-        if not cart:
-            self.cart_total_label.config(text="总计: ¥0.00")
-            return
-        
-        # 添加项目
-        for order_item in cart.items:
-            toppings_str = ", ".join(t.name for t in order_item.toppings)
-            values = (
-                order_item.menu_item.name,
-                order_item.sweetness.value,
-                toppings_str or "无",
-                order_item.quantity,
-                f"¥{order_item.menu_item.price}",
-                f"¥{order_item.subtotal()}"
-            )
-            self.cart_tree.insert('', 'end', text=str(order_item.order_item_id), values=values)
-        
-        # 更新总计
-        self.cart_total_label.config(text=f"总计: ¥{cart.total()}")
+        self.tasks.submit(fetch, on_done=done)
     
     def remove_from_cart(self):
         """从购物车移除"""
@@ -495,8 +602,9 @@ class CustomerGUI:
         
         item_id = self.cart_tree.item(selection[0])['text']
         from uuid import UUID
-        self.cart_service.remove_from_cart(self.current_user.user_id, UUID(item_id))
-        self.load_cart()
+        user_id = self.current_user.user_id
+        self.tasks.submit(lambda: self.cart_service.remove_from_cart(user_id, UUID(item_id)),
+                          on_done=lambda _: self.load_cart())
     
     def clear_cart(self):
         """清空购物车"""
@@ -504,51 +612,70 @@ class CustomerGUI:
             return
         
         if messagebox.askyesno("确认", "确定要清空购物车吗？"):
-            self.cart_service.clear_cart(self.current_user.user_id)
-            self.load_cart()
+            user_id = self.current_user.user_id
+            self.tasks.submit(lambda: self.cart_service.clear_cart(user_id),
+                              on_done=lambda _: self.load_cart())
     
     def checkout(self):
         """结算"""
         if not self.current_user:
             return
+        user_id = self.current_user.user_id
         
-        cart = self.cart_service.get_cart(self.current_user.user_id)
-        if not cart or not cart.items:
-            messagebox.showwarning("警告", "购物车为空")
-            return
-        
-        # 询问备注
-        remark = tk.simpledialog.askstring("备注", "请输入订单备注（可选）:")
+        def confirm(cart):
+            if not cart or not cart.items:
+                messagebox.showwarning("警告", "购物车为空")
+                return
+            
+            # 同一购物车状态（ID+版本号）重复结算时使用相同的幂等键，避免双击重复下单
+            idempotency_key = f"{cart.cart_id}:{cart.version}"
+            
+            # 询问备注
+            remark = tk.simpledialog.askstring("备注", "请输入订单备注（可选）:")
+            
+            self.tasks.submit(lambda: self.order_service.place_order(
+                user_id, remark or "", idempotency_key), on_done=done)
         
-        success, message, order = self.order_service.place_order(
-            self.current_user.user_id, remark or "")
+        def done(result):
+            success, message, _ = result
+            if success:
+                messagebox.showinfo("成功", message)
+                self.load_cart()
+            else:
+                messagebox.showerror("错误", message)
         
-        if success:
-            messagebox.showinfo("成功", message)
-            self.load_cart()
-        else:
-            messagebox.showerror("错误", message)
+        self.tasks.submit(lambda: self.cart_service.get_cart(user_id), on_done=confirm)
     
-    def load_orders(self):
-        """加载订单"""
+    def load_orders(self, full_history: bool = False):
+        """加载订单；full_history 为 True 时包含已归档的历史订单"""
         if not self.current_user:
             return
+        user_id = self.current_user.user_id
         
-        # 清空树
-        for item in self.order_tree.get_children():
-            self.order_tree.delete(item)
-        
-        orders = self.order_service.list_orders(self.current_user.user_id)
+        def fetch():
+            if full_history:
+                return self.order_service.list_order_history(user_id)
+            return self.order_service.list_orders(user_id)
         
-        for order in orders:
-            values = (
-                str(order.order_id)[:8],
-                order.status.value,
-                f"¥{order.total_amount()}",
-                order.created_at.strftime("%Y-%m-%d %H:%M"),
-                order.remark or "无"
-            )
-            self.order_tree.insert('', 'end', text=str(order.order_id), values=values)
+        def done(orders):
+            # 清空树
+            for item in self.order_tree.get_children():
+                self.order_tree.delete(item)
+            
+            # 已归档的订单不在热数据中，查看详情时从这里取
+            self.order_cache = {str(order.order_id): order for order in orders}
+            
+            for order in orders:
+                values = (
+                    order.short_code(),
+                    order.status.value,
+                    f"¥{order.total_amount()}",
+                    order.created_at.strftime("%Y-%m-%d %H:%M"),
+                    order.remark or "无"
+                )
+                self.order_tree.insert('', 'end', text=str(order.order_id), values=values)
+        
+        self.tasks.submit(fetch, on_done=done)
     
     def view_order_detail(self):
         """查看订单详情"""
@@ -559,8 +686,12 @@ class CustomerGUI:
         
         order_id = self.order_tree.item(selection[0])['text']
         from uuid import UUID
-        order = self.order_service.get_order(UUID(order_id))
-        
+        self.tasks.submit(lambda: self.order_service.get_order(UUID(order_id)),
+                          on_done=lambda order: self.show_order_detail(
+                              order or self.order_cache.get(order_id)))
+    
+    def show_order_detail(self, order):
+        """显示订单详情窗口"""
         if not order:
             return
         
@@ -573,7 +704,7 @@ class CustomerGUI:
         text.pack(fill='both', expand=True, padx=10, pady=10)
         
         # 显示订单信息
-        text.insert('end', f"订单号: {str(order.order_id)[:8]}\n")
+        text.insert('end', f"取餐码: {order.short_code()}\n")
         text.insert('end', f"状态: {order.status.value}\n")
         text.insert('end', f"时间: {order.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n")
         text.insert('end', f"备注: {order.remark or '无'}\n")
@@ -590,6 +721,8 @@ class CustomerGUI:
             text.insert('end', f"  小计: ¥{item.subtotal()}\n")
         
         text.insert('end', "\n" + "-" * 50 + "\n")
+        if order.discount:
+            text.insert('end', f"优惠: -¥{order.discount}（{'、'.join(order.applied_promotions)}）\n")
         text.insert('end', f"总计: ¥{order.total_amount()}\n")
         
         text.config(state='disabled')
@@ -606,6 +739,7 @@ class CustomerGUI:
         
         order_id = self.order_tree.item(selection[0])['text']
         from uuid import UUID
+        user_id = self.current_user.user_id
         
         # 创建评价窗口
         review_window = tk.Toplevel(self.root)
@@ -625,14 +759,16 @@ class CustomerGUI:
             rating = rating_var.get()
             content = content_text.get('1.0', 'end').strip()
             
-            success, message, review = self.review_service.create_review(
-                self.current_user.user_id, UUID(order_id), rating, content)
+            def done(result):
+                success, message, _ = result
+                if success:
+                    messagebox.showinfo("成功", message)
+                    review_window.destroy()
+                else:
+                    messagebox.showerror("错误", message)
             
-            if success:
-                messagebox.showinfo("成功", message)
-                review_window.destroy()
-            else:
-                messagebox.showerror("错误", message)
+            self.tasks.submit(lambda: self.review_service.create_review(
+                user_id, UUID(order_id), rating, content), on_done=done)
         
         tk.Button(review_window, text="提交评价", command=submit_review,
                  bg='#FF6B9D', fg='white', width=20).pack(pady=10)
@@ -641,15 +777,16 @@ class CustomerGUI:
         """加载收藏"""
         if not self.current_user:
             return
+        user_id = self.current_user.user_id
         
-        self.favorite_listbox.delete(0, 'end')
-        favorites = self.favorite_service.list_favorites(self.current_user.user_id)
-        
-        for fav in favorites:
-            item = self.menu_service.get_item(fav.item_id)
-            if item:
+        def done(favorites):
+            self.favorite_listbox.delete(0, 'end')
+            self.displayed_favorites = favorites
+            for favorite in favorites:
                 self.favorite_listbox.insert('end', 
-                                            f"{item.name} - ¥{item.price}")
+                                            f"{favorite.item.name} - ¥{favorite.item.price}")
+        
+        self.tasks.submit(lambda: self.favorite_service.list_favorite_items(user_id), on_done=done)
     
     def remove_favorite(self):
         """移除收藏"""
@@ -660,21 +797,25 @@ class CustomerGUI:
         if not selection:
             messagebox.showwarning("警告", "请选择要取消的收藏")
             return
+        user_id = self.current_user.user_id
+        item_id = self.displayed_favorites[selection[0]].item.item_id
         
-        favorites = self.favorite_service.list_favorites(self.current_user.user_id)
-        fav = favorites[selection[0]]
-        
-        success, message = self.favorite_service.remove_favorite(
-            self.current_user.user_id, fav.item_id)
+        def done(result):
+            success, message = result
+            if success:
+                messagebox.showinfo("成功", message)
+                self.load_favorites()
         
-        if success:
-            messagebox.showinfo("成功", message)
-            self.load_favorites()
+        self.tasks.submit(lambda: self.favorite_service.remove_favorite(user_id, item_id), on_done=done)
     
     def load_promotions(self):
         """加载促销活动"""
+        self.tasks.submit(lambda: self.promotion_service.list_active_promotions(),
+                          on_done=self.show_promotions)
+    
+    def show_promotions(self, promotions):
+        """显示促销活动"""
         self.promotion_text.delete('1.0', 'end')
-        promotions = self.promotion_service.list_active_promotions()
         
         if not promotions:
             self.promotion_text.insert('end', "暂无促销活动\n")
@@ -0,0 +1,133 @@
+"""
+奶茶点单系统 - 界面后台任务
+服务调用（读写仓储、同步其他终端的修改）在工作线程中执行，结果经 root.after 交回界面线程，
+界面主循环不会因仓储 I/O 卡住；有任务未完成时显示忙碌指示。
+其他线程（如促销调度器）的通知用 post() 交给界面线程，不能在这些线程中直接调用 Tk
+"""
+
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
+from tkinter import messagebox
+from typing import Callable, Optional
+
+# 有任务未完成时检查结果的间隔（毫秒）
+POLL_MS = 20
+
+# 检查其他线程投递的回调的间隔（毫秒）
+POST_POLL_MS = 100
+
+
+class TaskRunner:
+    """
+    窗口的后台任务执行器
+    每个窗口一个工作线程，任务按提交顺序执行（先加购再结算不会乱序）；
+    完成回调总在界面线程中执行，窗口关闭后不再回调
+    """
+
+    def __init__(self, root, indicator=None, busy_text: str = "处理中…"):
+        """
+        root: 所属窗口，用于 after 调度和忙碌时的鼠标样式
+        indicator: 可选的 Label，忙碌时显示 busy_text
+        """
+        self.root = root
+        self.indicator = indicator
+        self.busy_text = busy_text
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gui-task')
+        # 工作线程只往队列里放结果，界面组件只在界面线程中访问
+        self._results: queue.SimpleQueue = queue.SimpleQueue()
+        # 其他线程投递、待在界面线程执行的回调
+        self._posted: queue.SimpleQueue = queue.SimpleQueue()
+        self._pending = 0
+        self._polling = False
+        self._closed = False
+        root.bind('<Destroy>', self._on_destroy, add='+')
+        root.after(POST_POLL_MS, self._poll_posted)
+
+    @property
+    def busy(self) -> bool:
+        """是否有未完成的任务"""
+        return self._pending > 0
+
+    def submit(self, func: Callable, *args, on_done: Optional[Callable] = None,
+               on_error: Optional[Callable[[Exception], None]] = None, **kwargs) -> Optional[Future]:
+        """
+        在工作线程中执行 func(*args, **kwargs)
+        完成后在界面线程调用 on_done(返回值)；出错时调用 on_error(异常)，未提供时弹窗提示
+        """
+        if self._closed:
+            return None
+        future = self._executor.submit(func, *args, **kwargs)
+        self._pending += 1
+        self._set_busy(True)
+        future.add_done_callback(lambda f: self._results.put((f, on_done, on_error)))
+        self._schedule_poll()
+        return future
+
+    def post(self, callback: Callable, *args):
+        """
+        从任意线程投递 callback(*args)，由界面线程在下一次检查时执行；窗口关闭后丢弃
+        只操作线程安全的队列，不调用 Tk
+        """
+        if not self._closed:
+            self._posted.put((callback, args))
+
+    def _poll_posted(self):
+        """在界面线程中执行投递的回调；先安排下一次检查，回调出错不会中断检查"""
+        if self._closed:
+            return
+        self.root.after(POST_POLL_MS, self._poll_posted)
+        while True:
+            try:
+                callback, args = self._posted.get_nowait()
+            except queue.Empty:
+                return
+            callback(*args)
+
+    def _schedule_poll(self, delay: int = POLL_MS):
+        if not self._polling:
+            self._polling = True
+            self.root.after(delay, self._poll)
+
+    def _poll(self):
+        """
+        在界面线程中处理一个完成的任务
+        先安排下一次检查再执行回调：回调中弹出的对话框会运行嵌套的事件循环，其他任务的结果照常交付
+        """
+        self._polling = False
+        if self._closed:
+            return
+        try:
+            future, on_done, on_error = self._results.get_nowait()
+        except queue.Empty:
+            future = None
+        else:
+            self._pending -= 1
+        if self._pending:
+            self._schedule_poll(0 if future else POLL_MS)
+        else:
+            self._set_busy(False)
+        if future is None:
+            return
+        error = future.exception()
+        if error is None:
+            if on_done:
+                on_done(future.result())
+        elif on_error:
+            on_error(error)
+        else:
+            messagebox.showerror("错误", f"操作失败: {error}")
+
+    def _set_busy(self, busy: bool):
+        """切换忙碌指示和鼠标样式"""
+        if self.indicator is not None:
+            self.indicator.config(text=self.busy_text if busy else "")
+        self.root.config(cursor='watch' if busy else '')
+
+    def _on_destroy(self, event):
+        if event.widget is self.root:
+            self.close()
+
+    def close(self):
+        """停止执行器：未开始的任务取消，正在执行的任务完成后不再回调"""
+        self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,469 @@
+"""
+奶茶点单系统 - 数据批量导入
+流式读取 CSV / JSONL / JSON 数组文件，逐行按模型校验后分批写入仓储（每批一次写锁、一次写盘），
+报告进度和无效行。订单 CSV 与 exporters.py 导出的订单明细格式相同（每个订单项一行）。
+
+用法:
+    python importers.py menu_items menu.csv
+    python importers.py orders legacy_orders.jsonl.gz --errors bad_rows.jsonl
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import UUID, NAMESPACE_URL, uuid5
+
+from models import MenuItem, Order, OrderItem, OrderStatus, Sweetness, Topping
+from money import to_cents
+from repositories import (
+    MenuItemRepository, OrderRepository, SalesRollupStore, ToppingRepository, iter_json_array
+)
+
+# 报告中最多保留的无效行明细
+MAX_BAD_ROWS = 1000
+
+# (行号, 记录, 解析错误)
+Record = Tuple[int, Optional[dict], Optional[str]]
+
+
+@dataclass
+class BadRow:
+    """无效行"""
+    line: int  # 源文件行号（CSV、JSONL）或数组下标（JSON）
+    reason: str
+    data: Optional[dict] = None
+
+    def to_dict(self):
+        """转换为字典"""
+        return {'line': self.line, 'reason': self.reason, 'data': self.data}
+
+
+@dataclass
+class ImportReport:
+    """导入结果"""
+    kind: str
+    rows: int = 0  # 已读取的行数
+    imported: int = 0  # 已写入的实体数
+    rejected: int = 0  # 无效行数
+    bad_rows: List[BadRow] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        """吞吐量"""
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def reject(self, line: int, reason: str, data: dict = None):
+        """记录无效行"""
+        self.rejected += 1
+        if len(self.bad_rows) < MAX_BAD_ROWS:
+            self.bad_rows.append(BadRow(line, reason, data))
+
+    def summary(self) -> str:
+        """一行摘要"""
+        return (f"已读取 {self.rows} 行，导入 {self.imported} 条，无效 {self.rejected} 行，"
+                f"用时 {self.elapsed:.2f} 秒（{self.rows_per_second:,.0f} 行/秒）")
+
+
+# 读取
+
+def _open_text(path: Path, encoding: str):
+    """打开文本文件，.gz 结尾时透明解压"""
+    if path.name.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding=encoding, newline='')
+    return open(path, 'r', encoding=encoding, newline='')
+
+
+def read_records(path: Path) -> Iterator[Record]:
+    """按扩展名流式读取记录：.csv、.jsonl/.ndjson、.json（顶层为数组），均可再加 .gz"""
+    name = path.name[:-3] if path.name.endswith('.gz') else path.name
+    if name.endswith('.csv'):
+        with _open_text(path, 'utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row, None
+    elif name.endswith(('.jsonl', '.ndjson')):
+        with _open_text(path, 'utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_no, None, f"JSON 格式错误: {e}"
+                    continue
+                if isinstance(record, dict):
+                    yield line_no, record, None
+                else:
+                    yield line_no, None, "每行必须是 JSON 对象"
+    elif name.endswith('.json'):
+        if path.name.endswith('.gz'):
+            raise ValueError("JSON 数组文件不支持 gzip，请改用 JSONL")
+        for index, record in enumerate(iter_json_array(path)):
+            if isinstance(record, dict):
+                yield index, record, None
+            else:
+                yield index, None, "数组元素必须是 JSON 对象"
+    else:
+        raise ValueError(f"不支持的文件类型: {path.name}")
+
+
+# 字段校验
+
+def _text(record: dict, name: str, required: bool = False) -> str:
+    value = record.get(name)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f"缺少字段 {name}")
+    return value
+
+
+def _amount(record: dict, name: str, required: bool = True) -> Optional[Decimal]:
+    value = _text(record, name, required)
+    if not value:
+        return None
+    try:
+        amount = Decimal(value)
+    except InvalidOperation as e:
+        raise ValueError(f"字段 {name} 不是合法的金额: {value}") from e
+    if not amount.is_finite() or amount < 0:
+        raise ValueError(f"字段 {name} 金额无效: {value}")
+    return amount
+
+
+def _flag(record: dict, name: str, default: bool) -> bool:
+    value = record.get(name)
+    if value in (None, ''):
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('1', 'true', 'yes', 'y', '是'):
+        return True
+    if text in ('0', 'false', 'no', 'n', '否'):
+        return False
+    raise ValueError(f"字段 {name} 不是合法的布尔值: {value}")
+
+
+def _uuid(record: dict, name: str) -> Optional[UUID]:
+    value = _text(record, name)
+    if not value:
+        return None
+    try:
+        return UUID(value)
+    except ValueError as e:
+        raise ValueError(f"字段 {name} 不是合法的ID: {value}") from e
+
+
+def _quantity(record: dict, name: str = 'quantity') -> int:
+    value = _text(record, name, required=True)
+    try:
+        quantity = int(value)
+    except ValueError as e:
+        raise ValueError(f"字段 {name} 不是整数: {value}") from e
+    if quantity <= 0:
+        raise ValueError(f"字段 {name} 必须大于0: {value}")
+    return quantity
+
+
+def _enum(enum_class, record: dict, name: str, default):
+    value = _text(record, name)
+    if not value:
+        return default
+    for member in enum_class:
+        if value in (member.name, member.value):
+            return member
+    raise ValueError(f"字段 {name} 取值无效: {value}")
+
+
+def _datetime(record: dict, name: str) -> datetime:
+    value = _text(record, name, required=True)
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError as e:
+        raise ValueError(f"字段 {name} 不是合法的时间: {value}") from e
+
+
+def parse_menu_item(record: dict) -> MenuItem:
+    """校验并构造菜单项；未提供 item_id 时生成新ID"""
+    item = MenuItem(
+        name=_text(record, 'name', required=True),
+        price=_amount(record, 'price'),
+        category=_text(record, 'category'),
+        allow_toppings=_flag(record, 'allow_toppings', True),
+        is_sold_out=_flag(record, 'is_sold_out', False),
+        description=_text(record, 'description')
+    )
+    item.item_id = _uuid(record, 'item_id') or item.item_id
+    return item
+
+
+def parse_topping(record: dict) -> Topping:
+    """校验并构造小料；未提供 topping_id 时生成新ID"""
+    topping = Topping(name=_text(record, 'name', required=True),
+                      extra_price=_amount(record, 'extra_price'))
+    topping.topping_id = _uuid(record, 'topping_id') or topping.topping_id
+    return topping
+
+
+def _check_order(order: Order) -> Order:
+    """订单整体校验"""
+    if not order.items:
+        raise ValueError("订单没有订单项")
+    for line in order.items:
+        if line.menu_item is None:
+            raise ValueError("订单项缺少商品")
+        if not isinstance(line.quantity, int) or line.quantity <= 0:
+            raise ValueError(f"订单项数量必须大于0: {line.quantity}")
+    if to_cents(order.discount) > order.subtotal_cents():
+        raise ValueError(f"优惠金额 {order.discount} 超过订单原价 {order.subtotal_amount()}")
+    return order
+
+
+def parse_order(record: dict) -> Order:
+    """校验并构造 Order.to_dict() 形式的订单记录（JSONL、JSON）"""
+    try:
+        order = Order.from_dict(record)
+    except KeyError as e:
+        raise ValueError(f"缺少字段 {e.args[0]}") from e
+    except (TypeError, AttributeError, InvalidOperation) as e:
+        raise ValueError(f"订单字段无效: {e}") from e
+    if not isinstance(order.status, OrderStatus):
+        raise ValueError(f"字段 status 取值无效: {order.status}")
+    for line in order.items:
+        if not isinstance(line.sweetness, Sweetness):
+            raise ValueError(f"字段 sweetness 取值无效: {line.sweetness}")
+    return _check_order(order)
+
+
+class OrderLineAssembler:
+    """
+    把导出格式的订单明细行（每个订单项一行、同一订单的行相邻）组装为订单
+    商品按名称关联现有菜单ID（不存在时按名称生成固定ID），单价以明细为准；
+    小料按名称关联现有小料，只有一种未知小料时由 toppings_price 推算其价格
+    """
+
+    def __init__(self, menu_items: Iterable[MenuItem], toppings: Iterable[Topping]):
+        self._item_ids = {item.name: item.item_id for item in menu_items}
+        self._toppings = {topping.name: topping for topping in toppings}
+
+    def _item_id(self, name: str) -> UUID:
+        item_id = self._item_ids.get(name)
+        if item_id is None:
+            item_id = self._item_ids[name] = uuid5(NAMESPACE_URL, f"milk-tea/menu-item/{name}")
+        return item_id
+
+    def _toppings_of(self, record: dict) -> List[Topping]:
+        names = [name for name in _text(record, 'toppings').split('|') if name]
+        unknown = [name for name in names if name not in self._toppings]
+        if unknown:
+            total = _amount(record, 'toppings_price', required=False)
+            if len(unknown) > 1 or total is None:
+                raise ValueError(f"未知小料: {'、'.join(unknown)}")
+            known = sum((self._toppings[name].extra_price for name in names if name not in unknown),
+                        Decimal('0'))
+            if total < known:
+                raise ValueError(f"小料金额不一致: {total}")
+            self._toppings[unknown[0]] = Topping(
+                topping_id=uuid5(NAMESPACE_URL, f"milk-tea/topping/{unknown[0]}"),
+                name=unknown[0], extra_price=total - known)
+        return [self._toppings[name] for name in names]
+
+    def start(self, record: dict) -> Order:
+        """由订单的第一行创建订单"""
+        order_id = _uuid(record, 'order_id')
+        if order_id is None:
+            raise ValueError("缺少字段 order_id")
+        # 导出的 pickup_code 列对旧订单是订单号前缀，只保留数字取餐码
+        pickup_code = _text(record, 'pickup_code')
+        return Order(
+            order_id=order_id,
+            user_id=_uuid(record, 'user_id'),
+            status=_enum(OrderStatus, record, 'status', OrderStatus.COMPLETED),
+            created_at=_datetime(record, 'created_at'),
+            pickup_code=pickup_code if pickup_code.isdigit() else '',
+            discount=_amount(record, 'order_discount', required=False) or Decimal('0'),
+            applied_promotions=[p for p in _text(record, 'applied_promotions').split('|') if p]
+        )
+
+    def add_line(self, order: Order, record: dict):
+        """把一行明细加入订单"""
+        name = _text(record, 'item_name', required=True)
+        toppings = self._toppings_of(record)
+        line = OrderItem(
+            menu_item=MenuItem(item_id=self._item_id(name), name=name,
+                               price=_amount(record, 'unit_price'),
+                               category=_text(record, 'category')),
+            quantity=_quantity(record),
+            sweetness=_enum(Sweetness, record, 'sweetness', Sweetness.FIVE),
+            toppings=toppings,
+            remark=_text(record, 'remark')
+        )
+        expected = _amount(record, 'line_subtotal', required=False)
+        if expected is not None and to_cents(expected) != line.subtotal_cents():
+            raise ValueError(f"小计不一致: 明细为 {expected}，按单价计算为 {line.subtotal()}")
+        order.add_item(line)
+
+
+# 导入
+
+_REPOSITORIES: Dict[str, Callable] = {
+    'menu_items': MenuItemRepository,
+    'toppings': ToppingRepository,
+    'orders': OrderRepository,
+}
+_PARSERS: Dict[str, Callable[[dict], object]] = {
+    'menu_items': parse_menu_item,
+    'toppings': parse_topping,
+    'orders': parse_order,
+}
+
+
+def _entities(kind: str, records: Iterable[Record], report: ImportReport,
+              assembler: Optional[OrderLineAssembler]) -> Iterator[object]:
+    """逐行校验，产出有效实体；订单明细行按 order_id 组装，任一行无效则整单作废"""
+    parse = _PARSERS[kind]
+    # 组装中的订单：(订单ID列原文, 已读入的行号, 订单)
+    pending: Optional[Tuple[str, List[int], Order]] = None
+    failed_order: Optional[str] = None
+
+    def finish(assembled: Tuple[str, List[int], Order]) -> Optional[Order]:
+        _, lines, order = assembled
+        try:
+            return _check_order(order)
+        except ValueError as e:
+            for line_no in lines:
+                report.reject(line_no, str(e))
+            return None
+
+    for line, record, error in records:
+        report.rows += 1
+        if error:
+            report.reject(line, error)
+            continue
+        if kind != 'orders' or 'items' in record:
+            try:
+                yield parse(record)
+            except ValueError as e:
+                report.reject(line, str(e), record)
+            continue
+
+        # 订单明细行
+        order_key = _text(record, 'order_id')
+        if pending and pending[0] != order_key:
+            order = finish(pending)
+            pending = None
+            if order:
+                yield order
+        if order_key and order_key == failed_order:
+            report.reject(line, "同一订单的其他明细行无效", record)
+            continue
+        try:
+            if pending is None:
+                pending = (order_key, [], assembler.start(record))
+            assembler.add_line(pending[2], record)
+            pending[1].append(line)
+        except ValueError as e:
+            report.reject(line, str(e), record)
+            for line_no in pending[1] if pending else ():
+                report.reject(line_no, "同一订单的其他明细行无效")
+            failed_order, pending = order_key, None
+    if pending:
+        order = finish(pending)
+        if order:
+            yield order
+
+
+def import_records(kind: str, records: Iterable[Record], repo=None, batch_size: int = 5000,
+                   progress: Callable[[ImportReport], None] = None,
+                   progress_every: int = 10000, dry_run: bool = False) -> ImportReport:
+    """
+    校验并分批写入仓储
+    progress 每处理约 progress_every 行调用一次；dry_run 时只校验不写入
+    """
+    if kind not in _REPOSITORIES:
+        raise ValueError(f"不支持的导入类型: {kind}")
+    started = time.perf_counter()
+    report = ImportReport(kind)
+    repo = repo or _REPOSITORIES[kind]()
+    rollups = SalesRollupStore() if kind == 'orders' and not dry_run else None
+    assembler = None
+    if kind == 'orders':
+        assembler = OrderLineAssembler(MenuItemRepository().find_all(), ToppingRepository().find_all())
+
+    batch: List[object] = []
+    rollup_delta: Dict[str, dict] = {}
+    next_progress = progress_every
+
+    def flush_batch():
+        if not dry_run:
+            replaced = repo.save_many(batch)
+            if rollups is not None:
+                rollups.history_delta(batch, replaced, rollup_delta)
+        report.imported += len(batch)
+        batch.clear()
+
+    with repo.deferred_writes():
+        for entity in _entities(kind, records, report, assembler):
+            batch.append(entity)
+            if len(batch) >= batch_size:
+                flush_batch()
+            if progress and report.rows >= next_progress:
+                report.elapsed = time.perf_counter() - started
+                progress(report)
+                next_progress = report.rows + progress_every
+        if batch:
+            flush_batch()
+    if not dry_run:
+        if rollups is not None:
+            rollups.apply(rollup_delta)
+            rollups.flush()
+        repo.flush()
+    report.elapsed = time.perf_counter() - started
+    if progress:
+        progress(report)
+    return report
+
+
+def import_file(kind: str, path, **options) -> ImportReport:
+    """从文件导入，参数同 import_records"""
+    return import_records(kind, read_records(Path(path)), **options)
+
+
+def main(argv: List[str] = None) -> int:
+    """命令行入口；有无效行时返回 1"""
+    parser = argparse.ArgumentParser(description="奶茶点单系统数据批量导入")
+    parser.add_argument('kind', choices=sorted(_REPOSITORIES), help="导入类型")
+    parser.add_argument('path', help="CSV、JSONL 或 JSON 数组文件，CSV/JSONL 可为 .gz")
+    parser.add_argument('--batch-size', type=int, default=5000, help="每批写入的实体数")
+    parser.add_argument('--errors', help="把无效行写入该 JSONL 文件")
+    parser.add_argument('--dry-run', action='store_true', help="只校验不写入")
+    args = parser.parse_args(argv)
+
+    def show(report: ImportReport):
+        print(f"\r{report.summary()}", end='', file=sys.stderr, flush=True)
+
+    report = import_file(args.kind, args.path, batch_size=args.batch_size,
+                         progress=show, dry_run=args.dry_run)
+    print(file=sys.stderr)
+    for bad in report.bad_rows[:20]:
+        print(f"  第 {bad.line} 行: {bad.reason}", file=sys.stderr)
+    if report.rejected > 20:
+        print(f"  ……共 {report.rejected} 行无效", file=sys.stderr)
+    if args.errors and report.bad_rows:
+        with open(args.errors, 'w', encoding='utf-8') as f:
+            for bad in report.bad_rows:
+                f.write(json.dumps(bad.to_dict(), ensure_ascii=False) + '\n')
+    return 1 if report.rejected else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
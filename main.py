@@ -1,47 +1,129 @@
 """
 奶茶点单系统 - 主入口文件
-提供顾客端和管理员端的启动入口
+提供顾客端和管理员端的启动入口。
+启动时只导入 tkinter，启动器窗口先绘制；界面模块、服务层和数据在后台线程加载，
+顾客端和管理员端窗口共用同一组服务。冷启动耗时用 startup_benchmark.py 测量
 """
 
+import importlib
+import threading
+import time
 import tkinter as tk
 from tkinter import ttk
 
-from gui_customer import CustomerGUI
-from gui_admin import AdminGUI
+# 冷启动预算（毫秒）：从启动进程到启动器窗口绘制完成
+STARTUP_BUDGET_MS = 300
 
+# 数据尚未加载完成时，轮询加载状态的间隔（毫秒）
+PRELOAD_POLL_MS = 50
 
-def main():
-    """主函数"""
-    root = tk.Tk()
+# 启动器按钮对应的界面：(模块, 类)
+WINDOWS = {
+    'customer': ('gui_customer', 'CustomerGUI'),
+    'admin': ('gui_admin', 'AdminGUI'),
+}
+
+
+class Preloader:
+    """在后台线程导入界面模块并加载共享服务"""
+
+    def __init__(self):
+        self.services = None
+        self.error = None
+        self.seconds = None
+        self.done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='preload', daemon=True)
+
+    def start(self):
+        """开始加载；重复调用无效"""
+        if self._thread.ident is None:
+            self._thread.start()
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            for module_name, _ in WINDOWS.values():
+                importlib.import_module(module_name)
+            from app_services import AppServices  # pylint: disable=import-outside-toplevel
+            services = AppServices()
+            services.warm_up()
+            self.services = services
+        except Exception as e:  # pylint: disable=broad-except
+            # 打开窗口时回退为按需加载，由界面报告具体错误
+            self.error = e
+        finally:
+            self.seconds = time.perf_counter() - started
+            self.done.set()
+
+
+def create_launcher(root: tk.Tk) -> Preloader:
+    """创建启动器界面；窗口映射到屏幕后才开始后台加载，返回加载器"""
     root.title("奶茶点单系统")
     root.geometry("400x300")
-    
+
     frame = ttk.Frame(root, padding="50")
     frame.pack(expand=True)
-    
-    ttk.Label(frame, text="欢迎使用奶茶点单系统", 
+
+    ttk.Label(frame, text="欢迎使用奶茶点单系统",
               font=("Arial", 16, "bold")).pack(pady=20)
-    
-    def open_customer():
-        """打开顾客端"""
-        customer_window = tk.Toplevel(root)
-        CustomerGUI(customer_window)
-    
-    def open_admin():
-        """打开管理员端"""
-        admin_window = tk.Toplevel(root)
-        AdminGUI(admin_window)
-    
-    ttk.Button(frame, text="顾客端", command=open_customer, 
+
+    preloader = Preloader()
+    # 等待后台加载完成后再打开的窗口，避免重复点击打开多个
+    pending = set()
+
+    def open_window(kind: str):
+        """打开顾客端或管理员端；数据未加载完时稍后再打开"""
+        if not preloader.done.is_set():
+            if kind not in pending:
+                pending.add(kind)
+                status.config(text="正在加载数据，加载完成后自动打开…")
+                root.after(PRELOAD_POLL_MS, retry, kind)
+            return
+        module_name, class_name = WINDOWS[kind]
+        window_class = getattr(importlib.import_module(module_name), class_name)
+        window_class(tk.Toplevel(root), preloader.services)
+
+    def retry(kind: str):
+        if not preloader.done.is_set():
+            root.after(PRELOAD_POLL_MS, retry, kind)
+            return
+        pending.discard(kind)
+        open_window(kind)
+
+    def watch():
+        """加载完成后更新状态栏"""
+        if not preloader.done.is_set():
+            root.after(PRELOAD_POLL_MS, watch)
+        elif preloader.error:
+            status.config(text=f"数据加载失败: {preloader.error}")
+        else:
+            status.config(text=f"数据已加载（{preloader.seconds:.1f} 秒）")
+
+    def on_map(event):
+        if event.widget is root:
+            root.after_idle(preloader.start)
+            root.after(PRELOAD_POLL_MS, watch)
+            root.unbind('<Map>')
+
+    ttk.Button(frame, text="顾客端", command=lambda: open_window('customer'),
                width=20).pack(pady=10)
-    ttk.Button(frame, text="管理员端", command=open_admin, 
+    ttk.Button(frame, text="管理员端", command=lambda: open_window('admin'),
                width=20).pack(pady=10)
-    ttk.Button(frame, text="退出", command=root.quit, 
+    ttk.Button(frame, text="退出", command=root.quit,
                width=20).pack(pady=10)
-    
+    status = ttk.Label(frame, text="正在加载数据…", foreground='gray')
+    status.pack()
+
+    root.bind('<Map>', on_map)
+    return preloader
+
+
+def main():
+    """主函数"""
+    root = tk.Tk()
+    create_launcher(root)
     root.mainloop()
 
 
 if __name__ == "__main__":
     main()
-
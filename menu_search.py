@@ -0,0 +1,226 @@
+"""
+奶茶点单系统 - 菜单全文检索
+基于倒排索引的内存检索：中文字符 n-gram、拼音首字母、英文单词前缀，
+并按分类和售罄状态分面
+"""
+
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+from uuid import UUID
+
+from models import MenuItem
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:  # 可选依赖，未安装时使用 GB2312 编码区间推算首字母
+    lazy_pinyin = None
+
+
+# GB2312 一级汉字按拼音排序，各声母首字的区位码下界
+_GB2312_INITIALS = [
+    (-20319, 'a'), (-20283, 'b'), (-19775, 'c'), (-19218, 'd'), (-18710, 'e'),
+    (-18526, 'f'), (-18239, 'g'), (-17922, 'h'), (-17417, 'j'), (-16474, 'k'),
+    (-16212, 'l'), (-15640, 'm'), (-15165, 'n'), (-14922, 'o'), (-14914, 'p'),
+    (-14630, 'q'), (-14149, 'r'), (-14090, 's'), (-13318, 't'), (-12838, 'w'),
+    (-12556, 'x'), (-11847, 'y'), (-11055, 'z'),
+]
+_GB2312_LEVEL1_END = -10247
+
+_CJK_RUN = re.compile(r'[一-鿿]+')
+_WORD_RUN = re.compile(r'[a-z0-9]+')
+_TERM_RUN = re.compile(r'[一-鿿]+|[a-z0-9]+')
+
+# 英文单词只索引前若干个字符的前缀
+MAX_PREFIX_LEN = 20
+
+
+def _initial_gb2312(char: str) -> str:
+    """通过 GB2312 编码推算汉字拼音首字母，无法识别时返回空串"""
+    try:
+        raw = char.encode('gb2312')
+    except UnicodeEncodeError:
+        return ''
+    if len(raw) != 2:
+        return ''
+    code = raw[0] * 256 + raw[1] - 65536
+    if code < _GB2312_INITIALS[0][0] or code > _GB2312_LEVEL1_END:
+        return ''
+    initial = ''
+    for lower_bound, letter in _GB2312_INITIALS:
+        if code < lower_bound:
+            break
+        initial = letter
+    return initial
+
+
+def pinyin_initials(text: str) -> str:
+    """汉字串的拼音首字母（如 珍珠奶茶 -> zznc），非汉字字符忽略"""
+    chars = ''.join(_CJK_RUN.findall(text))
+    if not chars:
+        return ''
+    if lazy_pinyin is not None:
+        return ''.join(p[0] for p in lazy_pinyin(chars, style=Style.FIRST_LETTER) if p).lower()
+    return ''.join(_initial_gb2312(c) for c in chars)
+
+
+def _cjk_grams(run: str) -> Set[str]:
+    """中文字符的 1-gram 与 2-gram"""
+    grams = set(run)
+    grams.update(run[i:i + 2] for i in range(len(run) - 1))
+    return grams
+
+
+def _query_grams(run: str) -> Set[str]:
+    """查询串所需的 n-gram：单字查 1-gram，多字查全部 2-gram"""
+    if len(run) == 1:
+        return {run}
+    return {run[i:i + 2] for i in range(len(run) - 1)}
+
+
+class MenuSearchIndex:
+    """
+    菜单倒排索引
+    非线程安全，由 MenuItemRepository 在持有锁时维护和查询
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Set[UUID]] = defaultdict(set)
+        self._terms: Dict[UUID, Set[str]] = {}
+        self._items: Dict[UUID, MenuItem] = {}
+        # 索引时的分类；菜单项可能被原地修改，移除时以此为准
+        self._item_category: Dict[UUID, str] = {}
+        self._by_category: Dict[str, Set[UUID]] = defaultdict(set)
+        self._sold_out: Set[UUID] = set()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def clear(self):
+        """清空索引"""
+        self._postings.clear()
+        self._terms.clear()
+        self._items.clear()
+        self._item_category.clear()
+        self._by_category.clear()
+        self._sold_out.clear()
+
+    @staticmethod
+    def _analyze(item: MenuItem) -> Set[str]:
+        """生成菜单项的全部索引词"""
+        terms = set()
+        text = f"{item.name} {item.description} {item.category}".lower()
+        for run in _CJK_RUN.findall(text):
+            terms.update('c:' + gram for gram in _cjk_grams(run))
+        for word in _WORD_RUN.findall(text):
+            terms.update('w:' + word[:n] for n in range(1, min(len(word), MAX_PREFIX_LEN) + 1))
+        # 名称和分类的拼音首字母，索引全部子串以支持任意位置匹配
+        for field_text in (item.name, item.category):
+            initials = pinyin_initials(field_text)
+            for i in range(len(initials)):
+                for j in range(i + 1, len(initials) + 1):
+                    terms.add('p:' + initials[i:j])
+        return terms
+
+    def add(self, item: MenuItem):
+        """加入或更新菜单项"""
+        if item.item_id in self._items:
+            self.remove(item.item_id)
+        terms = self._analyze(item)
+        for term in terms:
+            self._postings[term].add(item.item_id)
+        self._terms[item.item_id] = terms
+        self._items[item.item_id] = item
+        self._item_category[item.item_id] = item.category
+        self._by_category[item.category].add(item.item_id)
+        if item.is_sold_out:
+            self._sold_out.add(item.item_id)
+
+    def remove(self, item_id: UUID):
+        """移除菜单项"""
+        if self._items.pop(item_id, None) is None:
+            return
+        for term in self._terms.pop(item_id, ()):
+            ids = self._postings.get(term)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del self._postings[term]
+        category = self._item_category.pop(item_id)
+        ids = self._by_category.get(category)
+        if ids is not None:
+            ids.discard(item_id)
+            if not ids:
+                del self._by_category[category]
+        self._sold_out.discard(item_id)
+
+    def rebuild(self, items: Iterable[MenuItem]):
+        """全量重建"""
+        self.clear()
+        for item in items:
+            self.add(item)
+
+    def _match(self, query: str) -> Optional[Set[UUID]]:
+        """查询词匹配的菜单项ID；空查询返回 None 表示不限制"""
+        runs = _TERM_RUN.findall(query.lower())
+        if not runs:
+            return None
+        result: Optional[Set[UUID]] = None
+        for run in runs:
+            if _CJK_RUN.fullmatch(run):
+                ids = None
+                for gram in _query_grams(run):
+                    posting = self._postings.get('c:' + gram, set())
+                    ids = posting if ids is None else ids & posting
+                # 2-gram 交集可能命中不连续的文本，用子串校验排除
+                ids = {i for i in ids if self._contains(i, run)} if len(run) > 2 else ids
+            else:
+                ids = (self._postings.get('w:' + run[:MAX_PREFIX_LEN], set())
+                       | self._postings.get('p:' + run, set()))
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+        return result
+
+    def _contains(self, item_id: UUID, run: str) -> bool:
+        """菜单项文本中是否包含连续的查询串"""
+        item = self._items[item_id]
+        return run in f"{item.name} {item.description} {item.category}".lower()
+
+    def _filter(self, query: str, category: Optional[str], include_sold_out: bool) -> Set[UUID]:
+        """按查询词和分面条件过滤"""
+        ids = self._match(query)
+        if ids is None:
+            ids = set(self._items)
+        if category is not None:
+            ids = ids & self._by_category.get(category, set())
+        if not include_sold_out:
+            ids = ids - self._sold_out
+        return ids
+
+    def search(self, query: str = "", category: str = None,
+               include_sold_out: bool = False, limit: int = None) -> List[MenuItem]:
+        """
+        检索菜单项
+        名称命中的排在前面，其次按名称排序
+        """
+        needle = query.strip().lower()
+        ids = self._filter(query, category, include_sold_out)
+        items = sorted(
+            (self._items[i] for i in ids),
+            key=lambda item: (needle not in item.name.lower(), item.name)
+        )
+        return items[:limit] if limit is not None else items
+
+    def facet_counts(self, query: str = "", include_sold_out: bool = False) -> Dict[str, int]:
+        """查询结果按分类计数"""
+        ids = self._filter(query, None, include_sold_out)
+        return {
+            category: len(ids & members)
+            for category, members in self._by_category.items()
+            if ids & members
+        }
+
+    def categories(self) -> List[str]:
+        """全部分类"""
+        return sorted(self._by_category)
@@ -4,12 +4,15 @@
 """
 
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, time
 from decimal import Decimal
 from enum import Enum
-from typing import List, Optional
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
 from uuid import uuid4, UUID
 
+from money import from_cents, quantize, to_cents
+
 
 class Sweetness(Enum):
     """甜度枚举"""
@@ -29,6 +32,19 @@ class OrderStatus(Enum):
     CANCELLED = "已取消"
 
 
+# 按取值查找枚举成员，反序列化时使用
+_SWEETNESS_BY_VALUE = {s.value: s for s in Sweetness}
+_ORDER_STATUS_BY_VALUE = {s.value: s for s in OrderStatus}
+
+
+class RuleType(Enum):
+    """促销规则类型枚举"""
+    CATEGORY_PERCENT = "分类折扣"
+    BUY_N_GET_M = "买赠"
+    FREE_TOPPING = "满额免小料"
+    TIME_OF_DAY = "时段折扣"
+
+
 @dataclass
 class User:
     """用户类"""
@@ -36,6 +52,7 @@ class User:
     nickname: str = ""
     phone: str = ""
     created_at: datetime = field(default_factory=datetime.now)
+    version: int = 0  # 乐观锁版本号，每次保存递增
     
     def __post_init__(self):
         if isinstance(self.user_id, str):
@@ -49,7 +66,8 @@ class User:
             'user_id': str(self.user_id),
             'nickname': self.nickname,
             'phone': self.phone,
-            'created_at': self.created_at.isoformat()
+            'created_at': self.created_at.isoformat(),
+            'version': self.version
         }
     
     @classmethod
@@ -64,19 +82,29 @@ class Topping:
     topping_id: UUID = field(default_factory=uuid4)
     name: str = ""
     extra_price: Decimal = Decimal('0.00')
+    version: int = 0
+    _cents: Optional[tuple] = field(default=None, init=False, repr=False, compare=False)
     
     def __post_init__(self):
         if isinstance(self.topping_id, str):
             self.topping_id = UUID(self.topping_id)
-        if not isinstance(self.extra_price, Decimal):
-            self.extra_price = Decimal(str(self.extra_price))
+        self.extra_price = quantize(self.extra_price)
+    
+    @property
+    def extra_price_cents(self) -> int:
+        """加价（分），按当前 extra_price 缓存"""
+        cached = self._cents
+        if cached is None or cached[0] is not self.extra_price:
+            cached = self._cents = (self.extra_price, to_cents(self.extra_price))
+        return cached[1]
     
     def to_dict(self):
         """转换为字典"""
         return {
             'topping_id': str(self.topping_id),
             'name': self.name,
-            'extra_price': str(self.extra_price)
+            'extra_price': str(self.extra_price),
+            'version': self.version
         }
     
     @classmethod
@@ -95,12 +123,21 @@ class MenuItem:
     allow_toppings: bool = True
     is_sold_out: bool = False
     description: str = ""
+    version: int = 0
+    _cents: Optional[tuple] = field(default=None, init=False, repr=False, compare=False)
     
     def __post_init__(self):
         if isinstance(self.item_id, str):
             self.item_id = UUID(self.item_id)
-        if not isinstance(self.price, Decimal):
-            self.price = Decimal(str(self.price))
+        self.price = quantize(self.price)
+    
+    @property
+    def price_cents(self) -> int:
+        """价格（分），按当前 price 缓存"""
+        cached = self._cents
+        if cached is None or cached[0] is not self.price:
+            cached = self._cents = (self.price, to_cents(self.price))
+        return cached[1]
     
     def to_dict(self):
         """转换为字典"""
@@ -111,7 +148,8 @@ class MenuItem:
             'category': self.category,
             'allow_toppings': self.allow_toppings,
             'is_sold_out': self.is_sold_out,
-            'description': self.description
+            'description': self.description,
+            'version': self.version
         }
     
     @classmethod
@@ -128,6 +166,7 @@ class Menu:
     updated_at: datetime = field(default_factory=datetime.now)
     is_active: bool = True
     items: List[MenuItem] = field(default_factory=list)
+    version: int = 0
     
     def __post_init__(self):
         if isinstance(self.menu_id, str):
@@ -152,7 +191,8 @@ class Menu:
             'name': self.name,
             'updated_at': self.updated_at.isoformat(),
             'is_active': self.is_active,
-            'items': [item.to_dict() for item in self.items]
+            'items': [item.to_dict() for item in self.items],
+            'version': self.version
         }
     
     @classmethod
@@ -164,6 +204,55 @@ class Menu:
         return cls(**data_copy)
 
 
+@dataclass(frozen=True)
+class MenuCatalog:
+    """
+    菜单目录快照
+    由 MenuService 在菜单数据变化后一次性构建，按分类分组；
+    快照本身不可变，界面、API、计价等读者共享同一份，无需复制或再过滤
+    （快照中的菜单项对象同样视为只读）
+    """
+    version: int = 0
+    all_items: Tuple[MenuItem, ...] = ()
+    available: Tuple[MenuItem, ...] = ()
+    toppings: Tuple[Topping, ...] = ()
+    by_id: Mapping[UUID, MenuItem] = field(default_factory=lambda: MappingProxyType({}))
+    by_category: Mapping[str, Tuple[MenuItem, ...]] = field(default_factory=lambda: MappingProxyType({}))
+    
+    @classmethod
+    def build(cls, version: int, items: List[MenuItem], toppings: List[Topping]) -> 'MenuCatalog':
+        """由菜单项和小料列表构建快照"""
+        available = tuple(item for item in items if not item.is_sold_out)
+        grouped = {}
+        for item in available:
+            grouped.setdefault(item.category, []).append(item)
+        return cls(
+            version=version,
+            all_items=tuple(items),
+            available=available,
+            toppings=tuple(toppings),
+            by_id=MappingProxyType({item.item_id: item for item in items}),
+            by_category=MappingProxyType({
+                category: tuple(grouped[category]) for category in sorted(grouped)
+            })
+        )
+    
+    def categories(self) -> List[str]:
+        """有在售商品的分类"""
+        return list(self.by_category)
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'version': self.version,
+            'categories': {
+                category: [item.to_dict() for item in items]
+                for category, items in self.by_category.items()
+            },
+            'toppings': [t.to_dict() for t in self.toppings]
+        }
+
+
 @dataclass
 class OrderItem:
     """订单项类"""
@@ -178,19 +267,21 @@ class OrderItem:
         if isinstance(self.order_item_id, str):
             self.order_item_id = UUID(self.order_item_id)
         if isinstance(self.sweetness, str):
-            for s in Sweetness:
-                if s.value == self.sweetness:
-                    self.sweetness = s
-                    break
+            self.sweetness = _SWEETNESS_BY_VALUE.get(self.sweetness, self.sweetness)
     
-    def subtotal(self) -> Decimal:
-        """计算小计"""
+    def subtotal_cents(self) -> int:
+        """计算小计（分）"""
         if not self.menu_item:
-            return Decimal('0.00')
+            return 0
         
-        base_price = self.menu_item.price
-        toppings_price = sum(t.extra_price for t in self.toppings)
-        return (base_price + toppings_price) * Decimal(str(self.quantity))
+        unit = self.menu_item.price_cents
+        for topping in self.toppings:
+            unit += topping.extra_price_cents
+        return unit * self.quantity
+    
+    def subtotal(self) -> Decimal:
+        """计算小计"""
+        return from_cents(self.subtotal_cents())
     
     def to_dict(self):
         """转换为字典"""
@@ -227,6 +318,11 @@ class Order:
     items: List[OrderItem] = field(default_factory=list)
     remark: str = ""
     created_at: datetime = field(default_factory=datetime.now)
+    version: int = 0
+    pickup_code: str = ""  # 按天递增的取餐码，保存时由订单仓储分配
+    discount: Decimal = Decimal('0.00')  # 下单时按生效促销计算的优惠金额
+    applied_promotions: List[str] = field(default_factory=list)
+    ready_at: Optional[datetime] = None  # 首次出餐（待取餐或直接完成）的时间，用于统计排队时长
     
     def __post_init__(self):
         if isinstance(self.order_id, str):
@@ -234,21 +330,33 @@ class Order:
         if isinstance(self.user_id, str):
             self.user_id = UUID(self.user_id)
         if isinstance(self.status, str):
-            for s in OrderStatus:
-                if s.value == self.status:
-                    self.status = s
-                    break
+            self.status = _ORDER_STATUS_BY_VALUE.get(self.status, self.status)
         if isinstance(self.created_at, str):
             self.created_at = datetime.fromisoformat(self.created_at)
+        if isinstance(self.ready_at, str):
+            self.ready_at = datetime.fromisoformat(self.ready_at)
+        self.discount = quantize(self.discount)
+    
+    def subtotal_cents(self) -> int:
+        """计算优惠前金额（分）"""
+        return sum(item.subtotal_cents() for item in self.items)
+    
+    def subtotal_amount(self) -> Decimal:
+        """计算优惠前金额"""
+        return from_cents(self.subtotal_cents())
     
     def total_amount(self) -> Decimal:
-        """计算总金额"""
-        return sum(item.subtotal() for item in self.items)
+        """计算实付金额（已扣除促销优惠）"""
+        return from_cents(self.subtotal_cents() - to_cents(self.discount))
     
     def add_item(self, item: OrderItem):
         """添加订单项"""
         self.items.append(item)
     
+    def short_code(self) -> str:
+        """界面显示与叫号使用的订单码：优先取餐码，旧订单用订单号前8位"""
+        return self.pickup_code or str(self.order_id)[:8]
+    
     def to_dict(self):
         """转换为字典"""
         return {
@@ -257,7 +365,12 @@ class Order:
             'status': self.status.value,
             'items': [item.to_dict() for item in self.items],
             'remark': self.remark,
-            'created_at': self.created_at.isoformat()
+            'created_at': self.created_at.isoformat(),
+            'version': self.version,
+            'pickup_code': self.pickup_code,
+            'discount': str(self.discount),
+            'applied_promotions': list(self.applied_promotions),
+            'ready_at': self.ready_at.isoformat() if self.ready_at else None
         }
     
     @classmethod
@@ -270,28 +383,73 @@ class Order:
             status=data['status'],
             items=items,
             remark=data.get('remark', ''),
-            created_at=data['created_at']
+            created_at=data['created_at'],
+            version=data.get('version', 0),
+            pickup_code=data.get('pickup_code', ''),
+            discount=data.get('discount', '0.00'),
+            applied_promotions=data.get('applied_promotions', []),
+            ready_at=data.get('ready_at')
         )
 
 
 @dataclass
 class Cart:
-    """购物车类"""
+    """
+    购物车类
+    明细按加入顺序保存在以 order_item_id 为键的字典中；相同配置（商品、价格、甜度、小料、备注）
+    的明细自动合并为一行，移除、改数量、合并都是 O(1)
+    """
     cart_id: UUID = field(default_factory=uuid4)
     user_id: UUID = None
-    items: List[OrderItem] = field(default_factory=list)
+    lines: Dict[UUID, OrderItem] = field(default_factory=dict)
+    version: int = 0
+    # 配置键 -> order_item_id，用于合并相同配置的明细
+    _by_config: Dict[tuple, UUID] = field(default_factory=dict, init=False, repr=False, compare=False)
     
     def __post_init__(self):
         if isinstance(self.cart_id, str):
             self.cart_id = UUID(self.cart_id)
         if isinstance(self.user_id, str):
             self.user_id = UUID(self.user_id)
+        # 旧数据中重复配置的明细在加载时合并
+        lines, self.lines = self.lines, {}
+        for line in lines.values():
+            self._put_line(line)
+    
+    @property
+    def items(self) -> List[OrderItem]:
+        """按加入顺序排列的明细（副本）"""
+        return list(self.lines.values())
+    
+    @staticmethod
+    def line_key(menu_item: MenuItem, sweetness: Sweetness, toppings: List[Topping],
+                 remark: str) -> tuple:
+        """明细的配置键：价格也计入，调价前后加入的同款饮品分行计价"""
+        return (
+            menu_item.item_id if menu_item else None,
+            menu_item.price_cents if menu_item else 0,
+            sweetness,
+            tuple(sorted((t.topping_id, t.extra_price_cents) for t in toppings)),
+            remark
+        )
+    
+    def _put_line(self, line: OrderItem) -> OrderItem:
+        """加入一行明细，已有相同配置时合并数量，返回保留的明细"""
+        key = self.line_key(line.menu_item, line.sweetness, line.toppings, line.remark)
+        existing_id = self._by_config.get(key)
+        if existing_id is not None:
+            existing = self.lines[existing_id]
+            existing.quantity += line.quantity
+            return existing
+        self._by_config[key] = line.order_item_id
+        self.lines[line.order_item_id] = line
+        return line
     
     def add_item(self, menu_item: MenuItem, quantity: int = 1,
                  sweetness: Sweetness = Sweetness.FIVE,
                  toppings: List[Topping] = None,
-                 remark: str = ""):
-        """添加商品到购物车"""
+                 remark: str = "") -> OrderItem:
+        """添加商品到购物车，返回新增或合并后的明细"""
         order_item = OrderItem(
             menu_item=menu_item,
             quantity=quantity,
@@ -299,11 +457,16 @@ class Cart:
             toppings=toppings or [],
             remark=remark
         )
-        self.items.append(order_item)
+        return self._put_line(order_item)
     
     def remove_item(self, order_item_id: UUID):
         """从购物车移除商品"""
-        self.items = [item for item in self.items if item.order_item_id != order_item_id]
+        line = self.lines.pop(order_item_id, None)
+        if line is None:
+            return
+        key = self.line_key(line.menu_item, line.sweetness, line.toppings, line.remark)
+        if self._by_config.get(key) == order_item_id:
+            del self._by_config[key]
     
     def update_quantity(self, order_item_id: UUID, quantity: int):
         """更新购物车中商品的数量（UML中定义的方法）"""
@@ -311,25 +474,26 @@ class Cart:
             self.remove_item(order_item_id)
             return
         
-        for item in self.items:
-            if item.order_item_id == order_item_id:
-                item.quantity = quantity
-                return
+        line = self.lines.get(order_item_id)
+        if line is not None:
+            line.quantity = quantity
     
     def clear(self):
         """清空购物车"""
-        self.items = []
+        self.lines = {}
+        self._by_config = {}
     
     def total(self) -> Decimal:
         """计算购物车总价"""
-        return sum(item.subtotal() for item in self.items)
+        return from_cents(sum(item.subtotal_cents() for item in self.lines.values()))
     
     def to_dict(self):
         """转换为字典"""
         return {
             'cart_id': str(self.cart_id),
             'user_id': str(self.user_id) if self.user_id else None,
-            'items': [item.to_dict() for item in self.items]
+            'items': [item.to_dict() for item in self.lines.values()],
+            'version': self.version
         }
     
     @classmethod
@@ -339,7 +503,8 @@ class Cart:
         return cls(
             cart_id=data['cart_id'],
             user_id=data.get('user_id'),
-            items=items
+            lines={item.order_item_id: item for item in items},
+            version=data.get('version', 0)
         )
 
 
@@ -353,6 +518,7 @@ class Review:
     content: str = ""
     created_at: datetime = field(default_factory=datetime.now)
     reply: str = ""
+    version: int = 0
     
     def __post_init__(self):
         if isinstance(self.review_id, str):
@@ -373,7 +539,8 @@ class Review:
             'rating': self.rating,
             'content': self.content,
             'created_at': self.created_at.isoformat(),
-            'reply': self.reply
+            'reply': self.reply,
+            'version': self.version
         }
     
     @classmethod
@@ -389,6 +556,7 @@ class Favorite:
     user_id: UUID = None
     item_id: UUID = None
     created_at: datetime = field(default_factory=datetime.now)
+    version: int = 0
     
     def __post_init__(self):
         if isinstance(self.favorite_id, str):
@@ -406,7 +574,92 @@ class Favorite:
             'favorite_id': str(self.favorite_id),
             'user_id': str(self.user_id) if self.user_id else None,
             'item_id': str(self.item_id) if self.item_id else None,
-            'created_at': self.created_at.isoformat()
+            'created_at': self.created_at.isoformat(),
+            'version': self.version
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        """从字典创建"""
+        return cls(**data)
+
+
+@dataclass(frozen=True)
+class FavoriteItem:
+    """收藏及其对应的菜单项（列表展示用的只读联结记录）"""
+    favorite: Favorite
+    item: MenuItem
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {'favorite': self.favorite.to_dict(), 'item': self.item.to_dict()}
+
+
+@dataclass
+class PromotionRule:
+    """
+    促销规则
+    作用范围：指定 item_id 时只作用于该商品，否则作用于 category 分类，
+    两者都为空时作用于全部商品
+    """
+    rule_type: RuleType = RuleType.CATEGORY_PERCENT
+    category: str = ""
+    item_id: Optional[UUID] = None
+    percent_off: Decimal = Decimal('0')  # 折扣百分比，20 表示减免 20%
+    buy_quantity: int = 0  # 买赠：每买 buy_quantity 件
+    free_quantity: int = 0  # 买赠：赠送 free_quantity 件
+    threshold: Decimal = Decimal('0')  # 满额免小料的门槛（按原价）
+    topping_id: Optional[UUID] = None  # 免费的小料，为空表示全部小料
+    start_time: Optional[time] = None  # 时段折扣每天的开始时间
+    end_time: Optional[time] = None  # 时段折扣每天的结束时间，可跨零点
+    
+    def __post_init__(self):
+        if isinstance(self.rule_type, str):
+            for t in RuleType:
+                if t.value == self.rule_type:
+                    self.rule_type = t
+                    break
+        if isinstance(self.item_id, str):
+            self.item_id = UUID(self.item_id)
+        if isinstance(self.topping_id, str):
+            self.topping_id = UUID(self.topping_id)
+        if isinstance(self.percent_off, (str, int)):
+            self.percent_off = Decimal(self.percent_off)
+        self.threshold = quantize(self.threshold)
+        if isinstance(self.start_time, str):
+            self.start_time = time.fromisoformat(self.start_time)
+        if isinstance(self.end_time, str):
+            self.end_time = time.fromisoformat(self.end_time)
+    
+    def validate(self):
+        """校验规则参数，不合法时抛出 ValueError"""
+        if not isinstance(self.rule_type, RuleType):
+            raise ValueError(f"未知的促销规则类型: {self.rule_type}")
+        if self.rule_type in (RuleType.CATEGORY_PERCENT, RuleType.TIME_OF_DAY):
+            if not Decimal('0') < self.percent_off <= Decimal('100'):
+                raise ValueError("折扣百分比必须在 0 到 100 之间")
+        if self.rule_type == RuleType.TIME_OF_DAY:
+            if self.start_time is None or self.end_time is None or self.start_time == self.end_time:
+                raise ValueError("时段折扣需要设置不同的开始和结束时间")
+        if self.rule_type == RuleType.BUY_N_GET_M:
+            if self.buy_quantity < 1 or self.free_quantity < 1:
+                raise ValueError("买赠数量必须为正整数")
+        if self.rule_type == RuleType.FREE_TOPPING and self.threshold < 0:
+            raise ValueError("满额门槛不能为负数")
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'rule_type': self.rule_type.value,
+            'category': self.category,
+            'item_id': str(self.item_id) if self.item_id else None,
+            'percent_off': str(self.percent_off),
+            'buy_quantity': self.buy_quantity,
+            'free_quantity': self.free_quantity,
+            'threshold': str(self.threshold),
+            'topping_id': str(self.topping_id) if self.topping_id else None,
+            'start_time': self.start_time.isoformat() if self.start_time else None,
+            'end_time': self.end_time.isoformat() if self.end_time else None
         }
     
     @classmethod
@@ -424,10 +677,13 @@ class Promotion:
     start_at: datetime = field(default_factory=datetime.now)
     end_at: datetime = field(default_factory=datetime.now)
     is_active: bool = True
+    version: int = 0
+    rules: List[PromotionRule] = field(default_factory=list)
     
     def __post_init__(self):
         if isinstance(self.promotion_id, str):
             self.promotion_id = UUID(self.promotion_id)
+        self.rules = [PromotionRule.from_dict(r) if isinstance(r, dict) else r for r in self.rules]
         if isinstance(self.start_at, str):
             self.start_at = datetime.fromisoformat(self.start_at)
         if isinstance(self.end_at, str):
@@ -446,7 +702,9 @@ class Promotion:
             'content': self.content,
             'start_at': self.start_at.isoformat(),
             'end_at': self.end_at.isoformat(),
-            'is_active': self.is_active
+            'is_active': self.is_active,
+            'version': self.version,
+            'rules': [rule.to_dict() for rule in self.rules]
         }
     
     @classmethod
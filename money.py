@@ -0,0 +1,45 @@
+"""
+奶茶点单系统 - 金额定点表示
+金额在内部以整数“分”参与计算，只在显示和序列化时转换为两位小数的 Decimal
+"""
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Union
+
+CENT = Decimal('0.01')
+
+Amount = Union[Decimal, int, float, str]
+
+
+def to_cents(amount: Amount) -> int:
+    """金额换算为整数分，按四舍五入保留到分；非法金额抛出 ValueError"""
+    try:
+        value = amount if isinstance(amount, Decimal) else Decimal(str(amount))
+        if not value.is_finite():
+            raise ValueError(f"金额无效: {amount}")
+        return int(value.quantize(CENT, ROUND_HALF_UP).scaleb(2))
+    except InvalidOperation as e:
+        raise ValueError(f"金额无效: {amount}") from e
+
+
+def from_cents(cents: int) -> Decimal:
+    """整数分转换为两位小数的 Decimal"""
+    return Decimal(cents).scaleb(-2)
+
+
+def format_cents(cents: int) -> str:
+    """整数分格式化为两位小数的字符串，与 str(from_cents(cents)) 相同，用于批量导出"""
+    sign = '-' if cents < 0 else ''
+    yuan, fen = divmod(abs(cents), 100)
+    return f"{sign}{yuan}.{fen:02d}"
+
+
+def quantize(amount: Amount) -> Decimal:
+    """规整为两位小数的 Decimal"""
+    return from_cents(to_cents(amount))
+
+
+def percent_of(cents: int, basis_points: int) -> int:
+    """cents 的 basis_points/10000，按四舍五入取整到分"""
+    value = cents * basis_points
+    return (value + 5000) // 10000 if value >= 0 else -((-value + 5000) // 10000)
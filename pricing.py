@@ -0,0 +1,247 @@
+"""
+奶茶点单系统 - 促销计价引擎
+把生效促销的规则预编译为按商品、分类查表的结构，
+为购物车或订单计价时每个订单项只需常数次查表；金额全程以整数分计算
+"""
+
+import bisect
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, time
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from models import OrderItem, Promotion, PromotionRule, RuleType
+from money import from_cents, percent_of, to_cents
+
+_DAY_SECONDS = 24 * 3600
+_FULL = 10000  # 折扣以万分比（基点）表示
+
+# 查表结果：(折扣基点, 促销标题) 与 (买 N, 赠 M, 促销标题)
+_Percent = Tuple[int, str]
+_BuyFree = Tuple[int, int, str]
+
+
+def _seconds(moment: time) -> int:
+    """一天中的第几秒"""
+    return moment.hour * 3600 + moment.minute * 60 + moment.second
+
+
+def _windows(rule: PromotionRule) -> List[Tuple[int, int]]:
+    """规则每天生效的时间窗口（秒），跨零点的时段拆成两段；全天有效返回 [(0, 86400)]"""
+    if rule.rule_type != RuleType.TIME_OF_DAY:
+        return [(0, _DAY_SECONDS)]
+    start, end = _seconds(rule.start_time), _seconds(rule.end_time)
+    if start < end:
+        return [(start, end)]
+    return [(start, _DAY_SECONDS), (0, end)]
+
+
+def _basis_points(percent: Decimal) -> int:
+    """折扣百分比换算为基点（20 -> 2000）"""
+    return int((percent * 100).to_integral_value(ROUND_HALF_UP))
+
+
+@dataclass
+class PriceQuote:
+    """计价结果，内部以分记账，对外属性为 Decimal"""
+    subtotal_cents: int = 0
+    discount_cents: int = 0
+    detail_cents: Dict[str, int] = field(default_factory=dict)  # 促销标题 -> 优惠金额（分）
+
+    @property
+    def subtotal(self) -> Decimal:
+        """原价"""
+        return from_cents(self.subtotal_cents)
+
+    @property
+    def discount(self) -> Decimal:
+        """优惠金额"""
+        return from_cents(self.discount_cents)
+
+    @property
+    def total(self) -> Decimal:
+        """实付金额"""
+        return from_cents(self.subtotal_cents - self.discount_cents)
+
+    @property
+    def details(self) -> Dict[str, Decimal]:
+        """各促销的优惠金额"""
+        return {title: from_cents(cents) for title, cents in self.detail_cents.items()}
+
+    def add(self, title: str, cents: int):
+        """记入一笔优惠（分）"""
+        if cents > 0:
+            self.discount_cents += cents
+            self.detail_cents[title] = self.detail_cents.get(title, 0) + cents
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'subtotal': str(self.subtotal),
+            'discount': str(self.discount),
+            'total': str(self.total),
+            'details': {title: str(amount) for title, amount in self.details.items()}
+        }
+
+
+class _ScopeTable:
+    """按商品、分类、全场三级查表；同一商品只取三级中最优的一条规则"""
+
+    def __init__(self, better):
+        self._better = better
+        self.by_item: Dict[UUID, tuple] = {}
+        self.by_category: Dict[str, tuple] = {}
+        self.everything: Optional[tuple] = None
+
+    def offer(self, rule: PromotionRule, value: tuple):
+        """登记规则；同一作用范围已有更优的规则时忽略"""
+        better = self._better
+        if rule.item_id is not None:
+            current = self.by_item.get(rule.item_id)
+            if current is None or better(value, current):
+                self.by_item[rule.item_id] = value
+        elif rule.category:
+            current = self.by_category.get(rule.category)
+            if current is None or better(value, current):
+                self.by_category[rule.category] = value
+        elif self.everything is None or better(value, self.everything):
+            self.everything = value
+
+    def lookup(self, item_id: UUID, category: str) -> Tuple[Optional[tuple], Optional[object]]:
+        """查找商品适用的最优规则，返回 (规则值, 作用范围键)"""
+        best, scope = None, None
+        for value, key in ((self.by_item.get(item_id), item_id),
+                           (self.by_category.get(category), ('category', category)),
+                           (self.everything, 'all')):
+            if value is not None and (best is None or self._better(value, best)):
+                best, scope = value, key
+        return best, scope
+
+
+def _better_percent(a: _Percent, b: _Percent) -> bool:
+    return a[0] > b[0]
+
+
+def _better_buy_free(a: _BuyFree, b: _BuyFree) -> bool:
+    return a[1] * (b[0] + b[1]) > b[1] * (a[0] + a[1])
+
+
+class PricingEngine:
+    """
+    编译后的促销计价引擎
+    - 折扣（分类折扣、时段折扣）：按一天内的时间分段预先求出每段的最优折扣表，
+      计价时二分定位时间段；折扣只作用于饮品本身，不作用于小料，同一商品不叠加
+    - 买赠：同一作用范围内每满 N+M 件，价格最低的 M 件免单（按折后单价计算）
+    - 满额免小料：订单原价达到门槛时指定小料免费，门槛按升序预先累积
+    """
+
+    def __init__(self, promotions: Iterable[Promotion] = ()):
+        percent_rules: List[Tuple[PromotionRule, str]] = []
+        self._buy_free = _ScopeTable(_better_buy_free)
+        topping_rules: List[Tuple[int, Optional[UUID], str]] = []
+        self.rule_count = 0
+
+        for promotion in promotions:
+            for rule in promotion.rules:
+                self.rule_count += 1
+                if rule.rule_type in (RuleType.CATEGORY_PERCENT, RuleType.TIME_OF_DAY):
+                    percent_rules.append((rule, promotion.title))
+                elif rule.rule_type == RuleType.BUY_N_GET_M:
+                    self._buy_free.offer(rule, (rule.buy_quantity, rule.free_quantity, promotion.title))
+                elif rule.rule_type == RuleType.FREE_TOPPING:
+                    topping_rules.append((to_cents(rule.threshold), rule.topping_id, promotion.title))
+
+        self._compile_percent(percent_rules)
+        self._compile_toppings(topping_rules)
+
+    def _compile_percent(self, rules: List[Tuple[PromotionRule, str]]):
+        """按时间窗口边界把一天切分成若干段，每段预先生成一张折扣表"""
+        windows = [(window, rule, title) for rule, title in rules for window in _windows(rule)]
+        bounds = sorted({0} | {edge for (start, end), _, _ in windows for edge in (start, end)
+                               if edge < _DAY_SECONDS})
+        self._bounds = bounds
+        self._percent_tables: List[_ScopeTable] = []
+        for start in bounds:
+            table = _ScopeTable(_better_percent)
+            for (window_start, window_end), rule, title in windows:
+                if window_start <= start < window_end:
+                    table.offer(rule, (_basis_points(rule.percent_off), title))
+            self._percent_tables.append(table)
+
+    def _compile_toppings(self, rules: List[Tuple[int, Optional[UUID], str]]):
+        """
+        满额免小料按门槛升序累积：达到第 i 个门槛时，前 i 条规则的小料都免费。
+        每一级记录 (全部小料免费的促销标题, 小料ID -> 促销标题)，免掉的金额记在对应促销名下；
+        同一小料有多条规则时，指定该小料的规则优先，其次门槛较低的规则
+        """
+        rules.sort(key=lambda r: r[0])
+        self._topping_thresholds = [threshold for threshold, _, _ in rules]
+        self._topping_scopes: List[Tuple[Optional[str], Dict[UUID, str]]] = []
+        all_title, titles = None, {}
+        for _, topping_id, title in rules:
+            if topping_id is None:
+                all_title = all_title or title
+            elif topping_id not in titles:
+                titles = {**titles, topping_id: title}
+            self._topping_scopes.append((all_title, titles))
+
+    def percent_table(self, at: datetime) -> _ScopeTable:
+        """某一时刻适用的折扣表"""
+        seconds = _seconds(at.time())
+        return self._percent_tables[bisect.bisect_right(self._bounds, seconds) - 1]
+
+    def price(self, items: Iterable[OrderItem], at: datetime = None) -> PriceQuote:
+        """为一组订单项计价"""
+        items = list(items)
+        quote = PriceQuote(subtotal_cents=sum(item.subtotal_cents() for item in items))
+        if not self.rule_count:
+            return quote
+        percents = self.percent_table(at or datetime.now())
+
+        # 满额免小料：按原价判断门槛
+        index = bisect.bisect_right(self._topping_thresholds, quote.subtotal_cents) - 1
+        topping_scope = self._topping_scopes[index] if index >= 0 else None
+
+        # 买赠分组：作用范围键 -> [(折后单价 × 10000, 数量)]，避免折后单价提前舍入
+        groups: Dict[object, List[Tuple[int, int]]] = defaultdict(list)
+        group_rules: Dict[object, _BuyFree] = {}
+
+        for item in items:
+            menu_item = item.menu_item
+            if menu_item is None:
+                continue
+            unit_cents = menu_item.price_cents
+            scaled_unit = unit_cents * _FULL
+            percent, _ = percents.lookup(menu_item.item_id, menu_item.category)
+            if percent is not None:
+                off, title = percent
+                quote.add(title, percent_of(unit_cents * item.quantity, off))
+                scaled_unit = unit_cents * (_FULL - off)
+
+            buy_free, scope = self._buy_free.lookup(menu_item.item_id, menu_item.category)
+            if buy_free is not None:
+                groups[scope].append((scaled_unit, item.quantity))
+                group_rules[scope] = buy_free
+
+            if topping_scope is not None:
+                all_title, titles = topping_scope
+                for topping in item.toppings:
+                    title = titles.get(topping.topping_id, all_title)
+                    if title is not None:
+                        quote.add(title, topping.extra_price_cents * item.quantity)
+
+        for scope, units in groups.items():
+            buy, free, title = group_rules[scope]
+            free_units = sum(quantity for _, quantity in units) // (buy + free) * free
+            amount = 0
+            for scaled_unit, quantity in sorted(units, key=lambda u: u[0]):
+                if free_units <= 0:
+                    break
+                taken = min(quantity, free_units)
+                amount += scaled_unit * taken
+                free_units -= taken
+            quote.add(title, (amount + _FULL // 2) // _FULL)
+
+        return quote
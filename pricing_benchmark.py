@@ -0,0 +1,184 @@
+"""
+奶茶点单系统 - 促销计价基准测试
+构造大购物车和大量生效促销，对比预编译计价引擎与逐条扫描规则的朴素计价，
+以及整数分与 Decimal 两种金额表示下的合计吞吐量
+"""
+
+import argparse
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, time as day_time
+from decimal import Decimal, ROUND_HALF_UP
+from typing import List
+
+from models import MenuItem, OrderItem, Promotion, PromotionRule, RuleType, Topping
+from money import CENT
+from pricing import PricingEngine
+
+
+def build_fixture(rng: random.Random, items: int, categories: int, promotions: int, lines: int):
+    """生成菜单、促销和购物车"""
+    category_names = [f"分类{i}" for i in range(categories)]
+    menu = [MenuItem(name=f"饮品{i}", price=Decimal(rng.randint(800, 3000)) / 100,
+                     category=rng.choice(category_names)) for i in range(items)]
+    toppings = [Topping(name=f"小料{i}", extra_price=Decimal(rng.randint(100, 400)) / 100)
+                for i in range(10)]
+
+    promos = []
+    for i in range(promotions):
+        kind = rng.choice(list(RuleType))
+        rule = PromotionRule(kind)
+        if rng.random() < 0.5:
+            rule.item_id = rng.choice(menu).item_id
+        else:
+            rule.category = rng.choice(category_names)
+        if kind in (RuleType.CATEGORY_PERCENT, RuleType.TIME_OF_DAY):
+            rule.percent_off = Decimal(rng.randint(5, 50))
+        if kind == RuleType.TIME_OF_DAY:
+            start = rng.randint(0, 22)
+            rule.start_time, rule.end_time = day_time(start), day_time(rng.randint(start + 1, 23))
+        if kind == RuleType.BUY_N_GET_M:
+            rule.buy_quantity, rule.free_quantity = rng.randint(1, 4), 1
+        if kind == RuleType.FREE_TOPPING:
+            rule.item_id, rule.category = None, ""
+            rule.threshold = Decimal(rng.randint(20, 2000))
+            rule.topping_id = rng.choice(toppings).topping_id if rng.random() < 0.7 else None
+        promos.append(Promotion(title=f"促销{i}", rules=[rule]))
+
+    cart = [OrderItem(menu_item=rng.choice(menu), quantity=rng.randint(1, 3),
+                      toppings=rng.sample(toppings, k=rng.randint(0, 2)))
+            for _ in range(lines)]
+    return promos, cart
+
+
+def decimal_subtotal(item: OrderItem) -> Decimal:
+    """改用整数分之前的 Decimal 小计实现，作为吞吐量对照"""
+    base_price = item.menu_item.price
+    toppings_price = sum(t.extra_price for t in item.toppings)
+    return (base_price + toppings_price) * Decimal(str(item.quantity))
+
+
+def naive_price(promotions: List[Promotion], items: List[OrderItem], at: datetime) -> Decimal:
+    """朴素计价：每个订单项逐条扫描全部规则，以 Decimal 计算，返回优惠总额"""
+    subtotal = sum((decimal_subtotal(item) for item in items), Decimal('0.00'))
+    discount = Decimal('0.00')
+    seconds = at.hour * 3600 + at.minute * 60 + at.second
+    rules = [(rule, promo.title) for promo in promotions for rule in promo.rules]
+
+    def applies(rule, menu_item):
+        if rule.item_id is not None:
+            return rule.item_id == menu_item.item_id
+        return not rule.category or rule.category == menu_item.category
+
+    def in_window(rule):
+        if rule.rule_type != RuleType.TIME_OF_DAY:
+            return True
+        start = rule.start_time.hour * 3600 + rule.start_time.minute * 60 + rule.start_time.second
+        end = rule.end_time.hour * 3600 + rule.end_time.minute * 60 + rule.end_time.second
+        return start <= seconds < end if start < end else seconds >= start or seconds < end
+
+    free_all, free_ids, topping_title = False, set(), None
+    for rule, title in sorted(((r, t) for r, t in rules if r.rule_type == RuleType.FREE_TOPPING),
+                              key=lambda rt: rt[0].threshold):
+        if rule.threshold <= subtotal:
+            free_all = free_all or rule.topping_id is None
+            free_ids.add(rule.topping_id)
+            topping_title = title
+
+    groups, group_rules = defaultdict(list), {}
+    for item in items:
+        menu_item = item.menu_item
+        unit_price = menu_item.price
+        best = None
+        for rule, title in rules:
+            if (rule.rule_type in (RuleType.CATEGORY_PERCENT, RuleType.TIME_OF_DAY)
+                    and applies(rule, menu_item) and in_window(rule)
+                    and (best is None or rule.percent_off > best[0])):
+                best = (rule.percent_off, title)
+        if best:
+            discount += (unit_price * item.quantity * best[0] / 100).quantize(CENT, ROUND_HALF_UP)
+            unit_price = unit_price * (100 - best[0]) / 100
+
+        # 优惠力度相同时，与引擎一致地优先商品级、其次分类级规则
+        best, scope, rank = None, None, 3
+        for rule, title in rules:
+            if rule.rule_type == RuleType.BUY_N_GET_M and applies(rule, menu_item):
+                value = (rule.buy_quantity, rule.free_quantity, title)
+                level = 0 if rule.item_id else (1 if rule.category else 2)
+                gain = 0 if best is None else \
+                    value[1] * (best[0] + best[1]) - best[1] * (value[0] + value[1])
+                if best is None or gain > 0 or (gain == 0 and level < rank):
+                    best, rank = value, level
+                    scope = rule.item_id or (('category', rule.category) if rule.category else 'all')
+        if best:
+            groups[scope].append((unit_price, item.quantity))
+            group_rules[scope] = best
+
+        if topping_title:
+            free = sum((t.extra_price for t in item.toppings
+                        if free_all or t.topping_id in free_ids), Decimal('0'))
+            discount += free * item.quantity
+
+    for scope, units in groups.items():
+        buy, free, _ = group_rules[scope]
+        free_units = sum(q for _, q in units) // (buy + free) * free
+        amount = Decimal('0')
+        for unit_price, quantity in sorted(units, key=lambda u: u[0]):
+            taken = min(quantity, free_units)
+            amount += unit_price * taken
+            free_units -= taken
+        discount += amount.quantize(CENT, ROUND_HALF_UP)
+    return discount
+
+
+def timed(func, rounds: int) -> float:
+    """执行 rounds 次，返回平均耗时（毫秒）"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) * 1000 / rounds
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="奶茶点单系统促销计价基准测试")
+    parser.add_argument('--lines', type=int, default=500, help="购物车订单项数")
+    parser.add_argument('--promotions', type=int, default=1000, help="生效促销数")
+    parser.add_argument('--items', type=int, default=300, help="菜单商品数")
+    parser.add_argument('--categories', type=int, default=20, help="分类数")
+    parser.add_argument('--rounds', type=int, default=20, help="重复次数")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    promotions, cart = build_fixture(rng, args.items, args.categories, args.promotions, args.lines)
+    at = datetime.now().replace(hour=15, minute=0)
+
+    compile_ms = timed(lambda: PricingEngine(promotions), max(1, args.rounds // 4))
+    engine = PricingEngine(promotions)
+    engine_ms = timed(lambda: engine.price(cart, at), args.rounds)
+    naive_ms = timed(lambda: naive_price(promotions, cart, at), max(1, args.rounds // 4))
+
+    compiled, naive = engine.price(cart, at), naive_price(promotions, cart, at)
+    assert compiled.discount == naive, (compiled.discount, naive)
+
+    # 合计吞吐量：同一购物车分别用 Decimal 与整数分求和
+    decimal_total = sum((decimal_subtotal(item) for item in cart), Decimal('0.00'))
+    assert decimal_total == compiled.subtotal
+    decimal_ms = timed(lambda: sum((decimal_subtotal(item) for item in cart), Decimal('0.00')),
+                       args.rounds)
+    cents_ms = timed(lambda: sum(item.subtotal_cents() for item in cart), args.rounds)
+
+    print(f"订单项: {args.lines}，生效促销: {args.promotions}，商品: {args.items}")
+    print(f"原价: ¥{compiled.subtotal}，优惠: ¥{compiled.discount}，实付: ¥{compiled.total}")
+    print(f"编译规则: {compile_ms:.2f} ms")
+    print(f"引擎计价: {engine_ms:.2f} ms/次")
+    print(f"朴素计价: {naive_ms:.2f} ms/次（{naive_ms / engine_ms:.1f} 倍）")
+    print(f"合计（Decimal）: {decimal_ms:.3f} ms/次，{args.lines / decimal_ms * 1000:,.0f} 行/秒")
+    print(f"合计（整数分）: {cents_ms:.3f} ms/次，{args.lines / cents_ms * 1000:,.0f} 行/秒"
+          f"（{decimal_ms / cents_ms:.1f} 倍）")
+
+
+if __name__ == '__main__':
+    main()
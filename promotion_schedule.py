@@ -0,0 +1,205 @@
+"""
+奶茶点单系统 - 促销活动时间轴与生效调度
+促销按起止时间存入有序时间轴，调度器在边界时刻把促销移入、移出生效集合，
+读取生效促销只需返回当前集合
+"""
+
+import bisect
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from models import Promotion
+
+# 促销在 end_at 之后的第一个时刻失效（datetime 精度为微秒）
+_RESOLUTION = timedelta(microseconds=1)
+
+# 定时器最长等待时间；到期后重新检查，兼顾其他进程写入的修改
+MAX_TIMER_DELAY = 60.0
+
+
+class PromotionTimeline:
+    """
+    促销时间轴
+    生效区间为 [start_at, end_at]；开始和失效时刻分别存入有序列表，
+    区间查询与求下一个边界都通过二分完成。
+    非线程安全，由 PromotionRepository 在持有锁时维护和查询
+    """
+
+    def __init__(self):
+        self._starts: List[Tuple[datetime, UUID]] = []
+        self._stops: List[Tuple[datetime, UUID]] = []
+        # 索引时的起止时刻；促销可能被原地修改，移除时以此为准
+        self._keys: Dict[UUID, Tuple[datetime, datetime]] = {}
+        self._items: Dict[UUID, Promotion] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def clear(self):
+        """清空时间轴"""
+        self._starts.clear()
+        self._stops.clear()
+        self._keys.clear()
+        self._items.clear()
+
+    def add(self, promotion: Promotion):
+        """加入或更新促销；已停用或区间为空的促销不进入时间轴"""
+        promotion_id = promotion.promotion_id
+        if promotion_id in self._items:
+            self.remove(promotion_id)
+        if not promotion.is_active or promotion.end_at < promotion.start_at:
+            return
+        start, stop = promotion.start_at, promotion.end_at + _RESOLUTION
+        bisect.insort(self._starts, (start, promotion_id))
+        bisect.insort(self._stops, (stop, promotion_id))
+        self._keys[promotion_id] = (start, stop)
+        self._items[promotion_id] = promotion
+
+    def remove(self, promotion_id: UUID):
+        """移除促销"""
+        if self._items.pop(promotion_id, None) is None:
+            return
+        start, stop = self._keys.pop(promotion_id)
+        del self._starts[bisect.bisect_left(self._starts, (start, promotion_id))]
+        del self._stops[bisect.bisect_left(self._stops, (stop, promotion_id))]
+
+    def rebuild(self, promotions):
+        """全量重建"""
+        self.clear()
+        for promotion in promotions:
+            self.add(promotion)
+
+    @staticmethod
+    def _after(events: List[Tuple[datetime, UUID]], moment: datetime) -> int:
+        """第一个时刻晚于 moment 的事件下标"""
+        return bisect.bisect_right(events, (moment, UUID(int=2 ** 128 - 1)))
+
+    def active_at(self, moment: datetime) -> List[Promotion]:
+        """moment 时刻生效的促销，按开始时间排序"""
+        started = self._starts[:self._after(self._starts, moment)]
+        return [self._items[pid] for _, pid in started if self._keys[pid][1] > moment]
+
+    def transitions(self, since: datetime, until: datetime) -> Tuple[List[Promotion], List[UUID]]:
+        """
+        时间从 since 推进到 until 时的变化
+        返回: (新生效的促销, 已失效的促销ID)
+        """
+        starts = self._starts[self._after(self._starts, since):self._after(self._starts, until)]
+        stops = self._stops[self._after(self._stops, since):self._after(self._stops, until)]
+        started = [self._items[pid] for _, pid in starts if self._keys[pid][1] > until]
+        return started, [pid for _, pid in stops]
+
+    def next_boundary(self, moment: datetime) -> Optional[datetime]:
+        """moment 之后下一个开始或失效时刻，没有则返回 None"""
+        candidates = [events[i][0] for events in (self._starts, self._stops)
+                      for i in (self._after(events, moment),) if i < len(events)]
+        return min(candidates) if candidates else None
+
+
+class PromotionScheduler:
+    """
+    促销生效调度器
+    维护当前生效的促销集合：仓储数据变化时重建，到达时间轴边界时增量推进。
+    start() 后由定时器在边界时刻主动推进并通知订阅者；
+    订阅回调在调度器线程中执行，界面需自行切回主线程
+    """
+
+    def __init__(self, promotion_repo, clock: Callable[[], datetime] = datetime.now):
+        self.promotion_repo = promotion_repo
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._active: Dict[UUID, Promotion] = {}
+        self._snapshot: Tuple[Promotion, ...] = ()
+        self._revision = None
+        self._as_of: Optional[datetime] = None
+        self._valid_until: Optional[datetime] = None
+        self._subscribers: List[Callable[[Tuple[Promotion, ...]], None]] = []
+        self._timer: Optional[threading.Timer] = None
+        self._running = False
+
+    def subscribe(self, callback: Callable[[Tuple[Promotion, ...]], None]):
+        """订阅生效集合变化，回调参数为新的生效促销元组"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[Tuple[Promotion, ...]], None]):
+        """取消订阅"""
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def active(self) -> Tuple[Promotion, ...]:
+        """当前生效的促销；集合未过期时直接返回缓存的元组"""
+        revision = self.promotion_repo.revision()
+        now = self._clock()
+        valid_until = self._valid_until
+        if (revision == self._revision and self._as_of is not None and self._as_of <= now
+                and (valid_until is None or now < valid_until)):
+            return self._snapshot
+        return self.refresh(now)
+
+    def refresh(self, now: datetime = None) -> Tuple[Promotion, ...]:
+        """重新计算生效集合，有变化时通知订阅者"""
+        now = now or self._clock()
+        with self._lock:
+            before = self._snapshot
+            revision = self.promotion_repo.revision()
+            if revision != self._revision or self._as_of is None or now < self._as_of:
+                self._active = {p.promotion_id: p for p in self.promotion_repo.find_active(now)}
+            elif self._valid_until is not None and now >= self._valid_until:
+                started, stopped = self.promotion_repo.find_transitions(self._as_of, now)
+                for promotion_id in stopped:
+                    self._active.pop(promotion_id, None)
+                for promotion in started:
+                    self._active[promotion.promotion_id] = promotion
+            self._revision = revision
+            self._as_of = now
+            self._valid_until = self.promotion_repo.next_transition(now)
+            snapshot = tuple(sorted(self._active.values(),
+                                    key=lambda p: (p.start_at, p.promotion_id)))
+            changed = [(p.promotion_id, p.version) for p in snapshot] != \
+                [(p.promotion_id, p.version) for p in before]
+            self._snapshot = snapshot
+            subscribers = list(self._subscribers) if changed else []
+            self._schedule(now)
+        for callback in subscribers:
+            try:
+                callback(snapshot)
+            except Exception as e:  # pylint: disable=broad-except
+                print(f"促销订阅回调失败: {e}")
+        return snapshot
+
+    def start(self):
+        """启动定时器，在生效边界主动推进"""
+        with self._lock:
+            self._running = True
+        self.refresh()
+
+    def stop(self):
+        """停止定时器"""
+        with self._lock:
+            self._running = False
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _schedule(self, now: datetime):
+        """按下一个边界重新设置定时器（调用方需持有锁）"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._running:
+            return
+        delay = MAX_TIMER_DELAY
+        if self._valid_until is not None:
+            delay = min(delay, max((self._valid_until - now).total_seconds(), 0.0))
+        self._timer = threading.Timer(delay, self._tick)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _tick(self):
+        """定时器回调"""
+        if self._running:
+            self.refresh()
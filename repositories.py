@@ -3,88 +3,661 @@
 使用JSON文件作为简单的数据存储
 """
 
+import atexit
+import bisect
 import json
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import fields
+from datetime import date, datetime, timedelta
 from pathlib import Path
-from typing import List, Optional, TypeVar, Generic, Type
+from typing import Dict, Iterable, List, Optional, Tuple, TypeVar, Generic, Type
 from uuid import UUID
 
 from models import (
     User, Menu, MenuItem, Order, Cart, Review, 
-    Favorite, Promotion, Topping
+    Favorite, Promotion, Topping, OrderStatus
 )
+from money import to_cents
+from menu_search import MenuSearchIndex
+from promotion_schedule import PromotionTimeline
+from snapshot_cache import SnapshotCache, gc_paused, read_source
 
 
 T = TypeVar('T')
 
 
+class VersionConflictError(Exception):
+    """乐观锁冲突：实体已被其他写者修改或删除"""
+    
+    def __init__(self, entity_id: UUID, expected: int, actual: Optional[int]):
+        if actual is None:
+            message = f"数据已被删除: {entity_id}"
+        else:
+            message = f"数据已被其他终端修改（期望版本 {expected}，当前版本 {actual}），请刷新后重试"
+        super().__init__(message)
+        self.entity_id = entity_id
+        self.expected = expected
+        self.actual = actual
+
+
+class ReadWriteLock:
+    """
+    读写锁（写优先）
+    多个读者可同时持有；写者独占，且等待中的写者会阻止新的读者进入
+    不可重入：持有锁期间不要再次获取同一把锁
+    """
+    
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+    
+    @contextmanager
+    def read_locked(self):
+        """获取读锁"""
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+    
+    @contextmanager
+    def write_locked(self):
+        """获取写锁"""
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+@contextmanager
+def file_lock(lock_path: Path):
+    """
+    跨进程咨询锁（独占）
+    锁定单独的 .lock 文件，数据文件本身通过原子替换更新，读取无需加锁
+    """
+    with open(lock_path, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt  # pylint: disable=import-outside-toplevel,import-error
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK 重试约 10 秒后仍失败时抛出，继续等待
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl  # pylint: disable=import-outside-toplevel,import-error
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def file_signature(filepath: Path) -> Optional[tuple]:
+    """文件变更签名 (inode, 大小, 修改时间)；文件不存在时返回 None"""
+    try:
+        st = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def write_json_atomic(filepath: Path, data):
+    """先写临时文件再替换，避免读到写了一半的文件"""
+    tmp_path = filepath.with_name(filepath.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, filepath)
+
+
+class DiskWriter:
+    """
+    后台写盘线程
+    所有仓储的文件写入都交给同一个线程串行执行；同一仓储在写出前的
+    多次保存会合并为一次写入
+    """
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending: Dict['Repository', None] = {}
+        self._in_flight: set = set()
+        self._thread: Optional[threading.Thread] = None
+    
+    def submit(self, repo: 'Repository'):
+        """登记一个有待写数据的仓储"""
+        with self._cond:
+            self._pending[repo] = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='repo-writer', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+    
+    def flush(self, filepath: Path = None):
+        """等待指定文件（默认全部文件）的待写数据落盘"""
+        def done():
+            busy = list(self._pending) + list(self._in_flight)
+            if filepath is None:
+                return not busy
+            return all(repo.filepath != filepath for repo in busy)
+        with self._cond:
+            self._cond.wait_for(done)
+    
+    def pending_elsewhere(self, repo: 'Repository') -> bool:
+        """同一文件是否有其他仓储实例的待写数据"""
+        with self._cond:
+            return any(other is not repo and other.filepath == repo.filepath
+                       for other in (*self._pending, *self._in_flight))
+    
+    def _run(self):
+        """写盘线程主循环"""
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                repo = next(iter(self._pending))
+                del self._pending[repo]
+                self._in_flight.add(repo)
+            try:
+                repo.write_to_disk()
+            except Exception as e:
+                print(f"保存数据失败 {repo.filepath}: {e}")
+            finally:
+                with self._cond:
+                    self._in_flight.discard(repo)
+                    self._cond.notify_all()
+
+
+_disk_writer = DiskWriter()
+atexit.register(_disk_writer.flush)
+
+# 各仓储共用的启动快照缓存
+snapshot_cache = SnapshotCache(Path(__file__).parent / 'data')
+
+
+def flush_pending_writes():
+    """等待所有仓储的待写数据落盘"""
+    _disk_writer.flush()
+
+
+def iter_json_array(filepath: Path, chunk_size: int = 1 << 16):
+    """
+    流式解析顶层为数组的 JSON 文件，逐个产出元素
+    每次只读入 chunk_size 个字符，内存占用与文件大小无关（只与单个元素大小有关）
+    """
+    decoder = json.JSONDecoder()
+    with open(filepath, 'r', encoding='utf-8') as f:
+        buffer, pos, eof, started = '', 0, False, False
+        while True:
+            # 跳过空白、逗号和数组起始符
+            while pos < len(buffer) and (buffer[pos] in ' \t\r\n,' or (buffer[pos] == '[' and not started)):
+                started = started or buffer[pos] == '['
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            if pos >= len(buffer) and eof:
+                if started:
+                    raise ValueError(f"JSON 数组不完整: {filepath}")
+                return
+            try:
+                if pos >= len(buffer):
+                    raise json.JSONDecodeError("需要更多数据", buffer, pos)
+                element, end = decoder.raw_decode(buffer, pos)
+                # 元素恰好在缓冲区末尾结束时可能被截断（如数字），读入更多后重新解析
+                if end == len(buffer) and not eof:
+                    raise json.JSONDecodeError("需要更多数据", buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield element
+            pos = end
+
+
+def scan_entities(filename: str, model_class: Type[T], start: date = None, end: date = None):
+    """
+    逐个读取数据文件中的实体，不构建仓储的内存缓存，适合导出等一次性遍历
+    先等待本进程对该文件的待写数据落盘；文件以原子替换方式更新，
+    遍历期间看到的始终是打开时的完整版本。
+    filename 为分区目录时按日期顺序读取各分区，并跳过 [start, end] 以外的分区
+    （只按分区裁剪，调用方仍需逐条过滤）
+    """
+    filepath = Path(__file__).parent / 'data' / filename
+    _disk_writer.flush(filepath)
+    if filepath.is_dir():
+        paths = sorted(filepath.glob('????-??-??.json'))
+        paths = [path for path in paths if (start is None or path.stem >= start.isoformat())
+                 and (end is None or path.stem <= end.isoformat())]
+    else:
+        paths = [filepath] if filepath.exists() else []
+    for path in paths:
+        for data in iter_json_array(path):
+            yield model_class.from_dict(data)
+
+
 class Repository(Generic[T]):
-    """通用仓储接口"""
+    """
+    通用仓储接口
+    线程安全；多个进程共享同一数据目录时，写入前在文件锁内合并其他进程的修改，
+    读取前通过文件签名检测变更并只重建版本号变化的记录。
+    写盘是异步的：本地修改写盘前若已被其他进程基于同一版本改写，以先写盘者为准，
+    本地修改放弃并记入 conflicts
+    """
     
     def __init__(self, filename: str, model_class: Type[T]):
         """初始化仓储"""
         self.data_dir = Path(__file__).parent / 'data'
         self.data_dir.mkdir(exist_ok=True)
         self.filepath = self.data_dir / filename
+        self.lock_path = self.data_dir / (filename + '.lock')
         self.model_class = model_class
-        self._data: List[T] = []
+        # 所有模型的第一个字段都是实体 ID
+        self._id_field = fields(model_class)[0].name
+        self._lock = ReadWriteLock()
+        # 按实体 ID 索引，保持插入顺序
+        self._data: Dict[UUID, T] = {}
+        # 数据修订号：内存数据每次变化（保存、删除、合并磁盘修改）都会递增
+        self._revision = 0
+        # 变更日志：实体ID -> 最近一次变更的序号，按变更先后排列，供增量消费者读取
+        self._changes: 'OrderedDict[UUID, int]' = OrderedDict()
+        self._change_seq = 0
+        self._signature: Optional[tuple] = None
+        # 本进程已修改/删除但尚未写盘的实体 -> 修改所基于的磁盘版本（新增或不检查时为 None）；
+        # 合并磁盘数据时，磁盘版本未变则以本地为准，已变说明其他进程先写了盘
+        self._dirty: Dict[UUID, Optional[int]] = {}
+        self._deleted: Dict[UUID, Optional[int]] = {}
+        # 写盘前发现被其他进程抢先修改的实体：实体ID -> 冲突，本地修改已放弃，以磁盘为准
+        self.conflicts: Dict[UUID, VersionConflictError] = {}
+        # deferred_writes() 的嵌套层数，以及期间是否有被推迟的写盘
+        self._defer_depth = 0
+        self._deferred = False
         self._load()
     
     def _load(self):
         """从文件加载数据"""
+        # 同进程内其他仓储实例可能还有未落盘的写入
+        _disk_writer.flush(self.filepath)
+        self._signature = self._disk_signature()
         if self.filepath.exists():
             try:
-                with open(self.filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self._data = [self.model_class.from_dict(item) for item in data]
+                with gc_paused():
+                    items = self._load_entities(self.filepath)
+                    self._data = {self._get_id(item): item for item in items}
             except (json.JSONDecodeError, IOError, ValueError) as e:
                 print(f"加载数据失败 {self.filepath}: {e}")
-                self._data = []
+                self._data = {}
         else:
-            self._data = []
+            self._data = {}
+        self._revision += 1
+        for entity_id in self._data:
+            self._log_change(entity_id)
+        self._rebuild_indexes()
+    
+    def _load_entities(self, path: Path) -> List[T]:
+        """读取一个数据文件的全部实体：内容未变时取自启动快照缓存，否则解析 JSON 并更新缓存"""
+        raw, key = read_source(path)
+        items = snapshot_cache.load(path, key)
+        if items is None:
+            items = [self.model_class.from_dict(item) for item in json.loads(raw)]
+            snapshot_cache.store(path, key, items)
+        return items
+    
+    def _sync_from_disk(self):
+        """
+        若文件在本仓储上次读写后被修改（其他进程或其他仓储实例），
+        合并磁盘上的记录（调用方需持有写锁）
+        """
+        signature = self._disk_signature()
+        if signature == self._signature:
+            return
+        records = []
+        if signature is not None:
+            try:
+                with open(self.filepath, 'r', encoding='utf-8') as f:
+                    records = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"加载数据失败 {self.filepath}: {e}")
+                return
+        self._merge(records)
+        self._signature = signature
+    
+    def _disk_signature(self) -> Optional[tuple]:
+        """磁盘数据的变更签名，与上次读写时不同说明需要合并"""
+        return file_signature(self.filepath)
+    
+    def _mark_dirty(self, entity_id: UUID, base: Optional[int]):
+        """登记本地修改；已登记过的保留最初的基准版本（调用方需持有写锁）"""
+        if entity_id in self._deleted:
+            base = self._deleted.pop(entity_id)
+        self._dirty.setdefault(entity_id, base)
+        self.conflicts.pop(entity_id, None)
+    
+    def _mark_deleted(self, entity_id: UUID, base: Optional[int]):
+        """登记本地删除（调用方需持有写锁）"""
+        base = self._dirty.pop(entity_id, base)
+        self._deleted.setdefault(entity_id, base)
+        self.conflicts.pop(entity_id, None)
+    
+    def _lost_race(self, entity_id: UUID, record: Optional[dict]) -> bool:
+        """
+        本地未写盘的修改所基于的版本与磁盘记录（None 表示已被删除）不一致时，
+        说明其他进程已先写盘：放弃本地修改并记录冲突，返回 True（调用方需持有写锁）
+        """
+        if entity_id in self._dirty:
+            base = self._dirty[entity_id]
+        elif entity_id in self._deleted:
+            base = self._deleted[entity_id]
+            if record is None:
+                return False
+        else:
+            return False
+        if base is None:
+            return False
+        actual = None if record is None else record.get('version', 0)
+        if actual == base:
+            return False
+        self._dirty.pop(entity_id, None)
+        self._deleted.pop(entity_id, None)
+        error = VersionConflictError(entity_id, base, actual)
+        self.conflicts[entity_id] = error
+        print(f"保存冲突 {self.filepath}: {error}")
+        return True
+    
+    def _merge(self, records: list):
+        """
+        按记录合并：版本号未变的记录沿用内存对象，本地未写盘的修改优先；
+        本地修改所基于的版本已被其他进程改写时以磁盘为准并记录冲突
+        """
+        local = self._data
+        merged = {}
+        seen = set()
+        for record in records:
+            try:
+                entity_id = UUID(str(record[self._id_field]))
+                seen.add(entity_id)
+                current = local.get(entity_id)
+                if self._lost_race(entity_id, record):
+                    merged[entity_id] = self.model_class.from_dict(record)
+                    continue
+                if entity_id in self._deleted:
+                    continue
+                if current is not None and (entity_id in self._dirty
+                                            or current.version == record.get('version', 0)):
+                    merged[entity_id] = current
+                else:
+                    merged[entity_id] = self.model_class.from_dict(record)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"加载数据失败 {self.filepath}: {e}")
+        # 本地新增、尚未写盘的实体（已被其他进程删除的修改除外）
+        for entity_id, item in local.items():
+            if entity_id not in seen and entity_id in self._dirty \
+                    and not self._lost_race(entity_id, None):
+                merged[entity_id] = item
+        for entity_id, item in merged.items():
+            if local.get(entity_id) is not item:
+                self._log_change(entity_id)
+        for entity_id in local.keys() - merged.keys():
+            self._log_change(entity_id)
+        self._data = merged
+        self._revision += 1
+        self._rebuild_indexes()
+    
+    def _log_change(self, entity_id: UUID):
+        """记录实体变更（调用方需持有写锁或处于初始化中）"""
+        self._change_seq += 1
+        self._changes[entity_id] = self._change_seq
+        self._changes.move_to_end(entity_id)
+    
+    def _rebuild_indexes(self):
+        """重建子类维护的派生索引（调用方需持有写锁或处于初始化中）"""
+    
+    def _index_item(self, item: T):
+        """实体加入仓储后更新派生索引（调用方需持有写锁）"""
+    
+    def _unindex_item(self, item: T):
+        """实体移出仓储前更新派生索引（调用方需持有写锁）"""
+    
+    def _refresh(self):
+        """读取前检测文件变更；未变更时只有一次 stat 开销"""
+        # 本进程内其他实例对同一文件的修改尚未落盘时先等待，保证读到最新数据
+        if _disk_writer.pending_elsewhere(self):
+            _disk_writer.flush(self.filepath)
+        if self._disk_signature() != self._signature:
+            with self._lock.write_locked():
+                self._sync_from_disk()
+    
+    @contextmanager
+    def _reading(self):
+        """检测变更后获取读锁"""
+        self._refresh()
+        with self._lock.read_locked():
+            yield
     
     def _save(self):
-        """保存数据到文件"""
+        """保存数据到文件：交给写盘线程异步写入"""
+        if self._defer_depth:
+            self._deferred = True
+            return
+        _disk_writer.submit(self)
+    
+    @contextmanager
+    def deferred_writes(self):
+        """
+        批量写入期间暂不写盘，退出时合并为一次写盘（导入用）
+        每次写盘都要序列化整个文件，逐批写盘会使导入耗时随数据量平方增长
+        """
+        with self._lock.write_locked():
+            self._defer_depth += 1
         try:
-            with open(self.filepath, 'w', encoding='utf-8') as f:
-                data = [item.to_dict() for item in self._data]
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"保存数据失败 {self.filepath}: {e}")
-    
-    def save(self, item: T) -> T:
-        """保存实体"""
-        # 检查是否已存在
-        existing = self.find_by_id(self._get_id(item))
-        if existing:
-            # 更新
-            index = self._data.index(existing)
-            self._data[index] = item
-        else:
-            # 新增
-            self._data.append(item)
-        self._save()
+            yield self
+        finally:
+            with self._lock.write_locked():
+                self._defer_depth -= 1
+                submit = not self._defer_depth and self._deferred
+                if submit:
+                    self._deferred = False
+            if submit:
+                _disk_writer.submit(self)
+    
+    def write_to_disk(self):
+        """
+        在跨进程文件锁内：合并其他进程的修改，生成快照并原子替换数据文件
+        由写盘线程调用
+        """
+        with file_lock(self.lock_path):
+            with self._lock.write_locked():
+                self._sync_from_disk()
+                snapshot = [item.to_dict() for item in self._data.values()]
+                self._dirty.clear()
+                self._deleted.clear()
+            write_json_atomic(self.filepath, snapshot)
+            with self._lock.write_locked():
+                self._signature = self._disk_signature()
+    
+    def flush(self):
+        """等待本仓储的待写数据落盘"""
+        _disk_writer.flush(self.filepath)
+    
+    def revision(self) -> int:
+        """当前数据修订号（先检测文件变更），用于判断派生缓存是否过期"""
+        self._refresh()
+        return self._revision
+    
+    def save(self, item: T, expected_version: int = None) -> T:
+        """
+        保存实体（比较并交换）
+        expected_version 缺省时取 item.version；与仓储中的当前版本不一致时
+        抛出 VersionConflictError，成功后版本号加一
+        """
+        entity_id = self._get_id(item)
+        if expected_version is None:
+            expected_version = item.version
+        with self._lock.write_locked():
+            # 先合并其他进程已写盘的修改，使版本检查覆盖跨进程的并发写
+            self._sync_from_disk()
+            # 检查是否已存在
+            existing = self._data.get(entity_id)
+            if existing is not None:
+                # 更新
+                if existing.version != expected_version:
+                    raise VersionConflictError(entity_id, expected_version, existing.version)
+                item.version = existing.version + 1
+                self._unindex_item(existing)
+            else:
+                # 新增；带版本号的实体不存在说明已被删除
+                if expected_version:
+                    raise VersionConflictError(entity_id, expected_version, None)
+                item.version = 1
+            self._data[entity_id] = item
+            self._revision += 1
+            self._log_change(entity_id)
+            self._index_item(item)
+            self._mark_dirty(entity_id, existing.version if existing is not None else None)
+            self._save()
         return item
     
+    def save_many(self, items: List[T]) -> List[Optional[T]]:
+        """
+        批量保存（导入用）：整批只获取一次写锁、合并一次磁盘修改、提交一次写盘；
+        多批连续导入时配合 deferred_writes() 只在最后写盘一次。
+        不做版本检查，已存在的实体以导入数据为准覆盖，版本号在原有基础上加一
+        返回: 各实体被覆盖前的旧版本，新增的为 None
+        """
+        if not items:
+            return []
+        with self._lock.write_locked():
+            self._sync_from_disk()
+            previous = []
+            # 批次不小于现有数据时，整批写入后一次性重建派生索引比逐条维护更快
+            rebuild = len(items) >= len(self._data)
+            for item in items:
+                entity_id = self._get_id(item)
+                existing = self._data.get(entity_id)
+                if existing is not None:
+                    item.version = existing.version + 1
+                    if not rebuild:
+                        self._unindex_item(existing)
+                else:
+                    item.version = 1
+                self._data[entity_id] = item
+                self._log_change(entity_id)
+                # 导入以导入数据为准，写盘时不做版本检查
+                self._deleted.pop(entity_id, None)
+                self._dirty[entity_id] = None
+                self.conflicts.pop(entity_id, None)
+                if not rebuild:
+                    self._index_item(item)
+                previous.append(existing)
+            if rebuild:
+                self._rebuild_indexes()
+            self._revision += 1
+            self._save()
+        return previous
+    
     def find_by_id(self, entity_id: UUID) -> Optional[T]:
         """根据ID查找实体"""
-        for item in self._data:
-            if self._get_id(item) == entity_id:
-                return item
-        return None
+        with self._reading():
+            return self._data.get(entity_id)
+    
+    def get_many(self, entity_ids: Iterable[UUID]) -> Dict[UUID, T]:
+        """
+        批量按ID查找：只检测一次文件变更、获取一次读锁
+        返回: {ID: 实体}，按传入顺序，找不到的ID不出现在结果中
+        """
+        with self._reading():
+            data = self._data
+            return {entity_id: data[entity_id] for entity_id in entity_ids if entity_id in data}
     
     def find_all(self) -> List[T]:
         """查找所有实体"""
-        return self._data.copy()
+        with self._reading():
+            return list(self._data.values())
+    
+    def changes_since(self, token: int = 0) -> Tuple[int, List[T], List[UUID]]:
+        """
+        增量读取 token 之后的变更，只遍历变更过的实体
+        返回: (新 token, 新增或修改的实体, 已删除的实体ID)；token=0 时返回全部实体
+        """
+        with self._reading():
+            changed, deleted = [], []
+            for entity_id, seq in reversed(self._changes.items()):
+                if seq <= token:
+                    break
+                item = self._data.get(entity_id)
+                if item is not None:
+                    changed.append(item)
+                else:
+                    deleted.append(entity_id)
+            changed.reverse()
+            deleted.reverse()
+            return self._change_seq, changed, deleted
     
     def delete(self, entity_id: UUID) -> bool:
         """删除实体"""
-        item = self.find_by_id(entity_id)
-        if item:
-            self._data.remove(item)
+        with self._lock.write_locked():
+            self._sync_from_disk()
+            existing = self._data.pop(entity_id, None)
+            if existing is None:
+                return False
+            self._unindex_item(existing)
+            self._revision += 1
+            self._log_change(entity_id)
+            self._mark_deleted(entity_id, existing.version)
             self._save()
             return True
-        return False
+    
+    def delete_many(self, entity_ids: List[UUID]) -> int:
+        """批量删除：一次写锁、一次写盘，返回实际删除的数量"""
+        with self._lock.write_locked():
+            self._sync_from_disk()
+            # 删除量较大时整体重建派生索引，避免逐条维护
+            rebuild = len(entity_ids) * 8 >= len(self._data)
+            removed = 0
+            for entity_id in entity_ids:
+                existing = self._data.pop(entity_id, None)
+                if existing is None:
+                    continue
+                if not rebuild:
+                    self._unindex_item(existing)
+                self._log_change(entity_id)
+                self._mark_deleted(entity_id, existing.version)
+                removed += 1
+            if removed:
+                if rebuild:
+                    self._rebuild_indexes()
+                self._revision += 1
+                self._save()
+            return removed
     
     def _get_id(self, item: T) -> UUID:
         """获取实体ID"""
@@ -111,6 +684,297 @@ class Repository(Generic[T]):
             raise ValueError(f"无法获取实体ID: {type(item)}")
 
 
+class PartitionedRepository(Repository[T]):
+    """
+    按日期分区存储的仓储
+    每天的实体存为目录下的 <YYYY-MM-DD>.json，清单 manifest.json 记录各分区的写入序号。
+    写盘只重写有变更的分区；读取前只检查清单的签名，其他进程写入后只重新加载序号变化的分区；
+    启动时用线程池并行读取各分区，内容未变的分区取自启动快照缓存
+    """
+    
+    # 分区依据的日期时间字段
+    PARTITION_FIELD = 'created_at'
+    # 并行加载分区的最大线程数
+    LOAD_WORKERS = 8
+    
+    def __init__(self, dirname: str, model_class: Type[T], legacy_filename: str = None):
+        # 内存中各分区的实体（按分区键）、实体所在的分区，以及有实体的分区键的有序列表
+        # （实体的日期字段可能被就地修改，移出分区时以记录的分区为准）
+        self._members: Dict[str, Dict[UUID, None]] = {}
+        self._member_of: Dict[UUID, str] = {}
+        self._partition_keys: List[str] = []
+        # 磁盘上各分区的实体，以及实体所在的分区（写盘时据此找出实体迁出的旧分区）
+        self._stored: Dict[str, set] = {}
+        self._stored_in: Dict[UUID, str] = {}
+        # 已加载的各分区写入序号
+        self._partition_seqs: Dict[str, int] = {}
+        # 分区存储之前的单文件数据，首次加载时迁移
+        self.legacy_filename = legacy_filename
+        super().__init__(dirname, model_class)
+    
+    @property
+    def manifest_path(self) -> Path:
+        return self.filepath / 'manifest.json'
+    
+    def _partition_key(self, item: T) -> str:
+        """实体所在的分区"""
+        return getattr(item, self.PARTITION_FIELD).date().isoformat()
+    
+    def _partition_path(self, key: str) -> Path:
+        return self.filepath / f"{key}.json"
+    
+    def _disk_signature(self) -> Optional[tuple]:
+        return file_signature(self.manifest_path)
+    
+    def _read_manifest(self) -> Dict[str, int]:
+        """读取清单：分区键 -> 写入序号"""
+        if not self.manifest_path.exists():
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"加载数据失败 {self.manifest_path}: {e}")
+            return {}
+    
+    def _read_partitions(self, keys: List[str]) -> Dict[str, Optional[list]]:
+        """并行读取若干分区的记录；读取失败的分区为 None"""
+        def read(key):
+            path = self._partition_path(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                return []
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"加载数据失败 {path}: {e}")
+                return None
+        if len(keys) <= 1:
+            return {key: read(key) for key in keys}
+        with ThreadPoolExecutor(max_workers=min(self.LOAD_WORKERS, len(keys))) as pool:
+            return dict(zip(keys, pool.map(read, keys)))
+    
+    def _migrate_legacy(self):
+        """把旧的单文件数据拆分为分区（只在分区目录尚无清单时执行一次），原文件改名保留"""
+        legacy = self.data_dir / self.legacy_filename if self.legacy_filename else None
+        if legacy is None or not legacy.exists() or self.manifest_path.exists():
+            return
+        self.filepath.mkdir(exist_ok=True)
+        with file_lock(self.lock_path):
+            if self.manifest_path.exists() or not legacy.exists():
+                return
+            try:
+                with open(legacy, 'r', encoding='utf-8') as f:
+                    records = json.load(f)
+                partitions: Dict[str, list] = {}
+                for record in records:
+                    item = self.model_class.from_dict(record)
+                    partitions.setdefault(self._partition_key(item), []).append(record)
+            except (json.JSONDecodeError, IOError, KeyError, TypeError, ValueError) as e:
+                print(f"加载数据失败 {legacy}: {e}")
+                return
+            for key, partition in partitions.items():
+                write_json_atomic(self._partition_path(key), partition)
+            write_json_atomic(self.manifest_path, {key: 1 for key in sorted(partitions)})
+            os.replace(legacy, legacy.with_name(legacy.name + '.migrated'))
+    
+    def _track_stored(self, key: str, entity_ids: Iterable[UUID]):
+        """记录磁盘上分区 key 现有的实体"""
+        for entity_id in self._stored.pop(key, ()):
+            if self._stored_in.get(entity_id) == key:
+                del self._stored_in[entity_id]
+        ids = set(entity_ids)
+        if ids:
+            self._stored[key] = ids
+            for entity_id in ids:
+                self._stored_in[entity_id] = key
+    
+    def _load(self):
+        """并行加载全部分区"""
+        _disk_writer.flush(self.filepath)
+        self._migrate_legacy()
+        self._signature = self._disk_signature()
+        manifest = self._read_manifest()
+        # 以目录中实际存在的分区为准，清单只提供写入序号
+        keys = sorted(path.stem for path in self.filepath.glob('????-??-??.json'))
+        self._data = {}
+        self._stored, self._stored_in = {}, {}
+        
+        def load(key):
+            path = self._partition_path(key)
+            try:
+                return self._load_entities(path)
+            except FileNotFoundError:
+                return []
+            except (json.JSONDecodeError, IOError, KeyError, TypeError, ValueError) as e:
+                print(f"加载数据失败 {path}: {e}")
+                return []
+        
+        with gc_paused():
+            if len(keys) > 1:
+                with ThreadPoolExecutor(max_workers=min(self.LOAD_WORKERS, len(keys))) as pool:
+                    loaded = list(pool.map(load, keys))
+            else:
+                loaded = [load(key) for key in keys]
+            for key, items in zip(keys, loaded):
+                for item in items:
+                    self._data[self._get_id(item)] = item
+                self._track_stored(key, (self._get_id(item) for item in items))
+        self._partition_seqs = {key: manifest.get(key, 0) for key in keys}
+        self._revision += 1
+        for entity_id in self._data:
+            self._log_change(entity_id)
+        self._rebuild_indexes()
+    
+    def _sync_from_disk(self):
+        """只合并写入序号变化的分区（调用方需持有写锁）"""
+        signature = self._disk_signature()
+        if signature == self._signature:
+            return
+        manifest = self._read_manifest()
+        keys = [key for key, seq in manifest.items() if self._partition_seqs.get(key) != seq]
+        keys += [key for key in self._partition_seqs if key not in manifest]
+        partitions = self._read_partitions(keys)
+        if any(records is None for records in partitions.values()):
+            return
+        scope = set()
+        for key in keys:
+            scope |= self._stored.get(key, set())
+        self._merge_partitions([record for records in partitions.values() for record in records], scope)
+        for key, records in partitions.items():
+            self._track_stored(key, (UUID(str(record[self._id_field])) for record in records))
+            if key in manifest:
+                self._partition_seqs[key] = manifest[key]
+            else:
+                self._partition_seqs.pop(key, None)
+        self._signature = signature
+    
+    def _merge_partitions(self, records: list, scope: set):
+        """
+        合并重新读取的分区：scope 为这些分区原有的实体ID，不在其中的实体保持不变；
+        规则与 _merge 相同，但只处理变化的实体并逐条维护派生索引
+        """
+        local = self._data
+        updates: Dict[UUID, Optional[T]] = {}
+        seen = set()
+        for record in records:
+            try:
+                entity_id = UUID(str(record[self._id_field]))
+                seen.add(entity_id)
+                if self._lost_race(entity_id, record):
+                    updates[entity_id] = self.model_class.from_dict(record)
+                    continue
+                if entity_id in self._deleted:
+                    continue
+                current = local.get(entity_id)
+                if current is not None and (entity_id in self._dirty
+                                            or current.version == record.get('version', 0)):
+                    continue
+                updates[entity_id] = self.model_class.from_dict(record)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"加载数据失败 {self.filepath}: {e}")
+        # 分区中已不存在的实体：其他进程删除了它（基于删除前版本的本地修改随之放弃）
+        for entity_id in scope - seen:
+            if entity_id in local and (entity_id not in self._dirty
+                                       or self._lost_race(entity_id, None)):
+                updates[entity_id] = None
+        for entity_id, item in updates.items():
+            existing = local.pop(entity_id, None)
+            if existing is not None:
+                self._unindex_item(existing)
+            if item is not None:
+                local[entity_id] = item
+                self._index_item(item)
+            self._log_change(entity_id)
+        if updates:
+            self._revision += 1
+    
+    def _rebuild_indexes(self):
+        self._members = {}
+        self._member_of = {}
+        for entity_id, item in self._data.items():
+            key = self._member_of[entity_id] = self._partition_key(item)
+            self._members.setdefault(key, {})[entity_id] = None
+        self._partition_keys = sorted(self._members)
+    
+    def _index_item(self, item: T):
+        entity_id = self._get_id(item)
+        key = self._member_of[entity_id] = self._partition_key(item)
+        members = self._members.get(key)
+        if members is None:
+            members = self._members[key] = {}
+            bisect.insort(self._partition_keys, key)
+        members[entity_id] = None
+    
+    def _unindex_item(self, item: T):
+        key = self._member_of.pop(self._get_id(item), None)
+        members = self._members.get(key)
+        if members is None:
+            return
+        members.pop(self._get_id(item), None)
+        if not members:
+            del self._members[key]
+            del self._partition_keys[bisect.bisect_left(self._partition_keys, key)]
+    
+    def write_to_disk(self):
+        """
+        在跨进程文件锁内合并其他进程的修改，只重写有变更的分区（含实体迁出的旧分区），
+        最后更新清单。清单替换前崩溃时分区数据已是新的，下次加载以目录中的分区为准
+        """
+        self.filepath.mkdir(exist_ok=True)
+        with file_lock(self.lock_path):
+            with self._lock.write_locked():
+                self._sync_from_disk()
+                touched = self._dirty.keys() | self._deleted.keys()
+                affected = {self._stored_in[entity_id] for entity_id in touched
+                            if entity_id in self._stored_in}
+                affected |= {self._partition_key(self._data[entity_id]) for entity_id in self._dirty
+                             if entity_id in self._data}
+                snapshots = {}
+                for key in affected:
+                    items = [self._data[entity_id] for entity_id in self._members.get(key, ())]
+                    snapshots[key] = (items, [item.to_dict() for item in items])
+                self._dirty.clear()
+                self._deleted.clear()
+            manifest = self._read_manifest()
+            for key, (_, snapshot) in sorted(snapshots.items()):
+                if snapshot:
+                    write_json_atomic(self._partition_path(key), snapshot)
+                    manifest[key] = manifest.get(key, 0) + 1
+                else:
+                    self._partition_path(key).unlink(missing_ok=True)
+                    snapshot_cache.discard(self._partition_path(key))
+                    manifest.pop(key, None)
+            write_json_atomic(self.manifest_path, dict(sorted(manifest.items())))
+            with self._lock.write_locked():
+                for key, (items, _) in snapshots.items():
+                    self._track_stored(key, (self._get_id(item) for item in items))
+                    if key in manifest:
+                        self._partition_seqs[key] = manifest[key]
+                    else:
+                        self._partition_seqs.pop(key, None)
+                self._signature = self._disk_signature()
+    
+    def partitions(self, start: date = None, end: date = None) -> List[str]:
+        """[start, end) 范围内有数据的分区键（调用方需持有读锁）"""
+        lo = bisect.bisect_left(self._partition_keys, start.isoformat()) if start else 0
+        hi = bisect.bisect_left(self._partition_keys, end.isoformat()) if end else len(self._partition_keys)
+        return self._partition_keys[lo:hi]
+    
+    def find_by_time_range(self, start: datetime = None, end: datetime = None) -> List[T]:
+        """创建时间在 [start, end) 内的实体；只遍历范围内的分区"""
+        # end 当天的分区可能有部分实体在范围内
+        last = end.date() + timedelta(days=1) if end else None
+        with self._reading():
+            result = []
+            for key in self.partitions(start.date() if start else None, last):
+                for entity_id in self._members[key]:
+                    item = self._data[entity_id]
+                    moment = getattr(item, self.PARTITION_FIELD)
+                    if (start is None or moment >= start) and (end is None or moment < end):
+                        result.append(item)
+            return result
+
 class UserRepository(Repository[User]):
     """用户仓储"""
     
@@ -119,10 +983,11 @@ class UserRepository(Repository[User]):
     
     def find_by_phone(self, phone: str) -> Optional[User]:
         """根据手机号查找用户"""
-        for user in self._data:
-            if user.phone == phone:
-                return user
-        return None
+        with self._reading():
+            for user in self._data.values():
+                if user.phone == phone:
+                    return user
+            return None
 
 
 class MenuRepository(Repository[Menu]):
@@ -133,40 +998,169 @@ class MenuRepository(Repository[Menu]):
     
     def find_active(self) -> Optional[Menu]:
         """查找激活的菜单"""
-        for menu in self._data:
-            if menu.is_active:
-                return menu
-        return None
+        with self._reading():
+            for menu in self._data.values():
+                if menu.is_active:
+                    return menu
+            return None
 
 
 class MenuItemRepository(Repository[MenuItem]):
-    """菜单项仓储"""
+    """菜单项仓储，随增删改增量维护全文检索索引"""
     
     def __init__(self):
+        self.search_index = MenuSearchIndex()
         super().__init__('menu_items.json', MenuItem)
     
+    def _rebuild_indexes(self):
+        self.search_index.rebuild(self._data.values())
+    
+    def _index_item(self, item: MenuItem):
+        self.search_index.add(item)
+    
+    def _unindex_item(self, item: MenuItem):
+        self.search_index.remove(item.item_id)
+    
     def find_available(self) -> List[MenuItem]:
         """查找可用的菜单项（未售罄）"""
-        return [item for item in self._data if not item.is_sold_out]
+        with self._reading():
+            return [item for item in self._data.values() if not item.is_sold_out]
+    
+    def search(self, query: str = "", category: str = None,
+               include_sold_out: bool = False, limit: int = None) -> List[MenuItem]:
+        """按名称/描述/分类（含拼音首字母）检索菜单项"""
+        with self._reading():
+            return self.search_index.search(query, category, include_sold_out, limit)
+    
+    def facet_counts(self, query: str = "", include_sold_out: bool = False) -> Dict[str, int]:
+        """检索结果的分类计数"""
+        with self._reading():
+            return self.search_index.facet_counts(query, include_sold_out)
+    
+    def categories(self) -> List[str]:
+        """全部分类"""
+        with self._reading():
+            return self.search_index.categories()
 
 
-class OrderRepository(Repository[Order]):
-    """订单仓储"""
+class OrderRepository(PartitionedRepository[Order]):
+    """
+    订单仓储
+    按下单日期分区存储在 data/orders/；新订单保存时分配按天递增的取餐码；
+    维护取餐码索引和订单ID前缀有序索引
+    """
+    
+    # 保留最近若干天的取餐码计数
+    PICKUP_COUNTER_DAYS = 7
     
     def __init__(self):
-        super().__init__('orders.json', Order)
+        # (日期, 取餐码) -> 订单ID
+        self._pickup_codes: Dict[tuple, UUID] = {}
+        # 日期 -> 当天已分配的最大序号
+        self._max_seq: Dict[date, int] = {}
+        # 订单ID十六进制串（无连字符）的有序数组，用于前缀二分查找
+        self._id_prefixes: List[str] = []
+        super().__init__('orders', Order, legacy_filename='orders.json')
+        self.counter_path = self.data_dir / 'pickup_codes.json'
+        self.counter_lock_path = self.data_dir / 'pickup_codes.json.lock'
+    
+    def _rebuild_indexes(self):
+        super()._rebuild_indexes()
+        self._pickup_codes = {}
+        self._max_seq = {}
+        for order in self._data.values():
+            self._index_code(order)
+        self._id_prefixes = sorted(order_id.hex for order_id in self._data)
+    
+    def _index_item(self, item: Order):
+        super()._index_item(item)
+        self._index_code(item)
+        key = item.order_id.hex
+        pos = bisect.bisect_left(self._id_prefixes, key)
+        if pos == len(self._id_prefixes) or self._id_prefixes[pos] != key:
+            self._id_prefixes.insert(pos, key)
+    
+    def _unindex_item(self, item: Order):
+        super()._unindex_item(item)
+        if item.pickup_code:
+            self._pickup_codes.pop((item.created_at.date(), item.pickup_code), None)
+        key = item.order_id.hex
+        pos = bisect.bisect_left(self._id_prefixes, key)
+        if pos < len(self._id_prefixes) and self._id_prefixes[pos] == key:
+            del self._id_prefixes[pos]
+    
+    def _index_code(self, order: Order):
+        """登记订单的取餐码"""
+        if not order.pickup_code:
+            return
+        day = order.created_at.date()
+        self._pickup_codes[(day, order.pickup_code)] = order.order_id
+        if order.pickup_code.isdigit():
+            self._max_seq[day] = max(self._max_seq.get(day, 0), int(order.pickup_code))
+    
+    def _next_pickup_code(self, day: date) -> str:
+        """
+        分配当天的下一个取餐码
+        计数文件在跨进程文件锁内读-增-写，多个进程同时下单也不会重复
+        """
+        with file_lock(self.counter_lock_path):
+            counters = {}
+            if self.counter_path.exists():
+                try:
+                    with open(self.counter_path, 'r', encoding='utf-8') as f:
+                        counters = json.load(f)
+                except (json.JSONDecodeError, IOError) as e:
+                    print(f"加载数据失败 {self.counter_path}: {e}")
+            with self._lock.read_locked():
+                known = self._max_seq.get(day, 0)
+            seq = max(counters.get(day.isoformat(), 0), known) + 1
+            counters[day.isoformat()] = seq
+            oldest = (max(date.today(), day) - timedelta(days=self.PICKUP_COUNTER_DAYS)).isoformat()
+            counters = {k: v for k, v in counters.items() if k >= oldest}
+            write_json_atomic(self.counter_path, counters)
+        return f"{seq:03d}"
+    
+    def save(self, item: Order, expected_version: int = None) -> Order:
+        """保存订单；新订单先分配取餐码"""
+        if not item.pickup_code:
+            item.pickup_code = self._next_pickup_code(item.created_at.date())
+        return super().save(item, expected_version)
+    
+    def find_by_pickup_code(self, code: str, day: date = None) -> Optional[Order]:
+        """按取餐码查找订单（默认当天），O(1)"""
+        day = day or date.today()
+        with self._reading():
+            order_id = self._pickup_codes.get((day, code.strip()))
+            return self._data.get(order_id) if order_id else None
+    
+    def find_by_id_prefix(self, prefix: str, limit: int = 10) -> List[Order]:
+        """按订单ID前缀查找（如界面显示的前8位），O(log n + k)"""
+        key = prefix.strip().lower().replace('-', '')
+        if not key:
+            return []
+        with self._reading():
+            pos = bisect.bisect_left(self._id_prefixes, key)
+            result = []
+            while (pos < len(self._id_prefixes) and len(result) < limit
+                   and self._id_prefixes[pos].startswith(key)):
+                result.append(self._data[UUID(hex=self._id_prefixes[pos])])
+                pos += 1
+            return result
     
     def find_by_user(self, user_id: UUID) -> List[Order]:
         """查找用户的所有订单"""
-        return [order for order in self._data if order.user_id == user_id]
+        with self._reading():
+            return [order for order in self._data.values() if order.user_id == user_id]
     
     def find_by_status(self, status) -> List[Order]:
         """根据状态查找订单"""
-        return [order for order in self._data if order.status == status]
+        with self._reading():
+            return [order for order in self._data.values() if order.status == status]
     
     def find_all_sorted_by_time(self) -> List[Order]:
         """查找所有订单并按时间排序"""
-        return sorted(self._data, key=lambda x: x.created_at, reverse=True)
+        with self._reading():
+            return sorted(self._data.values(), key=lambda x: x.created_at, reverse=True)
 
 
 class CartRepository(Repository[Cart]):
@@ -177,10 +1171,11 @@ class CartRepository(Repository[Cart]):
     
     def find_by_user(self, user_id: UUID) -> Optional[Cart]:
         """查找用户的购物车"""
-        for cart in self._data:
-            if cart.user_id == user_id:
-                return cart
-        return None
+        with self._reading():
+            for cart in self._data.values():
+                if cart.user_id == user_id:
+                    return cart
+            return None
 
 
 class ReviewRepository(Repository[Review]):
@@ -191,44 +1186,255 @@ class ReviewRepository(Repository[Review]):
     
     def find_by_user(self, user_id: UUID) -> List[Review]:
         """查找用户的所有评价"""
-        return [review for review in self._data if review.user_id == user_id]
+        with self._reading():
+            return [review for review in self._data.values() if review.user_id == user_id]
     
     def find_by_order(self, order_id: UUID) -> List[Review]:
         """查找订单的所有评价"""
-        return [review for review in self._data if review.order_id == order_id]
+        with self._reading():
+            return [review for review in self._data.values() if review.order_id == order_id]
     
     def find_all_sorted(self) -> List[Review]:
         """查找所有评价并按时间排序"""
-        return sorted(self._data, key=lambda x: x.created_at, reverse=True)
+        with self._reading():
+            return sorted(self._data.values(), key=lambda x: x.created_at, reverse=True)
 
 
 class FavoriteRepository(Repository[Favorite]):
-    """收藏仓储"""
+    """收藏仓储，按用户索引收藏"""
     
     def __init__(self):
+        # 用户ID -> {收藏ID: 收藏}，按收藏顺序
+        self._by_user: Dict[UUID, Dict[UUID, Favorite]] = {}
         super().__init__('favorites.json', Favorite)
     
+    def _rebuild_indexes(self):
+        self._by_user = {}
+        for fav in self._data.values():
+            self._index_item(fav)
+    
+    def _index_item(self, item: Favorite):
+        self._by_user.setdefault(item.user_id, {})[item.favorite_id] = item
+    
+    def _unindex_item(self, item: Favorite):
+        favorites = self._by_user.get(item.user_id)
+        if favorites is not None:
+            favorites.pop(item.favorite_id, None)
+            if not favorites:
+                del self._by_user[item.user_id]
+    
     def find_by_user(self, user_id: UUID) -> List[Favorite]:
         """查找用户的所有收藏"""
-        return [fav for fav in self._data if fav.user_id == user_id]
+        with self._reading():
+            return list(self._by_user.get(user_id, {}).values())
     
     def find_by_user_and_item(self, user_id: UUID, item_id: UUID) -> Optional[Favorite]:
         """查找用户对特定商品的收藏"""
-        for fav in self._data:
-            if fav.user_id == user_id and fav.item_id == item_id:
-                return fav
-        return None
+        with self._reading():
+            for fav in self._by_user.get(user_id, {}).values():
+                if fav.item_id == item_id:
+                    return fav
+            return None
+
+
+def _accumulate(target: dict, delta: dict, sign: int = 1):
+    """把 delta 中的计数按 sign 累加到 target（嵌套字典逐层累加，字符串以新值覆盖）"""
+    for key, value in delta.items():
+        if isinstance(value, dict):
+            _accumulate(target.setdefault(key, {}), value, sign)
+        elif isinstance(value, str):
+            target[key] = value
+        else:
+            target[key] = target.get(key, 0) + sign * value
+
+
+class SalesRollupStore:
+    """
+    销售汇总（物化视图）
+    按天记录订单数、金额（分）和取消数，并细分到小时和商品；由 OrderService 在下单和
+    状态变化时增量更新。本进程的增量先记入内存，写盘线程在跨进程文件锁内读取文件、
+    累加增量后原子替换，多个进程同时记账也不会互相覆盖
+    """
+    
+    def __init__(self, filename: str = 'sales_rollups.json'):
+        self.data_dir = Path(__file__).parent / 'data'
+        self.data_dir.mkdir(exist_ok=True)
+        self.filepath = self.data_dir / filename
+        self.lock_path = self.data_dir / (filename + '.lock')
+        self._lock = threading.Lock()
+        # 日期(ISO) -> 当天汇总：磁盘数据加上本进程尚未写盘的增量
+        self._days: Dict[str, dict] = {}
+        self._pending: Dict[str, dict] = {}
+        self._signature: Optional[tuple] = None
+        self._refresh()
+    
+    def _read_file(self) -> Dict[str, dict]:
+        """读取汇总文件"""
+        if not self.filepath.exists():
+            return {}
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"加载数据失败 {self.filepath}: {e}")
+            return {}
+    
+    def _refresh(self):
+        """文件被其他进程更新后重新读取，并叠加本进程未写盘的增量"""
+        signature = file_signature(self.filepath)
+        if signature == self._signature:
+            return
+        days = self._read_file()
+        with self._lock:
+            _accumulate(days, self._pending)
+            self._days = days
+            self._signature = signature
+    
+    def exists(self) -> bool:
+        """汇总文件是否已建立"""
+        return self.filepath.exists() or bool(self._pending)
+    
+    @staticmethod
+    def _add_order(days: Dict[str, dict], order: Order, cancelled: bool, sign: int = 1):
+        """把一个订单的贡献按 sign 直接累加到 days；cancelled 为 True 时记为取消"""
+        prefix = 'cancelled_' if cancelled else ''
+        count_key, revenue_key = ('cancelled' if cancelled else 'orders'), prefix + 'revenue'
+        quantity_key = prefix + 'quantity'
+        total = to_cents(order.total_amount()) * sign
+        day = days.setdefault(order.created_at.date().isoformat(), {})
+        hour = day.setdefault('hours', {}).setdefault(str(order.created_at.hour), {})
+        for counters in (day, hour):
+            counters[count_key] = counters.get(count_key, 0) + sign
+            counters[revenue_key] = counters.get(revenue_key, 0) + total
+        items = day.setdefault('items', {})
+        for line in order.items:
+            menu_item = line.menu_item
+            if menu_item is None:
+                continue
+            entry = items.setdefault(str(menu_item.item_id), {})
+            entry['name'] = menu_item.name
+            entry[quantity_key] = entry.get(quantity_key, 0) + sign * line.quantity
+            entry[revenue_key] = entry.get(revenue_key, 0) + sign * line.subtotal_cents()
+    
+    @classmethod
+    def _add_history(cls, days: Dict[str, dict], order: Order, sign: int = 1):
+        """按订单当前状态的完整贡献累加：下单计数，已取消的同时计入取消"""
+        cls._add_order(days, order, False, sign)
+        if order.status == OrderStatus.CANCELLED:
+            cls._add_order(days, order, True, sign)
+    
+    def apply(self, delta: Dict[str, dict], sign: int = 1):
+        """记入增量并交给写盘线程"""
+        with self._lock:
+            _accumulate(self._days, delta, sign)
+            _accumulate(self._pending, delta, sign)
+        _disk_writer.submit(self)
+    
+    def record_order(self, order: Order):
+        """新订单计入汇总"""
+        delta: Dict[str, dict] = {}
+        self._add_order(delta, order, cancelled=False)
+        self.apply(delta)
+    
+    def record_cancellation(self, order: Order, cancelled: bool = True):
+        """订单取消（cancelled=False 表示撤销取消）"""
+        delta: Dict[str, dict] = {}
+        self._add_order(delta, order, cancelled=True, sign=1 if cancelled else -1)
+        self.apply(delta)
+    
+    @classmethod
+    def history_delta(cls, orders: List[Order], replaced: List[Optional[Order]] = None,
+                      delta: Dict[str, dict] = None) -> Dict[str, dict]:
+        """
+        批量导入的历史订单对汇总的增量（累加到 delta）；replaced 为被覆盖的旧订单
+        （与 orders 一一对应，新增的为 None），其原有贡献被撤销。
+        多批导入时先累加各批增量，最后一次 apply()，避免每批都合并全部日期
+        """
+        delta = {} if delta is None else delta
+        for order in orders:
+            cls._add_history(delta, order)
+        for old in replaced or ():
+            if old is not None:
+                cls._add_history(delta, old, -1)
+        return delta
+    
+    def rebuild(self, orders: Iterable[Order]):
+        """由订单历史全量重建（汇总文件缺失时的一次性回填）"""
+        days: Dict[str, dict] = {}
+        for order in orders:
+            self._add_history(days, order)
+        with file_lock(self.lock_path):
+            if self.filepath.exists():
+                return
+            write_json_atomic(self.filepath, days)
+        self._signature = None
+        self._refresh()
+    
+    def write_to_disk(self):
+        """在跨进程文件锁内把本进程的增量累加到文件（由写盘线程调用）"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        with file_lock(self.lock_path):
+            days = self._read_file()
+            _accumulate(days, pending)
+            try:
+                write_json_atomic(self.filepath, days)
+            except OSError:
+                with self._lock:
+                    _accumulate(self._pending, pending)
+                raise
+            with self._lock:
+                _accumulate(days, self._pending)
+                self._days = days
+                self._signature = file_signature(self.filepath)
+    
+    def flush(self):
+        """等待汇总落盘"""
+        _disk_writer.flush(self.filepath)
+    
+    def days(self, start: date = None, end: date = None) -> List[Tuple[date, dict]]:
+        """[start, end] 范围内各天的汇总，按日期排序；只遍历天数"""
+        self._refresh()
+        low = start.isoformat() if start else ''
+        high = end.isoformat() if end else '9999'
+        with self._lock:
+            keys = sorted(day for day in self._days if low <= day <= high)
+            return [(date.fromisoformat(day), json.loads(json.dumps(self._days[day])))
+                    for day in keys]
 
 
 class PromotionRepository(Repository[Promotion]):
-    """促销仓储"""
+    """促销仓储，随增删改增量维护按起止时间排序的时间轴"""
     
     def __init__(self):
+        self.timeline = PromotionTimeline()
         super().__init__('promotions.json', Promotion)
     
-    def find_active(self) -> List[Promotion]:
-        """查找所有有效的促销"""
-        return [promo for promo in self._data if promo.is_valid()]
+    def _rebuild_indexes(self):
+        self.timeline.rebuild(self._data.values())
+    
+    def _index_item(self, item: Promotion):
+        self.timeline.add(item)
+    
+    def _unindex_item(self, item: Promotion):
+        self.timeline.remove(item.promotion_id)
+    
+    def find_active(self, at: datetime = None) -> List[Promotion]:
+        """查找指定时刻（默认当前）有效的促销"""
+        with self._reading():
+            return self.timeline.active_at(at or datetime.now())
+    
+    def find_transitions(self, since: datetime, until: datetime) -> Tuple[List[Promotion], List[UUID]]:
+        """时间从 since 推进到 until 期间新生效的促销和已失效的促销ID"""
+        with self._reading():
+            return self.timeline.transitions(since, until)
+    
+    def next_transition(self, after: datetime) -> Optional[datetime]:
+        """after 之后下一次有促销生效或失效的时刻"""
+        with self._reading():
+            return self.timeline.next_boundary(after)
 
 
 class ToppingRepository(Repository[Topping]):
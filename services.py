@@ -3,28 +3,119 @@
 实现业务逻辑和操作
 """
 
-from datetime import datetime
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import replace
+from itertools import chain
+from datetime import date, datetime, timedelta
 from decimal import Decimal
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 from uuid import UUID
 
 from models import (
-    User, Menu, MenuItem, Order, OrderItem, Cart, Review,
-    Favorite, Promotion, Topping, OrderStatus, Sweetness
+    User, Menu, MenuItem, MenuCatalog, Order, OrderItem, Cart, Review,
+    Favorite, FavoriteItem, Promotion, PromotionRule, Topping, OrderStatus, Sweetness
 )
 from repositories import (
     UserRepository, MenuRepository, MenuItemRepository,
-    OrderRepository, CartRepository, ReviewRepository,
-    FavoriteRepository, PromotionRepository, ToppingRepository
+    OrderRepository, ReviewRepository,
+    FavoriteRepository, PromotionRepository, ToppingRepository,
+    SalesRollupStore, VersionConflictError
 )
+from archive import OrderArchive, archive_orders
+from cart_store import SessionCartStore, session_carts
+from money import from_cents, quantize
+from pricing import PriceQuote, PricingEngine
+from promotion_schedule import PromotionScheduler
+
+
+class KeyedLock:
+    """
+    按键分配的可重入锁
+    用于保护“查询-修改-保存”这类复合操作，不同用户之间互不阻塞。
+    锁按引用计数保存，最后一个持有者释放后即移除，长期运行时不会为见过的每个键都保留一把锁
+    """
+    
+    def __init__(self):
+        self._guard = threading.Lock()
+        # key -> [锁, 持有或等待该锁的次数]
+        self._locks: Dict[object, list] = {}
+    
+    def __len__(self) -> int:
+        """当前有持有者或等待者的键数"""
+        return len(self._locks)
+    
+    @contextmanager
+    def __call__(self, key):
+        """在 with 块内持有 key 对应的锁"""
+        with self._guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.RLock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+
+class IdempotencyIndex:
+    """
+    幂等键索引
+    记录最近的请求键到结果ID的映射，容量有界，超过 TTL 的键自动淘汰；
+    所有键的 TTL 相同，插入顺序即过期顺序，淘汰只需从队头弹出
+    """
+    
+    def __init__(self, ttl_seconds: float = 600, max_size: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key) -> Optional[UUID]:
+        """查找键对应的结果ID，不存在或已过期时返回 None"""
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            entry = self._entries.get(key)
+            return entry[0] if entry else None
+    
+    def put(self, key, value: UUID):
+        """登记键与结果ID"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            self._entries.pop(key, None)
+            self._entries[key] = (value, now + self.ttl_seconds)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def __len__(self) -> int:
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            return len(self._entries)
+    
+    def _evict_expired(self, now: float):
+        """从队头淘汰已过期的键（调用方需持有锁）"""
+        while self._entries:
+            _, (_, expires_at) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
 
 
 class AuthService:
     """用户认证服务"""
     
-    def __init__(self):
-        self.user_repo = UserRepository()
+    def __init__(self, user_repo: UserRepository = None):
+        self.user_repo = user_repo or UserRepository()
         self.current_user: Optional[User] = None
+        self._register_lock = threading.Lock()
     
     def register(self, nickname: str, phone: str) -> Tuple[bool, str, Optional[User]]:
         """
@@ -37,14 +128,15 @@ class AuthService:
         if not phone.isdigit() or len(phone) < 7:
             return False, "手机号格式不正确", None
 
-        # 检查手机号是否已注册
-        existing = self.user_repo.find_by_phone(phone)
-        if existing:
-            return False, "该手机号已注册", None
-        
-        # 创建新用户
-        user = User(nickname=nickname, phone=phone)
-        self.user_repo.save(user)
+        with self._register_lock:
+            # 检查手机号是否已注册
+            existing = self.user_repo.find_by_phone(phone)
+            if existing:
+                return False, "该手机号已注册", None
+            
+            # 创建新用户
+            user = User(nickname=nickname, phone=phone)
+            self.user_repo.save(user)
         return True, "注册成功", user
     
     def login(self, phone: str) -> Tuple[bool, str, Optional[User]]:
@@ -71,26 +163,71 @@ class AuthService:
 class MenuService:
     """菜单管理服务"""
     
-    def __init__(self):
-        self.menu_repo = MenuRepository()
-        self.item_repo = MenuItemRepository()
-        self.topping_repo = ToppingRepository()
-    
-    def list_items(self) -> List[MenuItem]:
-        """列出所有可用菜单项"""
-        return self.item_repo.find_available()
-    
-    def list_all_items(self) -> List[MenuItem]:
-        """列出所有菜单项（包括售罄的）"""
-        return self.item_repo.find_all()
+    def __init__(self, menu_repo: MenuRepository = None,
+                 item_repo: MenuItemRepository = None,
+                 topping_repo: ToppingRepository = None):
+        self.menu_repo = menu_repo or MenuRepository()
+        self.item_repo = item_repo or MenuItemRepository()
+        self.topping_repo = topping_repo or ToppingRepository()
+        self._catalog = MenuCatalog(version=-1)
+        self._catalog_key = None
+        self._catalog_lock = threading.Lock()
+    
+    def catalog(self) -> MenuCatalog:
+        """
+        当前菜单目录快照
+        仅当菜单项或小料的修订号变化时重建，否则直接返回缓存的同一快照
+        """
+        key = (self.item_repo.revision(), self.topping_repo.revision())
+        catalog = self._catalog
+        if key == self._catalog_key:
+            return catalog
+        with self._catalog_lock:
+            if key != self._catalog_key:
+                self._catalog = MenuCatalog.build(
+                    self._catalog.version + 1,
+                    self.item_repo.find_all(),
+                    self.topping_repo.find_all()
+                )
+                self._catalog_key = key
+            return self._catalog
+    
+    def list_items(self) -> Sequence[MenuItem]:
+        """列出所有可用菜单项（只读快照）"""
+        return self.catalog().available
+    
+    def list_all_items(self) -> Sequence[MenuItem]:
+        """列出所有菜单项（包括售罄的，只读快照）"""
+        return self.catalog().all_items
+    
+    def list_items_by_category(self, category: str) -> Sequence[MenuItem]:
+        """列出某分类下的可用菜单项（只读快照）"""
+        return self.catalog().by_category.get(category, ())
     
     def get_item(self, item_id: UUID) -> Optional[MenuItem]:
         """获取菜单项"""
         return self.item_repo.find_by_id(item_id)
     
+    def search_items(self, query: str = "", category: str = None,
+                     include_sold_out: bool = False, limit: int = None) -> List[MenuItem]:
+        """
+        检索菜单项
+        支持中文关键字、拼音首字母（如 zznc）和英文前缀，可按分类过滤
+        """
+        return self.item_repo.search(query, category, include_sold_out, limit)
+    
+    def category_facets(self, query: str = "", include_sold_out: bool = False) -> Dict[str, int]:
+        """检索结果按分类计数"""
+        return self.item_repo.facet_counts(query, include_sold_out)
+    
+    def list_categories(self) -> List[str]:
+        """列出全部分类"""
+        return self.item_repo.categories()
+    
     def create_item(self, name: str, price: Decimal, category: str = "",
                    allow_toppings: bool = True, description: str = "") -> MenuItem:
-        """创建菜单项"""
+        """创建菜单项，价格在入库前规整到分"""
+        price = quantize(price)
         if price < 0:
             raise ValueError("价格不能为负数")
             
@@ -105,16 +242,23 @@ class MenuService:
     
     def update_item(self, item_id: UUID, name: str = None, price: Decimal = None,
                    category: str = None, allow_toppings: bool = None, 
-                   description: str = None) -> Optional[MenuItem]:
-        """更新菜单项"""
-        item = self.item_repo.find_by_id(item_id)
-        if not item:
+                   description: str = None,
+                   expected_version: int = None) -> Optional[MenuItem]:
+        """
+        更新菜单项
+        expected_version 为编辑开始时读到的版本号；期间被其他终端修改过时
+        抛出 VersionConflictError
+        """
+        current = self.item_repo.find_by_id(item_id)
+        if not current:
             return None
         
+        # 在副本上修改，冲突时不会污染仓储中的数据
+        item = replace(current)
         if name is not None:
             item.name = name
         if price is not None:
-            item.price = price
+            item.price = quantize(price)
         if category is not None:
             item.category = category
         if allow_toppings is not None:
@@ -122,33 +266,35 @@ class MenuService:
         if description is not None:
             item.description = description
         
-        return self.item_repo.save(item)
+        if expected_version is None:
+            expected_version = current.version
+        return self.item_repo.save(item, expected_version)
     
     def mark_sold_out(self, item_id: UUID, is_sold_out: bool = True) -> bool:
         """标记菜单项售罄状态"""
-        item = self.item_repo.find_by_id(item_id)
-        if not item:
+        current = self.item_repo.find_by_id(item_id)
+        if not current:
             return False
         
-        item.is_sold_out = is_sold_out
-        self.item_repo.save(item)
+        # 写时复制，已发布的目录快照中的对象保持不变
+        self.item_repo.save(replace(current, is_sold_out=is_sold_out), current.version)
         return True
     
     def delete_item(self, item_id: UUID) -> bool:
         """删除菜单项"""
         return self.item_repo.delete(item_id)
     
-    def list_toppings(self) -> List[Topping]:
-        """列出所有小料"""
-        return self.topping_repo.find_all()
+    def list_toppings(self) -> Sequence[Topping]:
+        """列出所有小料（只读快照）"""
+        return self.catalog().toppings
     
     def get_topping(self, topping_id: UUID) -> Optional[Topping]:
         """获取小料"""
         return self.topping_repo.find_by_id(topping_id)
     
     def create_topping(self, name: str, extra_price: Decimal) -> Topping:
-        """创建小料"""
-        topping = Topping(name=name, extra_price=extra_price)
+        """创建小料，加价在入库前规整到分"""
+        topping = Topping(name=name, extra_price=quantize(extra_price))
         return self.topping_repo.save(topping)
     
     def delete_topping(self, topping_id: UUID) -> bool:
@@ -159,18 +305,22 @@ class MenuService:
 class CartService:
     """购物车服务"""
     
-    def __init__(self):
-        self.cart_repo = CartRepository()
-        self.item_repo = MenuItemRepository()
-        self.topping_repo = ToppingRepository()
+    def __init__(self, cart_store: SessionCartStore = None,
+                 item_repo: MenuItemRepository = None,
+                 topping_repo: ToppingRepository = None):
+        """cart_store: 会话购物车存储，默认使用进程内共享的 session_carts"""
+        self.cart_store = session_carts if cart_store is None else cart_store
+        self.item_repo = item_repo or MenuItemRepository()
+        self.topping_repo = topping_repo or ToppingRepository()
+        self.user_lock = KeyedLock()
     
     def get_or_create_cart(self, user_id: UUID) -> Cart:
         """获取或创建购物车"""
-        cart = self.cart_repo.find_by_user(user_id)
-        if not cart:
-            cart = Cart(user_id=user_id)
-            self.cart_repo.save(cart)
-        return cart
+        with self.user_lock(user_id):
+            cart = self.cart_store.find_by_user(user_id)
+            if not cart:
+                cart = self.cart_store.save(Cart(user_id=user_id))
+            return cart
     
     def add_to_cart(self, user_id: UUID, item_id: UUID, quantity: int = 1,
                    sweetness: Sweetness = Sweetness.FIVE,
@@ -188,82 +338,119 @@ class CartService:
         if menu_item.is_sold_out:
             return False, "商品已售罄"
         
-        # 获取小料
+        # 获取小料（一次批量查出，保持选择顺序）
         toppings = []
         if topping_ids:
-            for tid in topping_ids:
-                topping = self.topping_repo.find_by_id(tid)
-                if topping:
-                    toppings.append(topping)
+            found = self.topping_repo.get_many(topping_ids)
+            toppings = [found[tid] for tid in topping_ids if tid in found]
         
         # 添加到购物车
-        cart = self.get_or_create_cart(user_id)
-        cart.add_item(menu_item, quantity, sweetness, toppings, remark)
-        self.cart_repo.save(cart)
+        with self.user_lock(user_id):
+            cart = self.get_or_create_cart(user_id)
+            cart.add_item(menu_item, quantity, sweetness, toppings, remark)
+            self.cart_store.save(cart)
         
         return True, "已添加到购物车"
     
     def remove_from_cart(self, user_id: UUID, order_item_id: UUID) -> bool:
-        """从购物车移除商品"""
-        cart = self.cart_repo.find_by_user(user_id)
-        if not cart:
-            return False
-        
-        cart.remove_item(order_item_id)
-        self.cart_repo.save(cart)
+        """从购物车移除商品；移除最后一件后删除购物车"""
+        with self.user_lock(user_id):
+            cart = self.cart_store.find_by_user(user_id)
+            if not cart:
+                return False
+            
+            cart.remove_item(order_item_id)
+            if cart.items:
+                self.cart_store.save(cart)
+            else:
+                self.cart_store.remove(user_id)
         return True
     
     def clear_cart(self, user_id: UUID):
-        """清空购物车"""
-        cart = self.cart_repo.find_by_user(user_id)
-        if cart:
-            cart.clear()
-            self.cart_repo.save(cart)
+        """清空购物车：直接删除，不保留空购物车"""
+        with self.user_lock(user_id):
+            cart = self.cart_store.find_by_user(user_id)
+            if cart:
+                cart.clear()
+                self.cart_store.remove(user_id)
     
     def get_cart(self, user_id: UUID) -> Optional[Cart]:
-        """获取购物车"""
-        return self.cart_repo.find_by_user(user_id)
+        """获取购物车；没有或已过期时返回 None"""
+        return self.cart_store.find_by_user(user_id)
 
 
 class OrderService:
     """订单服务"""
     
-    def __init__(self):
-        self.order_repo = OrderRepository()
-        self.cart_service = CartService()
-        self.reminder_service = ReminderService()
-    
-    def place_order(self, user_id: UUID, remark: str = "") -> Tuple[bool, str, Optional[Order]]:
+    def __init__(self, order_repo: OrderRepository = None,
+                 cart_service: 'CartService' = None,
+                 reminder_service: 'ReminderService' = None,
+                 promotion_service: 'PromotionService' = None,
+                 rollups: SalesRollupStore = None,
+                 archive: OrderArchive = None):
+        self.order_repo = order_repo or OrderRepository()
+        self.cart_service = cart_service or CartService()
+        self.reminder_service = reminder_service or ReminderService()
+        self.promotion_service = promotion_service or PromotionService()
+        self.rollups = rollups or SalesRollupStore()
+        self.archive = archive or OrderArchive()
+        if not self.rollups.exists():
+            orders = self.order_repo.find_all()
+            if orders or len(self.archive):
+                # 汇总包含已归档的订单
+                self.rollups.rebuild(chain(self.archive.iter_orders(), orders))
+        self.idempotency_index = IdempotencyIndex()
+    
+    def place_order(self, user_id: UUID, remark: str = "",
+                    idempotency_key: str = None) -> Tuple[bool, str, Optional[Order]]:
         """
         下单
+        idempotency_key 由客户端为一次结算生成；重复提交（双击、超时重试）
+        同一个键时直接返回首次创建的订单，不会重复下单
         返回: (是否成功, 消息, 订单对象)
         """
-        # 获取购物车
-        cart = self.cart_service.get_cart(user_id)
-        if not cart or not cart.items:
-            return False, "购物车为空", None
-        
-        # 创建订单
-        order = Order(
-            user_id=user_id,
-            status=OrderStatus.PENDING,
-            remark=remark
-        )
-        
-        # 复制购物车项到订单
-        for item in cart.items:
-            order.add_item(item)
-        
-        # 保存订单
-        self.order_repo.save(order)
-        
-        # 清空购物车
-        self.cart_service.clear_cart(user_id)
+        # 持有用户锁，防止复制购物车与清空购物车之间有新商品加入而丢失
+        with self.cart_service.user_lock(user_id):
+            if idempotency_key:
+                order_id = self.idempotency_index.get((user_id, idempotency_key))
+                order = self.order_repo.find_by_id(order_id) if order_id else None
+                if order:
+                    return True, f"下单成功！取餐码：{order.short_code()}", order
+            
+            # 获取购物车
+            cart = self.cart_service.get_cart(user_id)
+            if not cart or not cart.items:
+                return False, "购物车为空", None
+            
+            # 创建订单
+            order = Order(
+                user_id=user_id,
+                status=OrderStatus.PENDING,
+                remark=remark
+            )
+            
+            # 复制购物车项到订单
+            for item in cart.items:
+                order.add_item(item)
+            
+            # 按下单时刻生效的促销计算优惠
+            quote = self.promotion_service.quote(order.items, order.created_at)
+            order.discount = quote.discount
+            order.applied_promotions = list(quote.details)
+            
+            # 保存订单
+            self.order_repo.save(order)
+            self.rollups.record_order(order)
+            if idempotency_key:
+                self.idempotency_index.put((user_id, idempotency_key), order.order_id)
+            
+            # 清空购物车
+            self.cart_service.clear_cart(user_id)
         
         # 发送提醒（模拟）
         self.reminder_service.send_order_confirmation(order)
         
-        return True, f"下单成功！订单号：{str(order.order_id)[:8]}", order
+        return True, f"下单成功！取餐码：{order.short_code()}", order
     
     def list_orders(self, user_id: UUID = None, sort_by_time: bool = True) -> List[Order]:
         """
@@ -278,21 +465,70 @@ class OrderService:
         else:
             return self.order_repo.find_all_sorted_by_time()
     
-    def get_order(self, order_id: UUID) -> Optional[Order]:
-        """获取订单"""
-        return self.order_repo.find_by_id(order_id)
+    def list_order_history(self, user_id: UUID) -> List[Order]:
+        """
+        用户的全部历史订单（含已归档），按下单时间倒序
+        归档段只在这里按需解压；同一订单同时存在于两处时以热数据为准
+        """
+        hot = self.order_repo.find_by_user(user_id)
+        hot_ids = {order.order_id for order in hot}
+        archived = [order for order in self.archive.find_by_user(user_id)
+                    if order.order_id not in hot_ids]
+        return sorted(hot + archived, key=lambda x: x.created_at, reverse=True)
+    
+    def archive_orders(self, days: int = None) -> Tuple[bool, str, int]:
+        """
+        把超过 days 天的已完成、已取消订单移入归档
+        返回: (是否成功, 消息, 归档数量)
+        """
+        if days is not None and days < 0:
+            return False, "天数不能为负", 0
+        older_than = timedelta(days=days) if days is not None else None
+        result = archive_orders(self.order_repo, self.archive, older_than)
+        return True, f"已归档 {result.archived} 个订单", result.archived
+    
+    def get_order(self, order_id: UUID, include_archive: bool = False) -> Optional[Order]:
+        """获取订单；include_archive 为 True 时热数据中找不到会再查归档"""
+        order = self.order_repo.find_by_id(order_id)
+        if order is None and include_archive:
+            order = self.archive.find_by_id(order_id)
+        return order
+    
+    def find_by_code(self, code: str) -> List[Order]:
+        """
+        按取餐口报出的订单码查找
+        优先匹配当天的取餐码，否则按订单号前缀匹配
+        """
+        order = self.order_repo.find_by_pickup_code(code)
+        if order:
+            return [order]
+        return self.order_repo.find_by_id_prefix(code)
     
-    def update_status(self, order_id: UUID, status: OrderStatus) -> Tuple[bool, str]:
+    def update_status(self, order_id: UUID, status: OrderStatus,
+                      expected_version: int = None) -> Tuple[bool, str]:
         """
         更新订单状态
+        expected_version 为界面上显示该订单时的版本号，用于检测并发修改
         返回: (是否成功, 消息)
         """
-        order = self.order_repo.find_by_id(order_id)
-        if not order:
+        current = self.order_repo.find_by_id(order_id)
+        if not current:
             return False, "订单不存在"
         
-        order.status = status
-        self.order_repo.save(order)
+        if expected_version is None:
+            expected_version = current.version
+        order = replace(current, status=status)
+        if current.ready_at is None and status in (OrderStatus.READY, OrderStatus.COMPLETED):
+            order.ready_at = datetime.now()
+        try:
+            self.order_repo.save(order, expected_version)
+        except VersionConflictError as e:
+            return False, str(e)
+        
+        # 取消或撤销取消时更新销售汇总
+        was_cancelled = current.status == OrderStatus.CANCELLED
+        if was_cancelled != (status == OrderStatus.CANCELLED):
+            self.rollups.record_cancellation(order, cancelled=not was_cancelled)
         
         # 如果订单状态变为待取餐，发送提醒
         if status == OrderStatus.READY:
@@ -307,13 +543,59 @@ class OrderService:
     def cancel_order(self, order_id: UUID) -> Tuple[bool, str]:
         """取消订单"""
         return self.update_status(order_id, OrderStatus.CANCELLED)
+    
+    @staticmethod
+    def _sales_row(counters: dict) -> dict:
+        """汇总计数转换为报表行，金额为 Decimal；实收 = 下单金额 - 取消金额"""
+        revenue = counters.get('revenue', 0)
+        cancelled_revenue = counters.get('cancelled_revenue', 0)
+        return {
+            'orders': counters.get('orders', 0),
+            'cancelled': counters.get('cancelled', 0),
+            'revenue': from_cents(revenue),
+            'cancelled_revenue': from_cents(cancelled_revenue),
+            'net_revenue': from_cents(revenue - cancelled_revenue)
+        }
+    
+    def daily_sales(self, start: date = None, end: date = None) -> List[dict]:
+        """按天的销售汇总（含首尾两天），读取物化汇总，耗时只与天数有关"""
+        return [{'date': day, **self._sales_row(counters)}
+                for day, counters in self.rollups.days(start, end)]
+    
+    def hourly_sales(self, start: date = None, end: date = None) -> List[dict]:
+        """按一天中的小时（0-23）合计 [start, end] 范围内的销售"""
+        hours = [{} for _ in range(24)]
+        for _, counters in self.rollups.days(start, end):
+            for hour, values in counters.get('hours', {}).items():
+                target = hours[int(hour)]
+                for key, value in values.items():
+                    target[key] = target.get(key, 0) + value
+        return [{'hour': hour, **self._sales_row(counters)} for hour, counters in enumerate(hours)]
+    
+    def item_sales(self, start: date = None, end: date = None, limit: int = None) -> List[dict]:
+        """
+        商品销售排行（扣除已取消的杯数和金额），按杯数降序
+        返回: [{'item_id', 'name', 'quantity', 'revenue'}]
+        """
+        totals: Dict[str, dict] = {}
+        for _, counters in self.rollups.days(start, end):
+            for item_id, values in counters.get('items', {}).items():
+                entry = totals.setdefault(item_id, {'name': values['name'], 'quantity': 0, 'revenue': 0})
+                entry['name'] = values['name']
+                entry['quantity'] += values.get('quantity', 0) - values.get('cancelled_quantity', 0)
+                entry['revenue'] += values.get('revenue', 0) - values.get('cancelled_revenue', 0)
+        ranked = sorted(((UUID(item_id), entry) for item_id, entry in totals.items()
+                         if entry['quantity'] > 0),
+                        key=lambda pair: (-pair[1]['quantity'], -pair[1]['revenue']))
+        return [{'item_id': item_id, 'name': entry['name'], 'quantity': entry['quantity'],
+                 'revenue': from_cents(entry['revenue'])} for item_id, entry in ranked[:limit]]
 
 
 class ReviewService:
     """评价服务"""
     
-    def __init__(self):
-        self.review_repo = ReviewRepository()
+    def __init__(self, review_repo: ReviewRepository = None):
+        self.review_repo = review_repo or ReviewRepository()
     
     def create_review(self, user_id: UUID, order_id: UUID, rating: int,
                      content: str = "") -> Tuple[bool, str, Optional[Review]]:
@@ -340,17 +622,23 @@ class ReviewService:
             return self.review_repo.find_by_user(user_id)
         return self.review_repo.find_all_sorted()
     
-    def reply_review(self, review_id: UUID, reply_content: str) -> Tuple[bool, str]:
+    def reply_review(self, review_id: UUID, reply_content: str,
+                     expected_version: int = None) -> Tuple[bool, str]:
         """
         回复评价
+        expected_version 为界面上显示该评价时的版本号，用于检测并发回复
         返回: (是否成功, 消息)
         """
         review = self.review_repo.find_by_id(review_id)
         if not review:
             return False, "评价不存在"
         
-        review.reply = reply_content
-        self.review_repo.save(review)
+        if expected_version is None:
+            expected_version = review.version
+        try:
+            self.review_repo.save(replace(review, reply=reply_content), expected_version)
+        except VersionConflictError as e:
+            return False, str(e)
         return True, "回复成功"
     
     def get_review_by_order(self, order_id: UUID) -> Optional[Review]:
@@ -362,21 +650,25 @@ class ReviewService:
 class FavoriteService:
     """收藏服务"""
     
-    def __init__(self):
-        self.favorite_repo = FavoriteRepository()
+    def __init__(self, favorite_repo: FavoriteRepository = None,
+                 item_repo: MenuItemRepository = None):
+        self.favorite_repo = favorite_repo or FavoriteRepository()
+        self.item_repo = item_repo or MenuItemRepository()
+        self.user_lock = KeyedLock()
     
     def add_favorite(self, user_id: UUID, item_id: UUID) -> Tuple[bool, str]:
         """
         添加收藏
         返回: (是否成功, 消息)
         """
-        # 检查是否已收藏
-        existing = self.favorite_repo.find_by_user_and_item(user_id, item_id)
-        if existing:
-            return False, "已经收藏过了"
-        
-        favorite = Favorite(user_id=user_id, item_id=item_id)
-        self.favorite_repo.save(favorite)
+        with self.user_lock(user_id):
+            # 检查是否已收藏
+            existing = self.favorite_repo.find_by_user_and_item(user_id, item_id)
+            if existing:
+                return False, "已经收藏过了"
+            
+            favorite = Favorite(user_id=user_id, item_id=item_id)
+            self.favorite_repo.save(favorite)
         return True, "收藏成功"
     
     def remove_favorite(self, user_id: UUID, item_id: UUID) -> Tuple[bool, str]:
@@ -395,6 +687,15 @@ class FavoriteService:
         """列出用户的所有收藏"""
         return self.favorite_repo.find_by_user(user_id)
     
+    def list_favorite_items(self, user_id: UUID) -> List[FavoriteItem]:
+        """
+        列出用户的收藏及对应的菜单项，菜单项一次批量查出
+        已删除的商品不出现在结果中
+        """
+        favorites = self.favorite_repo.find_by_user(user_id)
+        items = self.item_repo.get_many(fav.item_id for fav in favorites)
+        return [FavoriteItem(fav, items[fav.item_id]) for fav in favorites if fav.item_id in items]
+    
     def is_favorited(self, user_id: UUID, item_id: UUID) -> bool:
         """检查是否已收藏"""
         return self.favorite_repo.find_by_user_and_item(user_id, item_id) is not None
@@ -403,23 +704,56 @@ class FavoriteService:
 class PromotionService:
     """促销服务"""
     
-    def __init__(self):
-        self.promotion_repo = PromotionRepository()
+    def __init__(self, promotion_repo: PromotionRepository = None):
+        self.promotion_repo = promotion_repo or PromotionRepository()
+        self.scheduler = PromotionScheduler(self.promotion_repo)
+        self._engine = PricingEngine()
+        self._engine_source = None
+        self._engine_lock = threading.Lock()
     
     def create_promotion(self, title: str, content: str,
-                        start_at: datetime, end_at: datetime) -> Promotion:
-        """创建促销"""
+                        start_at: datetime, end_at: datetime,
+                        rules: List[PromotionRule] = None) -> Promotion:
+        """创建促销，rules 为计价规则（不传则仅作展示）"""
+        for rule in rules or []:
+            rule.validate()
         promotion = Promotion(
             title=title,
             content=content,
             start_at=start_at,
-            end_at=end_at
+            end_at=end_at,
+            rules=list(rules or [])
         )
-        return self.promotion_repo.save(promotion)
-    
-    def list_active_promotions(self) -> List[Promotion]:
-        """列出所有有效的促销"""
-        return self.promotion_repo.find_active()
+        promotion = self.promotion_repo.save(promotion)
+        self.scheduler.refresh()
+        return promotion
+    
+    def list_active_promotions(self) -> Sequence[Promotion]:
+        """列出当前生效的促销（只读快照）"""
+        return self.scheduler.active()
+    
+    def subscribe(self, callback):
+        """订阅生效促销的变化，回调在调度器线程中执行"""
+        self.scheduler.subscribe(callback)
+    
+    def unsubscribe(self, callback):
+        """取消订阅（窗口关闭时调用）"""
+        self.scheduler.unsubscribe(callback)
+    
+    def pricing_engine(self) -> PricingEngine:
+        """当前生效促销编译出的计价引擎，生效集合变化后才重新编译"""
+        active = self.scheduler.active()
+        if active is self._engine_source:
+            return self._engine
+        with self._engine_lock:
+            if active is not self._engine_source:
+                self._engine = PricingEngine(active)
+                self._engine_source = active
+            return self._engine
+    
+    def quote(self, items: List[OrderItem], at: datetime = None) -> PriceQuote:
+        """按当前生效促销为一组订单项计价"""
+        return self.pricing_engine().price(items, at)
     
     def list_all_promotions(self) -> List[Promotion]:
         """列出所有促销"""
@@ -428,10 +762,12 @@ class PromotionService:
     def update_promotion(self, promotion_id: UUID, title: str = None,
                         content: str = None, is_active: bool = None) -> Optional[Promotion]:
         """更新促销"""
-        promotion = self.promotion_repo.find_by_id(promotion_id)
-        if not promotion:
+        current = self.promotion_repo.find_by_id(promotion_id)
+        if not current:
             return None
         
+        # 在副本上修改，已发布的生效集合中的对象保持不变
+        promotion = replace(current)
         if title is not None:
             promotion.title = title
         if content is not None:
@@ -439,11 +775,15 @@ class PromotionService:
         if is_active is not None:
             promotion.is_active = is_active
         
-        return self.promotion_repo.save(promotion)
+        promotion = self.promotion_repo.save(promotion, current.version)
+        self.scheduler.refresh()
+        return promotion
     
     def delete_promotion(self, promotion_id: UUID) -> bool:
         """删除促销"""
-        return self.promotion_repo.delete(promotion_id)
+        deleted = self.promotion_repo.delete(promotion_id)
+        self.scheduler.refresh()
+        return deleted
 
 
 class ReminderService:
@@ -451,15 +791,15 @@ class ReminderService:
     
     def send_order_confirmation(self, order: Order):
         """发送订单确认（模拟）"""
-        print(f"[提醒] 订单 {str(order.order_id)[:8]} 已确认，总金额：¥{order.total_amount()}")
+        print(f"[提醒] 订单 {order.short_code()} 已确认，总金额：¥{order.total_amount()}")
     
     def send_pickup_reminder(self, order: Order):
         """发送取餐提醒（模拟）"""
-        print(f"[提醒] 订单 {str(order.order_id)[:8]} 已准备好，请来取餐！")
+        print(f"[提醒] 订单 {order.short_code()} 已准备好，请来取餐！")
     
     def invite_review(self, order: Order):
         """邀请评价（模拟）"""
-        print(f"[提醒] 感谢您的光临！欢迎为订单 {str(order.order_id)[:8]} 评价")
+        print(f"[提醒] 感谢您的光临！欢迎为订单 {order.short_code()} 评价")
 
 
 class NotificationGateway:
@@ -0,0 +1,167 @@
+"""
+奶茶点单系统 - 启动快照缓存
+把仓储从 JSON 解码出的实体列表以 pickle（协议 5）缓存在 data/.cache/ 下，
+下次启动时若数据文件未变化则直接反序列化，跳过 JSON 解析和 from_dict。
+缓存以数据文件的大小、修改时间和内容摘要为键，数据文件或模型定义（models.py）
+变化后自动失效并回退到 JSON。缓存与数据文件同样只应由本系统写入
+"""
+
+import gc
+import hashlib
+import operator
+import os
+import pickle
+from contextlib import contextmanager
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Optional, Tuple
+from uuid import UUID
+
+import models
+from models import MenuItem, Topping
+
+# 缓存格式版本，格式变化时递增使旧缓存失效
+CACHE_FORMAT = 1
+
+# 订单行、购物车行中的商品和小料是只读的值快照，相同的快照在缓存中只存一份
+_SNAPSHOT_TYPES = (MenuItem, Topping)
+
+# 加载时取回共享对象：itemgetter(0)((obj,)) -> obj，由 C 实现，无 Python 调用开销
+_first = operator.itemgetter(0)
+
+_schema_digest: Optional[str] = None
+
+
+@contextmanager
+def gc_paused():
+    """
+    批量创建对象期间暂停循环垃圾回收
+    数十万个新容器对象会反复触发分代回收，加载耗时可增加近一倍；退出时恢复原状态
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _digest(raw: bytes) -> str:
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def schema_digest() -> str:
+    """模型定义的摘要：models.py 变化后所有缓存失效"""
+    global _schema_digest  # pylint: disable=global-statement
+    if _schema_digest is None:
+        _schema_digest = _digest(Path(models.__file__).read_bytes())
+    return _schema_digest
+
+
+def read_source(path: Path) -> Tuple[bytes, tuple]:
+    """
+    读取数据文件，返回 (内容, 缓存键)
+    键由同一次打开的文件得到，保证与解析的内容一致
+    """
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        raw = f.read()
+    return raw, (st.st_size, st.st_mtime_ns, _digest(raw))
+
+
+class _InterningPickler(pickle.Pickler):
+    """相等的 UUID、Decimal 和商品/小料快照只写一次，加载后共享同一对象"""
+
+    def __init__(self, file):
+        super().__init__(file, protocol=5)
+        self._canonical = {}
+
+    def reducer_override(self, obj):
+        cls = type(obj)
+        if cls is UUID:
+            key = (cls, obj.int)
+        elif cls is Decimal:
+            # 按字符串区分，保留 1.0 与 1.00 的差别
+            key = (cls, str(obj))
+        elif cls in _SNAPSHOT_TYPES:
+            key = (cls, tuple(obj.to_dict().items()))
+        else:
+            return NotImplemented
+        canonical = self._canonical.setdefault(key, obj)
+        if canonical is obj:
+            return NotImplemented
+        return _first, ((canonical,),)
+
+
+class SnapshotCache:
+    """
+    数据文件的解码结果缓存
+    每个数据文件对应 <缓存目录>/<相对路径>.pickle，文件内先存键、再存实体列表，
+    键不匹配时不必反序列化实体
+    """
+
+    def __init__(self, data_dir: Path, enabled: bool = True):
+        self.data_dir = data_dir
+        self.directory = data_dir / '.cache'
+        self.enabled = enabled
+        # 命中与未命中次数，便于观察启动时的缓存效果
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, source: Path) -> Optional[Path]:
+        """数据文件对应的缓存文件；数据目录以外的文件不缓存，返回 None"""
+        try:
+            relative = Path(source).resolve().relative_to(self.data_dir.resolve())
+        except ValueError:
+            return None
+        return self.directory / (str(relative) + '.pickle')
+
+    def _header(self, key: tuple) -> dict:
+        size, mtime_ns, digest = key
+        return {'format': CACHE_FORMAT, 'schema': schema_digest(),
+                'size': size, 'mtime_ns': mtime_ns, 'digest': digest}
+
+    def load(self, source: Path, key: tuple) -> Optional[Any]:
+        """键匹配时返回缓存的实体，否则返回 None（调用方回退到 JSON）"""
+        path = self.path_for(source) if self.enabled else None
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                if pickle.load(f) != self._header(key):
+                    self.misses += 1
+                    return None
+                with gc_paused():
+                    value = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:  # pylint: disable=broad-except
+            # 损坏或与当前代码不兼容的缓存：回退到 JSON，稍后覆盖
+            print(f"读取缓存失败 {path}: {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def store(self, source: Path, key: tuple, value: Any):
+        """写入缓存；失败只影响下次启动的速度"""
+        path = self.path_for(source) if self.enabled else None
+        if path is None:
+            return
+        tmp_path = path.with_name(path.name + '.tmp')
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(self._header(key), f, protocol=5)
+                _InterningPickler(f).dump(value)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError) as e:
+            print(f"写入缓存失败 {path}: {e}")
+
+    def discard(self, source: Path):
+        """删除数据文件的缓存"""
+        path = self.path_for(source)
+        if path is not None:
+            path.unlink(missing_ok=True)
@@ -0,0 +1,145 @@
+"""
+奶茶点单系统 - 启动耗时基准测试
+在全新的子进程中测量各入口的冷启动耗时，并与预算比较（超出预算时退出码为 1）：
+  - 模块导入：解析 python -X importtime 的输出，列出自身耗时最多的模块，
+    并检查启动器和命令行没有提前导入服务层
+  - 启动器首次绘制：从启动进程到启动器窗口绘制完成，以及后台数据加载耗时（需要图形环境）
+  - 命令行：cli.py --help 的总耗时
+  - 数据加载：AppServices.warm_up() 的耗时（第二次运行可命中启动快照缓存）
+
+用法:
+    python startup_benchmark.py --repeat 5 --top 10
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).parent
+
+# 各入口的导入耗时预算（毫秒，-X importtime 统计的累计耗时）
+IMPORT_BUDGET_MS = {'main': 60, 'cli': 60}
+
+# cli.py --help 的总耗时预算（毫秒，含解释器启动）
+CLI_BUDGET_MS = 100
+
+# 入口在启动阶段不应导入的模块：服务层和数据在后台或执行命令时才加载
+DEFERRED_MODULES = ('services', 'repositories', 'models', 'gui_customer', 'gui_admin')
+
+PAINT_SCRIPT = """
+import json, sys, time
+started = float(sys.argv[1])
+import tkinter as tk
+import main
+root = tk.Tk()
+preloader = main.create_launcher(root)
+root.update()
+painted = time.time()
+deadline = painted + 120
+while not preloader.done.is_set() and time.time() < deadline:
+    root.update()
+    time.sleep(0.005)
+print(json.dumps({'paint': painted - started, 'loaded': time.time() - started,
+                  'preload': preloader.seconds, 'error': str(preloader.error or '')}))
+root.destroy()
+"""
+
+WARM_UP_SCRIPT = """
+import json
+from app_services import AppServices
+from repositories import snapshot_cache
+seconds = AppServices().warm_up()
+print(json.dumps({'seconds': seconds, 'cache_hits': snapshot_cache.hits}))
+"""
+
+
+def import_profile(module: str) -> Tuple[float, List[Tuple[str, float]], List[str]]:
+    """
+    在新进程中以 -X importtime 导入模块
+    返回 (累计耗时毫秒, 按自身耗时排序的 [(模块, 毫秒)], 被提前导入的延迟模块)
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    rows: Dict[str, Tuple[float, float]] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+    ranked = sorted(((name, own) for name, (own, _) in rows.items()), key=lambda r: -r[1])
+    deferred = [name for name in DEFERRED_MODULES if name in rows and name != module]
+    return rows[module][1], ranked, deferred
+
+
+def run_timed(args: List[str]) -> Tuple[float, str]:
+    """运行子进程，返回 (墙钟耗时秒, 标准输出)"""
+    started = time.time()
+    result = subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True)
+    elapsed = time.time() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else
+                           f"退出码 {result.returncode}")
+    return elapsed, result.stdout
+
+
+def main() -> int:
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="奶茶点单系统启动耗时基准测试")
+    parser.add_argument('--repeat', type=int, default=5, help="每项重复次数，取最小值")
+    parser.add_argument('--top', type=int, default=8, help="列出自身导入耗时最多的模块数")
+    parser.add_argument('--skip-data', action='store_true', help="不测量数据加载")
+    args = parser.parse_args()
+    over_budget = []
+
+    for module, budget in IMPORT_BUDGET_MS.items():
+        profiles = [import_profile(module) for _ in range(args.repeat)]
+        cumulative, ranked, deferred = min(profiles, key=lambda p: p[0])
+        print(f"import {module}: {cumulative:.1f} ms（预算 {budget} ms）")
+        for name, own in ranked[:args.top]:
+            print(f"    {own:7.1f} ms  {name}")
+        if cumulative > budget:
+            over_budget.append(f"import {module}")
+        if deferred:
+            print(f"    提前导入了: {', '.join(deferred)}")
+            over_budget.append(f"import {module} 提前导入服务层")
+
+    cli_ms = min(run_timed(['cli.py', '--help'])[0] for _ in range(args.repeat)) * 1000
+    bare_ms = min(run_timed(['-c', 'pass'])[0] for _ in range(args.repeat)) * 1000
+    print(f"cli.py --help: {cli_ms:.0f} ms（预算 {CLI_BUDGET_MS} ms，空解释器 {bare_ms:.0f} ms）")
+    if cli_ms > CLI_BUDGET_MS:
+        over_budget.append("cli.py --help")
+
+    import main as launcher  # pylint: disable=import-outside-toplevel
+    try:
+        runs = [json.loads(run_timed(['-c', PAINT_SCRIPT, repr(time.time())])[1])
+                for _ in range(args.repeat)]
+    except RuntimeError as e:
+        print(f"启动器首次绘制: 跳过（{e}）")
+    else:
+        best = min(runs, key=lambda r: r['paint'])
+        print(f"启动器首次绘制: {best['paint'] * 1000:.0f} ms（预算 {launcher.STARTUP_BUDGET_MS} ms），"
+              f"数据就绪: {best['loaded'] * 1000:.0f} ms（后台加载 {best['preload']:.2f} 秒）")
+        if best['error']:
+            print(f"    后台加载失败: {best['error']}")
+        if best['paint'] * 1000 > launcher.STARTUP_BUDGET_MS:
+            over_budget.append("启动器首次绘制")
+
+    if not args.skip_data:
+        for label in ("首次", "再次"):
+            elapsed, output = run_timed(['-c', WARM_UP_SCRIPT])
+            stats = json.loads(output)
+            print(f"数据加载（{label}）: 服务 {stats['seconds']:.2f} 秒，进程共 {elapsed:.2f} 秒，"
+                  f"快照缓存命中 {stats['cache_hits']} 个文件")
+
+    if over_budget:
+        print(f"超出预算: {'、'.join(over_budget)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())